@@ -0,0 +1,240 @@
+from driftpy.accounts import *
+from driftpy.clearing_house import ClearingHouse as SDKClearingHouse
+from driftpy.clearing_house import ClearingHouse as ClearingHouseSDK
+from driftpy.setup.helpers import get_feed_data, get_set_price_feed_detailed_ix
+from driftpy.math.amm import calculate_price
+from driftpy.constants.numeric_constants import AMM_RESERVE_PRECISION, QUOTE_PRECISION
+from driftpy.types import PositionDirection
+
+from backtest.helpers import adjust_oracle_pretrade
+
+''' the on-chain side of sim.events -- one async function per event (event, *args) which
+runs / builds its instruction(s) with the driftpy sdk. Event.run_sdk looks the event up in
+SDK_ADAPTERS, so this (and anchorpy / solana) is only imported once a backtest needs it
+
+    ix = await event.run_sdk(ch)   # == await SDK_ADAPTERS[event._event_name](event, ch)
+'''
+
+async def deposit_collateral(event, provider, program, usdc_mint, user_keypair, is_initialized):
+    # if not initialized .. initialize ... // mint + deposit ix 
+    user_clearing_house = SDKClearingHouse(program, user_keypair)
+
+    if not is_initialized:
+        await user_clearing_house.intialize_user()
+
+    sig = await user_clearing_house.deposit(event.deposit_amount, 0, user_keypair.public_key)
+    return sig
+
+async def oracle_price(event, program, oracle_program): 
+    market = await get_perp_market_account(
+        program,
+        event.market_index
+    )
+    return await get_set_price_feed_detailed_ix(
+        oracle_program, market.amm.oracle, event.price, event.conf, event.slot
+    )
+
+async def add_liquidity(event, clearing_house: ClearingHouseSDK): 
+    return await clearing_house.get_add_liquidity_ix(
+        event.token_amount, 
+        event.market_index
+    )
+
+    # return await clearing_house.add_liquidity(
+    #     event.token_amount, 
+    #     event.market_index
+    # )
+
+async def remove_liquidity(event, clearing_house: ClearingHouseSDK):
+    if event.lp_token_amount == -1: 
+        user = await get_user_account(clearing_house.program, clearing_house.authority)
+        position = None 
+        for _position in user.perp_positions: 
+            if _position.market_index == event.market_index: 
+                position = _position
+                break 
+        assert position is not None, "user not in market"
+
+        event.lp_token_amount = position.lp_shares
+        if position.lp_shares == 0:
+            return None
+
+        # assert event.lp_token_amount > 0, 'trying to burn full zero tokens'
+
+    ix = await clearing_house.get_remove_liquidity_ix(
+        event.lp_token_amount, 
+        event.market_index
+    )
+    return ix
+
+async def open_position(event, clearing_house: ClearingHouseSDK, init_leverage=None, oracle_program=None, adjust_oracle_pre_trade=False):
+    # tmp -- sim is quote open position v2 is base only
+    market = await get_perp_market_account(clearing_house.program, event.market_index)
+
+    mark_price = calculate_price(
+        market.amm.base_asset_reserve,
+        market.amm.quote_asset_reserve,
+        market.amm.peg_multiplier,
+    )
+    baa = int(event.quote_amount * AMM_RESERVE_PRECISION / QUOTE_PRECISION / mark_price)
+    baa = min(baa, market.amm.base_asset_reserve // 2)
+    if baa == 0: 
+        print('warning: baa too small -> rounding up')
+        baa = market.amm.base_asset_amount_step_size
+    is_ioc = False
+    direction = {
+        "long": PositionDirection.LONG(),
+        "short": PositionDirection.SHORT(),
+    }[event.direction]
+
+    if adjust_oracle_pre_trade: 
+        assert oracle_program is not None
+        await adjust_oracle_pretrade(
+            baa, 
+            direction, 
+            market, 
+            oracle_program
+        )
+
+    if init_leverage:
+        data = await get_feed_data(oracle_program, market.amm.oracle)
+        price = data.price
+        print('get_feed_data oracle price:', price, data)
+        user = await clearing_house.get_user()
+        from driftpy.clearing_house_user import ClearingHouseUser
+        chu = ClearingHouseUser(clearing_house) 
+        collateral = await chu.get_total_collateral()
+
+        pos = None
+        for position in user.perp_positions:
+            # print(position)
+            if position.market_index == event.market_index and (position.base_asset_amount!=0 or position.quote_asset_amount!=0):
+                pos = position
+
+        if pos is not None:
+            if pos.open_orders > 15:
+                return await clearing_house.cancel_orders()
+
+        max_baa = collateral * init_leverage / price
+        # update 
+        baa = int(min(max_baa, baa))
+
+    if baa == 0:
+        print('trying to open position with baa == 0 : early exiting open position')
+        return 
+
+    print(f'opening baa: {baa} {direction} {event.market_index}')
+
+    pchange = 0.99 # 50% change
+    if event.direction == 'long':
+        limit_price = price * (1 + pchange)
+    else: 
+        limit_price = price * (1 - pchange)
+
+    ix = await clearing_house.get_open_position_ix(
+        direction, 
+        baa, 
+        event.market_index, 
+        ioc=is_ioc,
+        limit_price=limit_price,
+    )
+    return ix
+
+async def close_position(event, clearing_house: ClearingHouseSDK, oracle_program=None, adjust_oracle_pre_trade=False):
+    # tmp -- sim is quote open position v2 is base only
+    market = await get_perp_market_account(clearing_house.program, event.market_index)
+    user = await get_user_account(clearing_house.program, clearing_house.authority)
+
+    position = None 
+    for _position in user.perp_positions: 
+        if _position.market_index == event.market_index: 
+            position = _position
+            break 
+    assert position is not None, "user not in market"
+
+    direction = PositionDirection.LONG() if position.base_asset_amount < 0 else PositionDirection.SHORT()
+
+    print(f'closing: {abs(position.base_asset_amount)} {direction}')
+
+    if adjust_oracle_pre_trade: 
+        assert oracle_program is not None
+        await adjust_oracle_pretrade(
+            position.base_asset_amount, 
+            direction, 
+            market, 
+            oracle_program
+        )
+
+    return await clearing_house.get_close_position_ix(event.market_index)
+
+async def settle_lp(event, clearing_house: ClearingHouseSDK):
+    return await clearing_house.get_settle_lp_ix(
+        clearing_house.authority, 
+        event.market_index
+    )
+
+async def settle_pnl(event, clearing_house: ClearingHouseSDK):
+    position = await clearing_house.get_user_position(event.market_index)
+    if position is None or position.base_asset_amount == 0: 
+        return None
+
+    return await clearing_house.get_settle_pnl_ix(
+        clearing_house.authority, 
+        event.market_index
+    )
+
+async def init_if_stake(event, clearing_house: ClearingHouseSDK):
+    return clearing_house.get_initialize_insurance_fund_stake_ix(
+        event.market_index, 
+    )
+
+async def add_if_stake(event, clearing_house: ClearingHouseSDK):
+    return await clearing_house.get_add_insurance_fund_stake_ix(
+        event.market_index, 
+        event.amount
+    )
+
+async def remove_if_stake(event, clearing_house: ClearingHouseSDK):
+    spot = await get_spot_market_account(clearing_house.program, 0)
+    total_shares = spot.insurance_fund.total_shares
+    if_stake = await get_if_stake_account(clearing_house.program, clearing_house.authority, 0)
+    n_shares = if_stake.if_shares
+
+    conn = clearing_house.program.provider.connection
+    vault_pk = get_insurance_fund_vault_public_key(clearing_house.program_id, 0)
+    v_amount = int((await conn.get_token_account_balance(vault_pk))['result']['value']['amount'])
+
+    print(
+        f'vault_amount: {v_amount} n_shares: {n_shares} total_shares: {total_shares}'
+    )
+
+    withdraw_amount = int(v_amount * n_shares / total_shares)
+    if withdraw_amount > 1:
+        withdraw_amount = 0
+
+    if withdraw_amount == 0:
+        print('WARNING: if_stake withdraw amount == 0')
+        return
+
+    ix1 = await clearing_house.get_request_remove_insurance_fund_stake_ix(
+        event.market_index, 
+        withdraw_amount
+    )
+    ix2 = await clearing_house.get_remove_insurance_fund_stake_ix(
+        event.market_index, 
+    )
+    return [ix1, ix2]
+
+SDK_ADAPTERS = {
+    'deposit_collateral': deposit_collateral,
+    'oracle_price': oracle_price,
+    'add_liquidity': add_liquidity,
+    'remove_liquidity': remove_liquidity,
+    'open_position': open_position,
+    'close_position': close_position,
+    'settle_lp': settle_lp,
+    'settle_pnl': settle_pnl,
+    'init_if_stake': init_if_stake,
+    'add_if_stake': add_if_stake,
+    'remove_if_stake': remove_if_stake,
+}
@@ -21,6 +21,7 @@ from driftpy.admin import Admin
 from driftpy.types import OracleSource
 
 from sim.events import * 
+from sim.event_log import EventLog, cached_event_log
 from driftpy.clearing_house import ClearingHouse as SDKClearingHouse
 from driftpy.accounts import get_perp_market_account, get_spot_market_account, get_user_account, get_state_account
 from driftpy.math.amm import calculate_mark_price_amm
@@ -31,6 +32,7 @@ from tqdm import tqdm
 from driftpy.setup.helpers import _create_user_usdc_ata_tx
 from driftpy.clearing_house_user import ClearingHouseUser
 from solana.keypair import Keypair
+from solana.publickey import PublicKey
 
 from termcolor import colored
 from subprocess import Popen
@@ -196,16 +198,16 @@ async def run_trial(
     # process events 
     for i in tqdm(range(len(events))):
         sys.stdout.flush()
-        event = events.iloc[i]
+        event_name = events.name(i)
         ix_args = None
         ch = None
 
         ix: TransactionInstruction
-        if event.event_name == DepositCollateralEvent._event_name:
+        if event_name == DepositCollateralEvent._event_name:
             continue
 
-        elif event.event_name == OpenPositionEvent._event_name: 
-            event = Event.deserialize_from_row(OpenPositionEvent, event)
+        elif event_name == OpenPositionEvent._event_name: 
+            event = events.event(i)
             assert event.user_index in user_chs, 'user doesnt exist'
 
             ch: SDKClearingHouse = user_chs[event.user_index]
@@ -214,8 +216,8 @@ async def run_trial(
             ix_args = place_and_take_ix_args(ix[1])
             print(f'=> {event.user_index} opening position...')
 
-        elif event.event_name == ClosePositionEvent._event_name: 
-            event = Event.deserialize_from_row(ClosePositionEvent, event)
+        elif event_name == ClosePositionEvent._event_name: 
+            event = events.event(i)
             assert event.user_index in user_chs, 'user doesnt exist'
 
             ch: SDKClearingHouse = user_chs[event.user_index]
@@ -224,8 +226,8 @@ async def run_trial(
             ix_args = place_and_take_ix_args(ix[1])
             print(f'=> {event.user_index} closing position...')
 
-        elif event.event_name == addLiquidityEvent._event_name: 
-            event = Event.deserialize_from_row(addLiquidityEvent, event)
+        elif event_name == addLiquidityEvent._event_name: 
+            event = events.event(i)
             print(f'=> {event.user_index} adding liquidity: {event.token_amount}...')
             assert event.user_index in user_chs, 'user doesnt exist'
 
@@ -233,8 +235,8 @@ async def run_trial(
             ix = await event.run_sdk(ch)
             ix_args = add_liquidity_ix_args(ix)
             
-        elif event.event_name == removeLiquidityEvent._event_name:
-            event = Event.deserialize_from_row(removeLiquidityEvent, event)
+        elif event_name == removeLiquidityEvent._event_name:
+            event = events.event(i)
             assert event.user_index in user_chs, 'user doesnt exist'
             event.lp_token_amount = -1
 
@@ -244,23 +246,23 @@ async def run_trial(
             ix_args = remove_liquidity_ix_args(ix)
             print(f'=> {event.user_index} removing liquidity...')
 
-        elif event.event_name == SettlePnLEvent._event_name:
-            event = Event.deserialize_from_row(SettlePnLEvent, event)
+        elif event_name == SettlePnLEvent._event_name:
+            event = events.event(i)
             ch: SDKClearingHouse = user_chs[event.user_index]
             ix = await event.run_sdk(ch)
             if ix is None: continue
             ix_args = settle_pnl_ix_args(ix[1])
             print(f'=> {event.user_index} settle pnl...')
 
-        elif event.event_name == SettleLPEvent._event_name: 
-            event = Event.deserialize_from_row(SettleLPEvent, event)
+        elif event_name == SettleLPEvent._event_name: 
+            event = events.event(i)
             print(f'=> {event.user_index} settle lp...')
             ch: SDKClearingHouse = user_chs[event.user_index]
             ix = await event.run_sdk(ch)
             ix_args = settle_lp_ix_args(ix)
         
-        elif event.event_name == oraclePriceEvent._event_name: 
-            event = Event.deserialize_from_row(oraclePriceEvent, event)
+        elif event_name == oraclePriceEvent._event_name: 
+            event = events.event(i)
             event.slot = (await provider.connection.get_slot())['result']
             print(f'=> adjusting oracle: {colored(event.price, "red")}')
             ix = await event.run_sdk(program, oracle_program)
@@ -281,32 +283,32 @@ async def run_trial(
             # ix = [ix1, ix2]
             # ch = admin_clearing_house
 
-        elif event.event_name == 'liquidate':
+        elif event_name == 'liquidate':
             print('=> liquidating...')
             await liquidator.liquidate_loop()
             continue
 
-        elif event.event_name == InitIfStakeEvent._event_name:
-            event = Event.deserialize_from_row(InitIfStakeEvent, event)
+        elif event_name == InitIfStakeEvent._event_name:
+            event = events.event(i)
             ch: SDKClearingHouse = user_chs[event.user_index]
             ix = await event.run_sdk(ch)
             ix_args = {'spot_market_index': event.market_index}
 
-        elif event.event_name == AddIfStakeEvent._event_name:
-            event = Event.deserialize_from_row(AddIfStakeEvent, event)
+        elif event_name == AddIfStakeEvent._event_name:
+            event = events.event(i)
             ch: SDKClearingHouse = user_chs[event.user_index]
             ix = await event.run_sdk(ch)
             ix_args = {'spot_market_index': event.market_index, 'amount': event.amount}
         
-        elif event.event_name == RemoveIfStakeEvent._event_name:
-            event = Event.deserialize_from_row(RemoveIfStakeEvent, event)
+        elif event_name == RemoveIfStakeEvent._event_name:
+            event = events.event(i)
             ch: SDKClearingHouse = user_chs[event.user_index]
             ix = await event.run_sdk(ch)
             if ix is None: 
                 continue
             ix_args = {'spot_market_index': event.market_index, 'amount': event.amount}
 
-        elif event.event_name == NullEvent._event_name: 
+        elif event_name == NullEvent._event_name: 
             continue
         else:
             raise NotImplementedError
@@ -598,7 +600,8 @@ async def run_trial(
 
 
 async def main(protocol_path, experiments_folder, geyser_path, trial):
-    events = pd.read_csv(f"{experiments_folder}/events.csv")
+    # typed event log (converted from events.csv -- again whenever the csv changes)
+    events = cached_event_log(f"{experiments_folder}/events.csv", f"{experiments_folder}/event_log")
 
     no_oracle_guard_rails = OracleGuardRails(
         price_divergence=PriceDivergenceGuardRails(1, 1), 
@@ -18,6 +18,7 @@ from driftpy.admin import Admin
 from driftpy.types import OracleSource
 
 from sim.events import * 
+from sim.event_log import EventLog
 from driftpy.clearing_house import ClearingHouse as SDKClearingHouse
 from driftpy.math.amm import calculate_mark_price_amm
 from driftpy.clearing_house_user import ClearingHouseUser
@@ -129,7 +130,7 @@ def create_workspace(
 
 
 async def setup_usdc_deposits(
-    events: pd.DataFrame, 
+    events: EventLog, 
     program: Program, 
     usdc_mint: Keypair, 
     users: list, 
@@ -142,12 +143,11 @@ async def setup_usdc_deposits(
     # deposit all at once for speed 
     deposit_amounts = {}
     mint_amounts = {}
-    for i in tqdm(range(len(events))):
-        event = events.iloc[i]
-        if event.event_name == DepositCollateralEvent._event_name:
-            event = Event.deserialize_from_row(DepositCollateralEvent, event)
-            deposit_amounts[event.user_index] = deposit_amounts.get(event.user_index, 0) + event.deposit_amount
-            mint_amounts[event.user_index] = mint_amounts.get(event.user_index, 0) + event.mint_amount
+    # (decoded events -- exact python ints whatever kind the amounts were logged as)
+    for i in events.positions_of_type(DepositCollateralEvent._event_name):
+        event = events.event(i)
+        deposit_amounts[event.user_index] = deposit_amounts.get(event.user_index, 0) + event.deposit_amount
+        mint_amounts[event.user_index] = mint_amounts.get(event.user_index, 0) + event.mint_amount
 
     # dont let the liquidator get liq'd 
     deposit_amounts[liquidator_index] = 100_000_000 * QUOTE_PRECISION
@@ -250,8 +250,7 @@ async def airdrop_sol_users(provider, events, user_path):
     """
 
     print('=> airdropping sol to users...')
-    user_indexs = np.unique([json.loads(e['parameters'])['user_index'] for _, e in events.iterrows() if 'user_index' in json.loads(e['parameters'])])
-    user_indexs = list(np.sort(user_indexs))
+    user_indexs = [int(user_index) for user_index in events.user_indexs()] # sorted
 
     liquidator_index = len(user_indexs)
     user_indexs.append(liquidator_index) # liquidator
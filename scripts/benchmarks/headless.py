@@ -0,0 +1,95 @@
+## compares a normal vs headless (ClearingHouse(headless=True)) run of the
+## same scenario -- same core accounting, less debug bookkeeping
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+
+import time
+import argparse
+import numpy as np
+
+from driftpy.constants.numeric_constants import *
+
+from sim.rng import spawn_rngs
+from sim.helpers import *
+from sim.agents import *
+from sim.driftsim.clearing_house.state import *
+from sim.driftsim.clearing_house.lib import *
+
+def setup_ch(n_steps, headless, rng=None):
+    prices, timestamps = rand_heterosk_oracle(90, n_steps=n_steps, rng=rng)
+    oracle = Oracle(prices=prices, timestamps=timestamps)
+    amm = SimulationAMM(
+        oracle=oracle,
+        base_asset_reserve=367_621 * AMM_RESERVE_PRECISION,
+        quote_asset_reserve=367_621 * AMM_RESERVE_PRECISION,
+        funding_period=60,
+        peg_multiplier=int(oracle.get_price(0)*PEG_PRECISION),
+    )
+    market = SimulationMarket(amm=amm, market_index=0)
+    fee_structure = FeeStructure(numerator=1, denominator=1000)
+    return ClearingHouse([market], fee_structure, headless=headless)
+
+def setup_agents(ch, n_traders, n_lps, rngs):
+    max_t = len(ch.markets[0].amm.oracle)
+    agents = []
+    for user_idx, rng in zip(range(n_traders + n_lps), rngs):
+        if user_idx < n_traders:
+            agents.append(OpenClose.random_init(max_t, user_idx, 0, short_bias=0.5, rng=rng))
+        else:
+            agents.append(AddRemoveLiquidity.random_init(max_t, user_idx, 0, min_token_amount=100000, rng=rng))
+            agents.append(SettleLP.random_init(max_t, user_idx, 0, rng=rng))
+        agents.append(SettlePnL.random_init(max_t, user_idx, 0, rng=rng))
+    return agents
+
+def run(seed, headless, n_steps, n_traders, n_lps, snapshot):
+    # the same streams (oracle + one per user) for the normal + headless runs
+    oracle_rng, *rngs = spawn_rngs(seed, 1 + n_traders + n_lps)
+    ch = setup_ch(n_steps, headless, rng=oracle_rng)
+    agents = setup_agents(ch, n_traders, n_lps, rngs)
+
+    start = time.perf_counter()
+    for agent in agents:
+        for event in agent.setup(ch):
+            ch = event.run(ch, verbose=False)
+        ch = ch.change_time(1)
+
+    end = len(ch.markets[0].amm.oracle)
+    n_events = 0
+    while ch.time < end:
+        for agent in agents:
+            for event in agent.run(ch):
+                if event._event_name == 'null':
+                    continue
+                ch = event.run(ch)
+                n_events += 1
+                if snapshot:
+                    ch.to_json()
+        ch = ch.change_time(1)
+
+    elapsed = time.perf_counter() - start
+    collateral = {i: user.collateral for i, user in ch.users.items()}
+
+    return elapsed, n_events, collateral
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-steps', type=int, default=500)
+    parser.add_argument('--n-traders', type=int, default=20)
+    parser.add_argument('--n-lps', type=int, default=5)
+    parser.add_argument('--no-snapshot', action='store_true', help='dont serialize the clearing house after every event')
+    args = parser.parse_args()
+
+    results = {}
+    for headless in [False, True]:
+        results[headless] = run(args.seed, headless, args.n_steps, args.n_traders, args.n_lps, not args.no_snapshot)
+        elapsed, n_events, _ = results[headless]
+        print(f'headless={headless}: {elapsed:.2f}s ({n_events} events)')
+
+    assert results[False][2] == results[True][2], 'headless changed the core accounting'
+    print(f'speedup: {results[False][0] / results[True][0]:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+## micro-benchmarks of the ClearingHouse hot operations across users / markets / oracle lengths
+## (test.py's default_set_up fixture scaled up) -- results are json (stdout or --out) so branches
+## can be compared, progress goes to stderr
+##
+## python micro.py --out ../../experiments/benchmarks/micro.json
+## python micro.py --quick --compare ../../experiments/benchmarks/micro.json
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+
+import os
+import copy
+import json
+import time
+import platform
+import argparse
+import datetime
+import subprocess
+import contextlib
+import numpy as np
+
+from driftpy.types import PositionDirection, FeeStructure
+from driftpy.constants.numeric_constants import *
+
+from sim.driftsim.clearing_house.state import *
+from sim.driftsim.clearing_house.lib import ClearingHouse
+
+SCALES = dict(
+    users=[10, 100, 1_000, 10_000],
+    markets=[1, 10, 50],
+    oracle_lengths=[100, 10_000, 1_000_000],
+)
+QUICK_SCALES = dict(
+    users=[10, 100],
+    markets=[1, 5],
+    oracle_lengths=[100, 10_000],
+)
+# the other dimensions while one is swept
+BASE_SCALE = dict(n_users=10, n_markets=1, oracle_length=100)
+
+def make_clearing_house(n_users, n_markets, oracle_length, headless=False, default_collateral=10_000, bq_ar=1e6):
+    ''' default_set_up at scale: n_markets of its market ($.5 oracle, $1 mark, 60s funding)
+    and n_users users with default_collateral each '''
+    funding_period = 60
+    markets = []
+    for market_index in range(n_markets):
+        oracle = Oracle(prices=np.full(oracle_length, .5), timestamps=np.arange(oracle_length))
+        amm = SimulationAMM(
+            oracle=oracle,
+            base_asset_reserve=int(bq_ar) * AMM_RESERVE_PRECISION,
+            quote_asset_reserve=int(bq_ar) * AMM_RESERVE_PRECISION,
+            peg_multiplier=1 * PEG_PRECISION,
+            funding_period=funding_period,
+        )
+        markets.append(SimulationMarket(amm=amm, market_index=market_index))
+
+    fee_structure = FeeStructure(numerator=1, denominator=100)
+    ch = ClearingHouse(markets, fee_structure, headless=headless)
+    for user_index in range(n_users):
+        ch = ch.deposit_user_collateral(user_index, default_collateral * QUOTE_PRECISION)
+    return ch
+
+def open_position(ch, direction, quote_amount, user_index=0):
+    direction = {'long': PositionDirection.LONG, 'short': PositionDirection.SHORT}[direction]
+    return ch.open_position(direction, user_index, quote_amount * QUOTE_PRECISION, 0)
+
+def add_lp(ch, user_index=1):
+    ch = ch.add_liquidity(0, user_index, 1e5 * QUOTE_PRECISION)
+    # some trades so the lp has something to settle
+    ch = open_position(ch, 'long', 100)
+    ch = ch.change_time(1)
+    return open_position(ch, 'short', 50)
+
+def with_funding_due(ch):
+    ch = open_position(ch, 'long', 100)
+    return ch.change_time(ch.markets[0].amm.funding_period)
+
+# name -> (prepare the state once (untimed), the timed operation on a fresh copy of it)
+OPERATIONS = {
+    'open_position/increase': (lambda ch: open_position(ch, 'long', 100), lambda ch: open_position(ch, 'long', 100)),
+    'open_position/reduce': (lambda ch: open_position(ch, 'long', 100), lambda ch: open_position(ch, 'short', 50)),
+    'open_position/flip': (lambda ch: open_position(ch, 'long', 100), lambda ch: open_position(ch, 'short', 200)),
+    # 100x the collateral -> fails the margin requirement and reverts
+    'open_position/revert': (lambda ch: ch, lambda ch: open_position(ch, 'long', 1_000_000)),
+    'close_position': (lambda ch: open_position(ch, 'long', 100), lambda ch: ch.close_position(0, 0)),
+    'add_liquidity': (lambda ch: ch, lambda ch: ch.add_liquidity(0, 1, 1e5 * QUOTE_PRECISION)),
+    'remove_liquidity': (add_lp, lambda ch: ch.remove_liquidity(0, 1)),
+    'settle_lp': (add_lp, lambda ch: ch.settle_lp(0, 1)),
+    'update_funding_rate': (with_funding_due, lambda ch: ch.update_funding_rate(0)),
+    'to_json': (lambda ch: ch, lambda ch: ch.to_json()),
+    'deepcopy': (lambda ch: ch, lambda ch: copy.deepcopy(ch)),
+}
+
+def measure(ch, run, repeat, number):
+    ''' seconds per call of run (each call on its own copy of ch, copies arent timed) '''
+    times = []
+    for _ in range(repeat):
+        states = [copy.deepcopy(ch) for _ in range(number)]
+        start = time.perf_counter()
+        for state in states:
+            run(state)
+        times.append((time.perf_counter() - start) / number)
+    return dict(
+        min=min(times),
+        median=float(np.median(times)),
+        mean=float(np.mean(times)),
+    )
+
+def cases(scales):
+    ''' one sweep per dimension (the others at BASE_SCALE) '''
+    for key, values in [('n_users', scales['users']), ('n_markets', scales['markets']), ('oracle_length', scales['oracle_lengths'])]:
+        for value in values:
+            yield key, BASE_SCALE | {key: value}
+
+def run_benchmarks(scales, operations, repeat=3, number=5, headless=False):
+    results = []
+    for sweep, scale in cases(scales):
+        base = make_clearing_house(**scale, headless=headless)
+        for name in operations:
+            prepare, run = OPERATIONS[name]
+            # (not headless prints warnings eg for the margin revert)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                ch = prepare(copy.deepcopy(base))
+                timing = measure(ch, run, repeat, number)
+            results.append(dict(operation=name, sweep=sweep, **scale, repeat=repeat, number=number, **timing))
+            print(f"{name:<24} users={scale['n_users']:<6} markets={scale['n_markets']:<3} oracle={scale['oracle_length']:<8} {timing['min'] * 1e3:10.3f}ms", file=sys.stderr)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_key(result):
+    return (result['operation'], result['sweep'], result['n_users'], result['n_markets'], result['oracle_length'])
+
+def compare(results, baseline, threshold):
+    ''' cases which got slower than the baseline by more than threshold (by min time) '''
+    baseline = {case_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None:
+            continue
+        ratio = result['min'] / old['min']
+        if ratio > 1 + threshold:
+            regressions.append(dict(operation=result['operation'], n_users=result['n_users'], n_markets=result['n_markets'], oracle_length=result['oracle_length'], ratio=ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true', help='small scales only')
+    parser.add_argument('--operations', type=str, nargs='+', default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument('--users', type=int, nargs='+', default=None)
+    parser.add_argument('--markets', type=int, nargs='+', default=None)
+    parser.add_argument('--oracle-lengths', type=int, nargs='+', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--number', type=int, default=5, help='calls per repeat')
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--out', type=str, default=None, help='write the results json here')
+    parser.add_argument('--compare', type=str, default=None, help='results json to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='flag cases slower than the baseline by this fraction')
+    args = parser.parse_args()
+
+    scales = dict(QUICK_SCALES if args.quick else SCALES)
+    for key in scales:
+        if getattr(args, key) is not None:
+            scales[key] = getattr(args, key)
+
+    results = run_benchmarks(scales, args.operations, args.repeat, args.number, args.headless)
+    output = dict(
+        meta=dict(
+            git_revision=git_revision(),
+            date=datetime.datetime.now().isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            headless=args.headless,
+            scales=scales,
+        ),
+        results=results,
+    )
+
+    if args.out is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=1)
+    else:
+        print(json.dumps(output, indent=1))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['operation']} users={r['n_users']} markets={r['n_markets']} oracle={r['oracle_length']}: {r['ratio']:.2f}x slower")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
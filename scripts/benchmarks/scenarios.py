@@ -0,0 +1,230 @@
+## end-to-end benchmark of whole scenarios -- the workspace generators (simple, luna_crash,
+## three_markets, uponly) with fixed seeds and replays of experiments/init/*/events.csv
+##
+## every scenario runs in its own fresh process and records the wall time of each phase
+## (import, setup, run, serialization), events / second and the peak rss after each phase.
+## results are appended to a history file (one json line per benchmark run) and compared
+## with the previous runs there -- slower / bigger than their median by more than the
+## threshold is flagged as a regression
+##
+## python scenarios.py
+## python scenarios.py --scenarios simple replay:lunaCrash --threshold 0.1 --fail-on-regression
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../workspace/')
+
+import os
+import json
+import time
+import platform
+import argparse
+import datetime
+import resource
+import tempfile
+import importlib
+import contextlib
+import subprocess
+import multiprocessing
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+GENERATORS = ['simple', 'luna_crash', 'three_markets', 'uponly']
+INIT_PATH = Path('../../experiments/init')
+HISTORY_PATH = Path('../../experiments/benchmarks/scenarios_history.jsonl')
+PHASES = ['import', 'setup', 'run', 'serialization']
+
+def replay_scenarios(init_path=INIT_PATH) -> list[str]:
+    ''' replay:{trial} for every trial with an events.csv + markets_json.csv '''
+    return sorted(
+        f'replay:{trial.name}' for trial in init_path.glob('*')
+        if (trial/'events.csv').exists() and (trial/'markets_json.csv').exists()
+    )
+
+def peak_rss_mb() -> float:
+    ''' peak resident memory of this process so far (ru_maxrss is kb on linux, bytes on macos) '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+@contextlib.contextmanager
+def phase(phases: dict, name: str):
+    start = time.perf_counter()
+    yield
+    phases[name] = dict(wall=time.perf_counter() - start, peak_rss_mb=peak_rss_mb())
+
+def run_generator(scenario, seed, headless=False, event_driven=False) -> dict:
+    ''' worker: build + run + save a workspace scenario like run_trial (into a tmp folder) '''
+    phases = {}
+    with phase(phases, 'import'):
+        from helpers import run_agents, save_trial
+        from sim.writer import StreamingCSVWriter
+        module = importlib.import_module(scenario)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        with phase(phases, 'setup'):
+            ch, agents = module.build(seed)
+            ch.headless = headless
+
+        # (the chs.csv rows are streamed during the run like in run_trial)
+        writer = StreamingCSVWriter(path/'chs.csv')
+        with phase(phases, 'run'):
+            _, _, events, _ = run_agents(agents, ch, event_driven, progress=False, writer=writer)
+
+        with phase(phases, 'serialization'):
+            save_trial(path, events, writer)
+
+    n_events = sum([e._event_name != 'null' for e in events])
+    return dict(n_events=n_events, phases=phases)
+
+def run_replay(trial, headless=False) -> dict:
+    ''' worker: replay an events.csv through the ClearingHouse (see sim.replay) '''
+    phases = {}
+    with phase(phases, 'import'):
+        import pandas as pd
+        from sim.replay import load_events, clearing_house_from_json, replay
+        from sim.events import serialize_events
+        from sim.writer import StreamingCSVWriter
+
+    trial = INIT_PATH/trial
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        with phase(phases, 'setup'):
+            events = load_events(trial/'events.csv')
+            ch = clearing_house_from_json(trial/'markets_json.csv', events)
+            ch.headless = headless
+
+        with phase(phases, 'run'):
+            result = replay(events, ch, writer=StreamingCSVWriter(path/'chs.csv'))
+
+        with phase(phases, 'serialization'):
+            pd.DataFrame(serialize_events(events)).to_csv(path/'events.csv', index=False)
+
+    return dict(n_events=result['n_events'], phases=phases)
+
+def run_scenario(scenario, seed, headless=False, event_driven=False) -> dict:
+    ''' worker entry (quiet): one scenario -> its timings '''
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if scenario.startswith('replay:'):
+            result = run_replay(scenario.split(':', 1)[1], headless)
+        else:
+            result = run_generator(scenario, seed, headless, event_driven)
+
+    phases = result['phases']
+    return dict(
+        scenario=scenario,
+        seed=None if scenario.startswith('replay:') else seed,
+        n_events=int(result['n_events']),
+        events_per_second=result['n_events'] / max(phases['run']['wall'], 1e-9),
+        wall=sum([p['wall'] for p in phases.values()]),
+        peak_rss_mb=max([p['peak_rss_mb'] for p in phases.values()]),
+        phases=phases,
+    )
+
+def benchmark(scenarios, seed=0, repeat=1, headless=False, event_driven=False) -> list[dict]:
+    ''' each run in a new (spawned) process so the peak rss is the scenario's own --
+    with repeat > 1 the fastest run (by run phase) is kept '''
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for scenario in scenarios:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_scenario, scenario, seed, headless, event_driven).result())
+        best = min(runs, key=lambda r: r['phases']['run']['wall'])
+        print(
+            f"{scenario:<28} {best['n_events']:>8} events  {best['events_per_second']:>10.0f} events/s  "
+            + '  '.join(f"{name}={best['phases'][name]['wall']:.2f}s" for name in PHASES)
+            + f"  peak_rss={best['peak_rss_mb']:.0f}mb"
+        )
+        results.append(best)
+    return results
+
+def load_history(path) -> list[dict]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip() != '']
+
+def append_history(path, entry: dict):
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+# (metric, higher is worse)
+METRICS = [('events_per_second', False), ('wall', True), ('peak_rss_mb', True)]
+
+def find_regressions(results, history, threshold=0.2, memory_threshold=0.2, window=5) -> list[dict]:
+    ''' results vs the median of the scenario's last window runs in history (same seed / settings) '''
+    regressions = []
+    for result in results:
+        previous = [
+            r for entry in history for r in entry['results']
+            if r['scenario'] == result['scenario'] and r['seed'] == result['seed']
+        ][-window:]
+        if len(previous) == 0:
+            continue
+
+        for metric, higher_is_worse in METRICS:
+            baseline = float(np.median([r[metric] for r in previous]))
+            if baseline <= 0:
+                continue
+            change = result[metric] / baseline - 1
+            if not higher_is_worse:
+                change = baseline / max(result[metric], 1e-9) - 1
+            limit = memory_threshold if metric == 'peak_rss_mb' else threshold
+            if change > limit:
+                regressions.append(dict(scenario=result['scenario'], metric=metric, value=result[metric], baseline=baseline, change=change))
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', type=str, nargs='+', default=None, help='generators and/or replay:{trial} (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--history', type=str, default=str(HISTORY_PATH))
+    parser.add_argument('--no-history', action='store_true', help='dont append this run to the history')
+    parser.add_argument('--threshold', type=float, default=0.2, help='flag events/s or wall time worse than the history by this fraction')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='flag a peak rss above the history by this fraction')
+    parser.add_argument('--window', type=int, default=5, help='compare with the median of this many previous runs')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios if args.scenarios is not None else GENERATORS + replay_scenarios()
+    results = benchmark(scenarios, args.seed, args.repeat, args.headless, args.event_driven)
+
+    # only compare like with like
+    settings = dict(headless=args.headless, event_driven=args.event_driven)
+    history = [entry for entry in load_history(args.history) if entry['settings'] == settings]
+    regressions = find_regressions(results, history, args.threshold, args.memory_threshold, args.window)
+    for r in regressions:
+        print(f"REGRESSION {r['scenario']} {r['metric']}: {r['value']:.2f} vs {r['baseline']:.2f} ({r['change'] * 100:+.0f}%)")
+
+    if not args.no_history:
+        append_history(args.history, dict(
+            git_revision=git_revision(),
+            date=datetime.datetime.now().isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            settings=settings,
+            results=results,
+            regressions=regressions,
+        ))
+
+    if args.fail_on_regression and len(regressions) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
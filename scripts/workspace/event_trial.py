@@ -1,5 +1,4 @@
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 sys.path.insert(0, '../../driftpy/src/')
@@ -84,4 +83,6 @@ def main():
     run_trial_events(events, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
@@ -1,6 +1,5 @@
 
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 sys.path.insert(0, '../../driftpy/src/')
@@ -27,9 +26,19 @@ from sim.driftsim.clearing_house.math.pnl import *
 from sim.driftsim.clearing_house.math.amm import *
 from sim.driftsim.clearing_house.state import *
 from sim.driftsim.clearing_house.lib import *
+from sim.driftsim.clearing_house.layout import SnapshotLayout
 
 from sim.events import * 
 from sim.agents import * 
+from sim.scheduler import AgentScheduler
+from sim.cache import ResultCache, trial_key, ARTIFACTS, COLUMNAR_ARTIFACTS
+from sim.checkpoint import Checkpointer, load_checkpoint
+from sim.sampling import SamplingPolicy, snapshot_of
+from sim.observers import Observer, observe
+from sim.writer import StreamingCSVWriter
+from sim.columnar import ColumnarWriter
+from sim.event_log import write_event_log
+from sim.memory import MemoryProfiler
 from pathlib import Path
 
 def run_trial_events(events, ch, path: Path):
@@ -40,43 +49,77 @@ def run_trial_events(events, ch, path: Path):
     with open(path/'markets_json.csv', 'w') as f:
         json.dump(json_markets, f)
 
-    clearing_houses = []
+    # stream the clearing house rows to chs.csv as we go
+    writer = StreamingCSVWriter(path/'chs.csv')
     for e in tqdm(events):
         ch = ch.change_time(e.timestamp)
         ch = e.run(ch)
 
-        clearing_houses.append(copy.deepcopy(ch))
+        writer.append_ch(ch)
 
     print('number of events:', len(events))
 
     # save trial results 
-    json_events = [e.serialize_to_row() for e in events if e._event_name != 'null']
-    df = pd.DataFrame(json_events)
+    df = pd.DataFrame(serialize_events(events))
     df.to_csv(path/'events.csv', index=False)
 
-    json_chs = [e.to_json() for e in clearing_houses]
-    df = pd.DataFrame(json_chs)
-    df.to_csv(path/'chs.csv', index=False)
-
-
-def run_trial(agents, ch, path):
-    path.mkdir(exist_ok=True, parents=True)
-
+    writer.close()
+
+
+def run_agents(agents, ch, event_driven=False, snapshot=True, progress=True, checkpointer: Checkpointer = None, resume: dict = None, writer: StreamingCSVWriter = None, sampling: SamplingPolicy = None, observers: list[Observer] = None, observe_every='event', memory_profiler: MemoryProfiler = None):
+    ''' runs the agents until the end of the oracle and closes everyone out 
+
+    event_driven: jump straight to the next timestamp where an agent wakes up 
+    (see Agent.next_wakeup + AgentScheduler) instead of polling every agent every second 
+    snapshot: keep a copy of the clearing house after every event (for chs.csv) 
+    checkpointer: periodically save the full loop state (see sim.checkpoint) 
+    resume: a loaded checkpoint to continue from (agents/ch are then ignored) 
+    writer: stream the snapshot rows (ch.to_json()) there instead of keeping the 
+    clearing houses in memory (clearing_houses is then empty) 
+    sampling: which events get a snapshot (see sim.sampling, default = all of them) 
+    observers: online reducers fed the live clearing house after every event 
+    (observe_every='timestep': after every timestep) -- see sim.observers 
+    memory_profiler: periodically attribute the traced memory per component (see sim.memory) 
+    
+    returns the final clearing house, the closed out clearing house, events, clearing_houses '''
+    if resume is not None:
+        ch, agents, scheduler = resume['ch'], resume['agents'], resume['scheduler']
+        events, clearing_houses = resume['history']['events'], resume['history']['clearing_houses']
+        last_oracle_price, settle_tracker = resume['last_oracle_price'], resume['settle_tracker']
+        event_driven, snapshot = resume['event_driven'], resume['snapshot']
+        writer, sampling = resume.get('writer'), resume.get('sampling')
+        observers, observe_every = resume.get('observers'), resume.get('observe_every', 'event')
+    
     n_markets = len(ch.markets)
     max_t = [len(market.amm.oracle) for market in ch.markets]
 
-    ## save the initial markets!
-    json_markets = [m.to_json(0) for m in ch.markets]
-    with open(path/'markets_json.csv', 'w') as f:
-        json.dump(json_markets, f)
-
-    print('#agents:', len(agents))
+    if resume is None:
+        events = []
+        clearing_houses = []
+        last_oracle_price = [-1] * n_markets
+    if memory_profiler is not None:
+        memory_profiler.start()
+
+    def record(ch, event, event_index=None):
+        ''' event_index: the event's index in events (default = the last one) -- only 
+        written with a sampling policy (the snapshots dont line up with the events then) '''
+        if memory_profiler is not None:
+            memory_profiler.maybe_sample(events, clearing_houses, ch)
+        if observers is not None and observe_every == 'event':
+            observe(observers, ch, event)
+        if not snapshot:
+            return
+        if sampling is not None and not sampling.sample(event, ch):
+            return
+        if sampling is None:
+            event_index = None
+        elif event_index is None:
+            event_index = len(events) - 1
+        if writer is not None:
+            writer.append_ch(ch, event_index)
+        else:
+            clearing_houses.append(snapshot_of(ch, event_index))
 
-    events = []
-    clearing_houses = []
-    differences = []
-
-    last_oracle_price = [-1] * n_markets
     def adjust_oracle_price():
         # adjust oracle pre events
         for market in ch.markets:
@@ -89,33 +132,53 @@ def run_trial(agents, ch, path):
                     oraclePriceEvent(ch.time, market.market_index, oracle_price)
                 )
 
-    # setup agents
-    for agent in agents:        
-        events_i: list[Event] = agent.setup(ch)
-        
-        for event in events_i: 
-            if event._event_name != 'null':
-                ch = event.run(ch, verbose=False)
-                events.append(event)
-                clearing_houses.append(copy.deepcopy(ch))
-                differences.append(0)
-        
-        # adjust_oracle_price()
-        ch = ch.change_time(1)
-
-    # run agents 
-    settle_tracker = {}
-    for (_, user) in ch.users.items(): 
-        settle_tracker[user.user_index] = False 
-
-
-    for x in tqdm(range(max(max_t))):
-        if x < ch.time:
-            continue
+    if resume is None:
+        # setup agents
+        for agent in agents:        
+            events_i: list[Event] = agent.setup(ch)
+            
+            for event in events_i: 
+                if event._event_name != 'null':
+                    ch = event.run(ch, verbose=False)
+                    events.append(event)
+                    record(ch, event)
+            
+            # adjust_oracle_price()
+            ch = ch.change_time(1)
+
+        # run agents 
+        settle_tracker = {}
+        for (_, user) in ch.users.items(): 
+            settle_tracker[user.user_index] = False 
+
+        scheduler = AgentScheduler(agents) if event_driven else None
+
+    def loop_state():
+        # (events + clearing_houses are the checkpoint's incremental history)
+        return dict(
+            ch=ch, agents=agents, scheduler=scheduler, 
+            last_oracle_price=last_oracle_price, settle_tracker=settle_tracker, 
+            event_driven=event_driven, snapshot=snapshot, 
+            writer=writer, sampling=sampling, 
+            observers=observers, observe_every=observe_every,
+        )
+
+    end = max(max_t)
+    pbar = tqdm(total=end, initial=min(ch.time, end), disable=not progress)
+    while ch.time < end:
+        if event_driven:
+            next_t = scheduler.next_wakeup(ch.time)
+            if next_t is None or next_t >= end:
+                break
+            ch = ch.change_time(next_t - ch.time)
+            run_agents = scheduler.due(ch.time)
+        else: 
+            run_agents = agents
+        pbar.update(ch.time - pbar.n)
 
         time_t_events = []
-        for i, agent in enumerate(agents):
-            events_i = agent.run(ch)
+        for i, agent in enumerate(run_agents):
+            events_i = agent.run_due(ch) if event_driven else agent.run(ch)
             for event_i in events_i:
                 # tmp soln 
                 # only settle once after another non-settle event (otherwise you get settle spam in the events)
@@ -136,24 +199,107 @@ def run_trial(agents, ch, path):
             ch = e.run(ch)
 
             events.append(e)
-            clearing_houses.append(copy.deepcopy(ch))
+            record(ch, e)
 
         if len(time_t_events) > 0:
             adjust_oracle_price()
         
+        if observers is not None and observe_every == 'timestep':
+            observe(observers, ch)
+
         ch = ch.change_time(1)
 
-    _, _events, _chs, _ = collateral_difference(ch, 0, verbose=False) 
+        # checkpoint between timesteps
+        if checkpointer is not None:
+            checkpointer.maybe_save(len(events), loop_state, dict(events=events, clearing_houses=clearing_houses))
+
+    # event driven: skipped timesteps still pass time
+    if event_driven and ch.time < end:
+        ch = ch.change_time(end - ch.time)
+    pbar.close()
+
+    # close everyone out (on a copy)
+    closed_ch, (_chs, _events, _) = close_all_users(copy.deepcopy(ch))
+    n_events = len(events)
     events += _events
-    clearing_houses += _chs
+    for k, (_ch, _event) in enumerate(zip(_chs, _events)):
+        record(_ch, _event, n_events + k)
+        if observers is not None and observe_every == 'timestep':
+            observe(observers, _ch, _event)
+
+    if memory_profiler is not None:
+        memory_profiler.sample(events, clearing_houses, ch, label='run')
+
+    return ch, closed_ch, events, clearing_houses
 
+def save_trial(path, events, writer: StreamingCSVWriter, event_log=False, memory_profiler: MemoryProfiler = None):
     print('number of events:', len(events))
 
     # save trial results 
-    json_events = [e.serialize_to_row() for e in events if e._event_name != 'null']
-    df = pd.DataFrame(json_events)
+    df = pd.DataFrame(serialize_events(events))
+    if memory_profiler is not None:
+        memory_profiler.sample(events, label='serialization')
     df.to_csv(path/'events.csv', index=False)
+    if event_log:
+        write_event_log(events, path/'event_log')
+
+    # chs.csv (or the columnar chs/) was streamed during the run
+    writer.close()
+
+    if memory_profiler is not None:
+        memory_profiler.stop().save(path)
+
+def run_trial(agents, ch, path, event_driven=False, cache: ResultCache = None, checkpoint_every_events=None, checkpoint_every_seconds=None, columnar=False, fixed_schema=False, sampling: SamplingPolicy = None, event_log=False, memory_profiler: MemoryProfiler = None):
+    ''' event_driven: jump straight to the next timestamp where an agent wakes up 
+    (see Agent.next_wakeup + AgentScheduler) instead of polling every agent every second 
+    cache: restore the results of an identical earlier trial instead of re-running it 
+    checkpoint_every_*: save path/checkpoint.pkl periodically (continue with resume_trial(path)) 
+    columnar: write the snapshots as a columnar history path/chs/ (see sim.columnar.load_columns) 
+    instead of chs.csv 
+    fixed_schema: serialize the snapshots with a SnapshotLayout (columns never disappear, 
+    closed positions are NaN) 
+    sampling: only snapshot some of the events (see sim.sampling) 
+    event_log: also save the events as a typed binary log path/event_log/ (see sim.event_log) 
+    memory_profiler: profile the memory per component into path/run_info.json (see sim.memory) '''
+    path.mkdir(exist_ok=True, parents=True)
+    artifacts = COLUMNAR_ARTIFACTS if columnar else ARTIFACTS
+    if event_log:
+        artifacts = artifacts + ['event_log']
+
+    if cache is not None:
+        key = trial_key(ch, agents, event_driven=event_driven, columnar=columnar, fixed_schema=fixed_schema, sampling=sampling)
+        if cache.restore(key, path, artifacts):
+            print('cache hit:', key)
+            return
+
+    ## save the initial markets!
+    json_markets = [m.to_json(0) for m in ch.markets]
+    with open(path/'markets_json.csv', 'w') as f:
+        json.dump(json_markets, f)
+
+    print('#agents:', len(agents))
+
+    checkpointer = None
+    if checkpoint_every_events is not None or checkpoint_every_seconds is not None:
+        checkpointer = Checkpointer(path/'checkpoint.pkl', checkpoint_every_events, checkpoint_every_seconds)
+
+    layout = SnapshotLayout() if fixed_schema else None
+    writer = ColumnarWriter(path/'chs', layout=layout) if columnar else StreamingCSVWriter(path/'chs.csv', layout=layout)
+    _, _, events, _ = run_agents(agents, ch, event_driven, checkpointer=checkpointer, writer=writer, sampling=sampling, memory_profiler=memory_profiler)
+    save_trial(path, events, writer, event_log, memory_profiler)
+
+    if cache is not None:
+        cache.store(key, path, artifacts)
+
+def resume_trial(path, checkpoint_every_events=None, checkpoint_every_seconds=None):
+    ''' continues a run_trial from its last checkpoint (same results as an uninterrupted run) '''
+    resume = load_checkpoint(path/'checkpoint.pkl')
+    print('resuming from t =', resume['ch'].time)
+
+    checkpointer = None
+    if checkpoint_every_events is not None or checkpoint_every_seconds is not None:
+        checkpointer = Checkpointer(path/'checkpoint.pkl', checkpoint_every_events, checkpoint_every_seconds)
+        checkpointer.continue_from(resume, len(resume['history']['events']))
 
-    json_chs = [e.to_json() for e in clearing_houses]
-    df = pd.DataFrame(json_chs)
-    df.to_csv(path/'chs.csv', index=False)
+    _, _, events, _ = run_agents(None, None, checkpointer=checkpointer, resume=resume)
+    save_trial(path, events, resume['writer'])
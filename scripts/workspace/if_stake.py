@@ -6,7 +6,6 @@
 # %autoreload 2
 
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 # sys.path.insert(0, './driftpy/src/')
@@ -165,4 +164,6 @@ def main():
     run_trial(agents, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
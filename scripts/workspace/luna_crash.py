@@ -1,5 +1,4 @@
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 sys.path.insert(0, '../../driftpy/src/')
@@ -23,7 +22,6 @@ import matplotlib.pyplot as plt
 import numpy as np 
 import pandas as pd
 from dataclasses import dataclass, field
-import random
 from pathlib import Path
 
 from sim.helpers import *
@@ -34,6 +32,7 @@ from sim.driftsim.clearing_house.lib import *
 
 from sim.events import * 
 from sim.agents import * 
+from sim.rng import spawn_rngs
 
 def setup_ch(base_spread=0, strategies='', n_steps=100):
     oracle_df = pd.read_csv('../../experiments/init/lunaCrash/oracle.csv', index_col=[0])
@@ -56,20 +55,10 @@ def setup_ch(base_spread=0, strategies='', n_steps=100):
 
     return ch
 
-def main():
-    seed = np.random.randint(0, 1e3)
-    np.random.seed(seed)
-    random.seed(seed)
-    print('seed', seed)
-
-    ch = setup_ch(
-        n_steps=100,
-        base_spread=0,
-    )
+def setup_agents(ch, n_lps=5, n_traders=5, rngs=None):
+    ''' rngs: one random stream per user (None = the global np.random state) '''
     market: SimulationMarket = ch.markets[0]
-
-    n_lps = 5
-    n_traders = 5
+    rngs = [None] * (n_lps + n_traders) if rngs is None else rngs
 
     # init agents
     agents = []
@@ -77,7 +66,7 @@ def main():
 
     agents += [ 
         MultipleAgent(
-            lambda: OpenClose.random_init(max_t, user_idx, 0, short_bias=0.9),
+            lambda: OpenClose.random_init(max_t, user_idx, 0, short_bias=0.9, rng=rngs[user_idx]),
             20, 
         )
         for user_idx in range(n_traders)
@@ -86,15 +75,35 @@ def main():
     n = len(agents)
     agents += [ 
         MultipleAgent(
-            lambda: AddRemoveLiquidity.random_init(max_t, user_idx, 0, min_token_amount=100000),
+            lambda: AddRemoveLiquidity.random_init(max_t, user_idx, 0, min_token_amount=100000, rng=rngs[user_idx]),
             20, 
         )
         for user_idx in range(n, n + n_lps)
     ]
 
+    return agents
+
+def build(seed, n_lps=5, n_traders=5):
+    ''' builds the clearing house + agents of the scenario from a seed '''
+    # (the oracle is historical) one stream per user
+    ch = setup_ch(
+        n_steps=100,
+        base_spread=0,
+    )
+    agents = setup_agents(ch, n_lps=n_lps, n_traders=n_traders, rngs=spawn_rngs(seed, n_lps + n_traders))
+
+    return ch, agents
+
+def main():
+    seed = np.random.randint(0, 1e3)
+    print('seed', seed)
+    ch, agents = build(seed)
+
     from helpers import run_trial
     path = Path('../../experiments/init/lunaCrash')
     run_trial(agents, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
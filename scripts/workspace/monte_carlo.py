@@ -0,0 +1,93 @@
+## runs N seeds of a workspace scenario (simple, luna_crash, three_markets, uponly)
+## across a process pool and aggregates a summary of every run into one table
+##
+## python monte_carlo.py simple --n-seeds 32 --workers 8
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+
+import time
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sim.helpers import compute_total_collateral
+from sim.observers import default_observers, results
+
+SCENARIOS = ['simple', 'luna_crash', 'three_markets', 'uponly']
+
+def summarize(scenario, seed, ch, closed_ch, n_events, elapsed):
+    ''' compact (one row) summary of a finished run '''
+    total_deposits = sum([user.cumulative_deposits for user in ch.users.values()]) / 1e6
+    difference = total_deposits - compute_total_collateral(closed_ch)
+
+    summary = dict(
+        scenario=scenario,
+        seed=seed,
+        n_events=n_events,
+        collateral_difference=difference,
+        abs_collateral_difference=abs(difference),
+        elapsed=elapsed,
+    )
+    for market in ch.markets:
+        prefix = f"m{market.market_index}"
+        positions = [user.positions[market.market_index] for user in ch.users.values()]
+        summary[f'{prefix}_fee_pool'] = market.amm.total_fee_minus_distributions / 1e6
+        summary[f'{prefix}_closed_fee_pool'] = closed_ch.markets[market.market_index].amm.total_fee_minus_distributions / 1e6
+        summary[f'{prefix}_base_asset_amount_with_amm'] = market.amm.base_asset_amount_with_amm
+        summary[f'{prefix}_open_positions'] = sum([p.base_asset_amount != 0 for p in positions])
+        summary[f'{prefix}_open_lps'] = sum([p.lp_shares > 0 for p in positions])
+
+    return summary
+
+def run_seed(scenario, seed, event_driven=False):
+    ''' worker: build the scenario from the seed, run it and summarize it '''
+    from helpers import run_agents
+
+    module = importlib.import_module(scenario)
+    ch, agents = module.build(seed)
+    ch.headless = True
+
+    observers = default_observers(ch)
+    start = time.perf_counter()
+    ch, closed_ch, events, _ = run_agents(agents, ch, event_driven, snapshot=False, progress=False, observers=observers)
+    elapsed = time.perf_counter() - start
+
+    return summarize(scenario, seed, ch, closed_ch, len(events), elapsed) | results(observers)
+
+def run_monte_carlo(scenario, seeds, workers=None, event_driven=False):
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_seed, scenario, int(seed), event_driven) for seed in seeds]
+        for future in as_completed(futures):
+            summaries.append(future.result())
+
+    df = pd.DataFrame(summaries).sort_values('seed').reset_index(drop=True)
+    return df
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenario', choices=SCENARIOS)
+    parser.add_argument('--n-seeds', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0, help='seeds are seed, seed+1, ...')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--out', type=str, default=None)
+    args = parser.parse_args()
+
+    seeds = np.arange(args.seed, args.seed + args.n_seeds)
+    df = run_monte_carlo(args.scenario, seeds, args.workers, args.event_driven)
+
+    print(df.to_string())
+    print('max abs collateral difference:', df['abs_collateral_difference'].max())
+
+    out = Path(args.out) if args.out else Path(f'../../experiments/monte_carlo/{args.scenario}.csv')
+    out.parent.mkdir(exist_ok=True, parents=True)
+    df.to_csv(out, index=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+## replays a trial's events.csv through the python ClearingHouse and reports events / second
+##
+## python replay.py ../../experiments/init/lunaCrash --observers --out ../../experiments/replay/lunaCrash
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+
+import json
+import argparse
+from pathlib import Path
+
+from driftpy.types import FeeStructure
+
+from sim.replay import load_events, clearing_house_from_json, replay
+from sim.sampling import EveryNEvents
+from sim.observers import default_observers, results
+from sim.writer import StreamingCSVWriter
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trial', type=str, help='folder with events.csv + markets_json.csv')
+    parser.add_argument('--fee-numerator', type=int, default=1)
+    parser.add_argument('--fee-denominator', type=int, default=1000)
+    parser.add_argument('--every', type=int, default=None, help='snapshot every n-th event (with --out)')
+    parser.add_argument('--observers', action='store_true')
+    parser.add_argument('--out', type=str, default=None, help='write the snapshots to out/chs.csv')
+    args = parser.parse_args()
+
+    trial = Path(args.trial)
+    events = load_events(trial/'events.csv')
+    fee_structure = FeeStructure(numerator=args.fee_numerator, denominator=args.fee_denominator)
+    ch = clearing_house_from_json(trial/'markets_json.csv', events, fee_structure)
+    ch.headless = args.out is None
+
+    observers = default_observers(ch) if args.observers else None
+    sampling = EveryNEvents(args.every) if args.every is not None else None
+    writer = None
+    if args.out is not None:
+        Path(args.out).mkdir(exist_ok=True, parents=True)
+        writer = StreamingCSVWriter(Path(args.out)/'chs.csv')
+
+    result = replay(events, ch, sampling=sampling, observers=observers, writer=writer, progress=True)
+    print(f"replayed {result['n_events']} events in {result['elapsed']:.2f}s ({result['events_per_second']:.0f} events/s)")
+    if observers is not None:
+        print(json.dumps(results(observers), indent=1, default=float))
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,6 @@
 # %autoreload 2
 
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 # sys.path.insert(0, './driftpy/src/')
@@ -46,11 +45,12 @@ from sim.agents import *
 
 import pathlib 
 import pandas as pd 
-import random 
 
-def setup_ch(base_spread=0, strategies='', n_steps=100):
+from sim.rng import spawn_rngs
+
+def setup_ch(base_spread=0, strategies='', n_steps=100, rng=None):
     # market one 
-    prices, timestamps = rand_heterosk_oracle(90, n_steps=n_steps)
+    prices, timestamps = rand_heterosk_oracle(90, n_steps=n_steps, rng=rng)
     oracle = Oracle(prices=prices, timestamps=timestamps)
     amm = SimulationAMM(
         oracle=oracle, 
@@ -68,28 +68,10 @@ def setup_ch(base_spread=0, strategies='', n_steps=100):
 
     return ch
 
-def main():
-    ## EXPERIMENTS PATH 
-    path = pathlib.Path('../../experiments/init/simple')
-    path.mkdir(exist_ok=True, parents=True)
-    print(str(path.absolute()))
-
-    seed = np.random.randint(0, 1e3)
-    np.random.seed(seed)
-    random.seed(seed)
-    print('seed', seed)
-
-    # setup markets + clearing houses
-    ch = setup_ch(
-        n_steps=20,
-        base_spread=0,
-    )
-
-    # setup the agents
-    n_lps = 1
-    n_traders = 1
-    n_times = 1
+def setup_agents(ch, n_lps=1, n_traders=1, n_times=1, rngs=None):
+    ''' rngs: one random stream per user (None = the global np.random state) '''
     total_users = n_lps + n_traders
+    rngs = [None] * total_users if rngs is None else rngs
 
     n_markets = len(ch.markets)
     max_t = [len(market.amm.oracle) for market in ch.markets]
@@ -101,7 +83,7 @@ def main():
             # trader agents (open/close)
             if user_idx < n_traders:
                 agent = MultipleAgent(
-                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.5),
+                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.5, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
@@ -109,21 +91,51 @@ def main():
             # LP agents (add/remove/settle) 
             elif user_idx < n_traders + n_lps:
                 agent = MultipleAgent(
-                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000),
+                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
 
-                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index)
+                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
                 agents.append(agent)
 
             # settle pnl 
-            agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index)
+            agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
             agents.append(agent)
 
+    return agents
+
+def build(seed, n_lps=1, n_traders=1):
+    ''' builds the clearing house + agents of the scenario from a seed '''
+    # independent streams: the oracle + one per user
+    oracle_rng, *rngs = spawn_rngs(seed, 1 + n_lps + n_traders)
+
+    # setup markets + clearing houses
+    ch = setup_ch(
+        n_steps=20,
+        base_spread=0,
+        rng=oracle_rng,
+    )
+    # setup the agents
+    agents = setup_agents(ch, n_lps=n_lps, n_traders=n_traders, rngs=rngs)
+
+    return ch, agents
+
+def main():
+    ## EXPERIMENTS PATH 
+    path = pathlib.Path('../../experiments/init/simple')
+    path.mkdir(exist_ok=True, parents=True)
+    print(str(path.absolute()))
+
+    seed = np.random.randint(0, 1e3)
+    print('seed', seed)
+    ch, agents = build(seed)
+
     # !! 
     from helpers import run_trial
     run_trial(agents, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
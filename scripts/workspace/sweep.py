@@ -0,0 +1,175 @@
+## parameter sweep over the amm + fee configuration
+##
+## expands a grid (every combination x seeds) into runs, runs them across a process pool
+## and appends one row per run to a tidy results csv keyed by the config hash (config +
+## sim code version) -- configs already in the csv are skipped so a sweep can be resumed/extended.
+## a config that raises gets a row with its error (and is retried on resume)
+##
+## python sweep.py --grid grid.json --seeds 4 --workers 8
+
+import sys
+sys.path.insert(0, '../../driftpy/src/')
+sys.path.insert(0, '../../')
+
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from driftpy.constants.numeric_constants import *
+
+from sim.rng import spawn_rngs
+from sim.cache import code_version
+from sim.helpers import rand_heterosk_oracle
+from sim.driftsim.clearing_house.state import *
+from sim.driftsim.clearing_house.lib import *
+
+DEFAULT_CONFIG = dict(
+    base_spread=0,
+    fee_numerator=1,
+    fee_denominator=1000,
+    funding_period=3600,
+    strategies='',
+    reserves=367_621,
+    n_steps=100,
+    n_traders=5,
+    n_lps=2,
+    n_times=1,
+)
+
+DEFAULT_GRID = dict(
+    base_spread=[0, 250, 1000],
+    fee_denominator=[1000, 2000],
+    strategies=['', 'PrePeg', 'PreFreePeg'],
+)
+
+def expand_grid(grid: dict, seeds: list) -> list[dict]:
+    ''' every combination of the grid values (on top of DEFAULT_CONFIG) for every seed '''
+    keys = sorted(grid.keys())
+    unknown = [k for k in keys if k not in DEFAULT_CONFIG]
+    assert len(unknown) == 0, f'unknown sweep parameters: {unknown}'
+
+    configs = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        for seed in seeds:
+            config = DEFAULT_CONFIG | dict(zip(keys, values))
+            config['seed'] = int(seed)
+            configs.append(config)
+    return configs
+
+def config_hash(config: dict) -> str:
+    ''' the config + the code it runs on (a code change re-runs the sweep) '''
+    data = dict(code=code_version(), config=config)
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+def setup_ch(config: dict, rng=None):
+    prices, timestamps = rand_heterosk_oracle(90, n_steps=config['n_steps'], rng=rng)
+    oracle = Oracle(prices=prices, timestamps=timestamps)
+    amm = SimulationAMM(
+        oracle=oracle,
+        base_asset_reserve=config['reserves'] * AMM_RESERVE_PRECISION,
+        quote_asset_reserve=config['reserves'] * AMM_RESERVE_PRECISION,
+        funding_period=config['funding_period'],
+        peg_multiplier=int(oracle.get_price(0)*PEG_PRECISION),
+        base_spread=config['base_spread'],
+        strategies=config['strategies'],
+    )
+    market = SimulationMarket(amm=amm, market_index=0)
+    fee_structure = FeeStructure(numerator=config['fee_numerator'], denominator=config['fee_denominator'])
+    ch = ClearingHouse([market], fee_structure, headless=True)
+
+    return ch
+
+def run_config(config: dict) -> dict:
+    ''' worker: one run of one config '''
+    from helpers import run_agents
+    from simple import setup_agents
+    from monte_carlo import summarize
+    from sim.observers import default_observers, results
+
+    # independent streams: the oracle + one per user
+    oracle_rng, *rngs = spawn_rngs(config['seed'], 1 + config['n_lps'] + config['n_traders'])
+    ch = setup_ch(config, rng=oracle_rng)
+    agents = setup_agents(ch, n_lps=config['n_lps'], n_traders=config['n_traders'], n_times=config['n_times'], rngs=rngs)
+
+    observers = default_observers(ch, per_user=False) # same columns for every config
+    start = time.perf_counter()
+    ch, closed_ch, events, _ = run_agents(agents, ch, snapshot=False, progress=False, observers=observers)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize('sweep', config['seed'], ch, closed_ch, len(events), elapsed) | results(observers)
+    summary.pop('scenario')
+    summary.pop('seed')
+
+    return dict(config_hash=config_hash(config)) | config | summary
+
+def load_results(path: Path, **kwargs) -> pd.DataFrame:
+    # (strategies='' would be read back as nan)
+    return pd.read_csv(path, dtype={'config_hash': str}, converters={'strategies': str}, **kwargs)
+
+def completed_hashes(path: Path) -> set:
+    ''' configs with a successful run (errored ones are retried) '''
+    if not path.exists():
+        return set()
+    df = load_results(path, usecols=lambda c: c in ('config_hash', 'error'))
+    if 'error' in df:
+        df = df[df['error'].isna()]
+    return set(df['config_hash'])
+
+def append_row(path: Path, row: dict):
+    ''' append one row to the results csv (one header = every column seen so far) '''
+    df = pd.DataFrame([row])
+    if path.exists():
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        if any(c not in columns for c in df.columns):
+            # new columns (eg the first rows were errors): rewrite with the wider header
+            pd.concat([load_results(path), df]).to_csv(path, index=False)
+            return
+        df = df.reindex(columns=columns)
+    df.to_csv(path, mode='a', index=False, header=not path.exists())
+
+def run_sweep(grid: dict, seeds: list, path: Path, workers=None) -> pd.DataFrame:
+    configs = expand_grid(grid, seeds)
+    done = completed_hashes(path)
+    todo = [c for c in configs if config_hash(c) not in done]
+    print(f'{len(configs)} runs: {len(configs) - len(todo)} already done, {len(todo)} to go')
+
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_config, config): config for config in todo}
+        for future in as_completed(futures):
+            config = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                # one bad config doesnt kill the sweep
+                print(f'config {config_hash(config)} failed: {e!r}')
+                row = dict(config_hash=config_hash(config)) | config | dict(error=repr(e))
+            # append as we go (a killed sweep keeps its finished runs)
+            append_row(path, row)
+
+    return load_results(path) if path.exists() else pd.DataFrame()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grid', type=str, default=None, help='json file of {parameter: [values, ...]}')
+    parser.add_argument('--seeds', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', type=str, default='../../experiments/sweeps/results.csv')
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid is not None:
+        with open(args.grid) as f:
+            grid = json.load(f)
+
+    df = run_sweep(grid, list(range(args.seeds)), Path(args.out), args.workers)
+    print(df.to_string())
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 sys.path.insert(0, '../../driftpy/src/')
@@ -20,7 +19,6 @@ from driftpy.constants.numeric_constants import *
 
 import numpy as np 
 import pandas as pd
-import random
 from pathlib import Path
 
 from sim.helpers import *
@@ -31,10 +29,14 @@ from sim.driftsim.clearing_house.lib import *
 
 from sim.events import * 
 from sim.agents import * 
+from sim.rng import spawn_rngs
+
+def setup_ch(base_spread=0, strategies='', n_steps=100, rngs=None):
+    ''' rngs: one random stream per oracle (None = the global np.random state) '''
+    rngs = [None] * 3 if rngs is None else rngs
 
-def setup_ch(base_spread=0, strategies='', n_steps=100):
     # market one 
-    prices, timestamps = rand_heterosk_oracle(90, n_steps=n_steps)
+    prices, timestamps = rand_heterosk_oracle(90, n_steps=n_steps, rng=rngs[0])
     oracle = Oracle(prices=prices, timestamps=timestamps)
     amm = SimulationAMM(
         oracle=oracle, 
@@ -48,7 +50,7 @@ def setup_ch(base_spread=0, strategies='', n_steps=100):
     market = SimulationMarket(amm=amm, market_index=0)
 
     # market two 
-    prices, timestamps = rand_heterosk_oracle(40, n_steps=n_steps)
+    prices, timestamps = rand_heterosk_oracle(40, n_steps=n_steps, rng=rngs[1])
     oracle = Oracle(prices=prices, timestamps=timestamps)
     amm = SimulationAMM(
         oracle=oracle, 
@@ -62,7 +64,7 @@ def setup_ch(base_spread=0, strategies='', n_steps=100):
     market2 = SimulationMarket(amm=amm, market_index=1)
 
     # market three
-    prices, timestamps = rand_heterosk_oracle(120, n_steps=n_steps)
+    prices, timestamps = rand_heterosk_oracle(120, n_steps=n_steps, rng=rngs[2])
     oracle = Oracle(prices=prices, timestamps=timestamps)
     amm = SimulationAMM(
         oracle=oracle, 
@@ -81,25 +83,10 @@ def setup_ch(base_spread=0, strategies='', n_steps=100):
 
     return ch
 
-def main():
-    path = Path('../../experiments/init/three_markets')
-    path.mkdir(exist_ok=True, parents=True)
-    print(str(path.absolute()))
-
-    seed = np.random.randint(0, 1e3)
-    np.random.seed(seed)
-    random.seed(seed)
-
-    print('seed', seed)
-    ch = setup_ch(
-        n_steps=20,
-        base_spread=0,
-    )
-
-    n_lps = 3
-    n_traders = 3
-    n_times = 2
+def setup_agents(ch, n_lps=3, n_traders=3, n_times=2, rngs=None):
+    ''' rngs: one random stream per user (None = the global np.random state) '''
     total_users = n_lps + n_traders
+    rngs = [None] * total_users if rngs is None else rngs
     n_markets = len(ch.markets)
 
     # create agents
@@ -111,7 +98,7 @@ def main():
             # trader agents (open/close)
             if user_idx < n_traders:
                 agent = MultipleAgent(
-                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.5),
+                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.5, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
@@ -119,21 +106,48 @@ def main():
             # LP agents (add/remove/settle) 
             elif user_idx < n_traders + n_lps:
                 agent = MultipleAgent(
-                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000),
+                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
 
-                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index)
+                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
                 agents.append(agent)
 
             # settle pnl 
-            agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index)
+            agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
             agents.append(agent)
 
+    return agents
+
+def build(seed, n_lps=3, n_traders=3):
+    ''' builds the clearing house + agents of the scenario from a seed '''
+    # independent streams: one per oracle + one per user
+    rngs = spawn_rngs(seed, 3 + n_lps + n_traders)
+
+    ch = setup_ch(
+        n_steps=20,
+        base_spread=0,
+        rngs=rngs[:3],
+    )
+    agents = setup_agents(ch, n_lps=n_lps, n_traders=n_traders, rngs=rngs[3:])
+
+    return ch, agents
+
+def main():
+    path = Path('../../experiments/init/three_markets')
+    path.mkdir(exist_ok=True, parents=True)
+    print(str(path.absolute()))
+
+    seed = np.random.randint(0, 1e3)
+    print('seed', seed)
+    ch, agents = build(seed)
+
     # run    
     from helpers import run_trial
     run_trial(agents, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
@@ -6,7 +6,6 @@
 # %autoreload 2
 
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 # sys.path.insert(0, './driftpy/src/')
@@ -46,7 +45,8 @@ from sim.agents import *
 
 import pathlib 
 import pandas as pd 
-import random 
+
+from sim.rng import spawn_rngs
 
 def setup_ch():
     markets = []
@@ -71,26 +71,10 @@ def setup_ch():
 
     return ch
 
-def main():
-    ## EXPERIMENTS PATH 
-    path = pathlib.Path('../../experiments/init/uponly')
-    path.mkdir(exist_ok=True, parents=True)
-    print(str(path.absolute()))
-
-    seed = np.random.randint(0, 1e3)
-    np.random.seed(seed)
-    random.seed(seed)
-    print('seed', seed)
-
-    # setup markets + clearing houses
-    ch = setup_ch()
-
-    # setup the agents
-    n_lps = 0
-    n_traders = 10
-    n_times = 1
-    n_stakers = 1
+def setup_agents(ch, n_lps=0, n_traders=10, n_times=1, n_stakers=1, rngs=None):
+    ''' rngs: one random stream per user (None = the global np.random state) '''
     total_users = n_lps + n_traders + n_stakers
+    rngs = [None] * total_users if rngs is None else rngs
 
     n_markets = len(ch.markets)
     max_t = [len(market.amm.oracle) for market in ch.markets]
@@ -101,7 +85,7 @@ def main():
         if user_idx < n_traders:
             for market_index in range(n_markets):
                 agent = MultipleAgent(
-                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.9),
+                    lambda: OpenClose.random_init(max_t[market_index], user_idx, market_index, short_bias=0.9, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
@@ -110,28 +94,52 @@ def main():
         elif user_idx < n_traders + n_lps:
             for market_index in range(n_markets):
                 agent = MultipleAgent(
-                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000),
+                    lambda: AddRemoveLiquidity.random_init(max_t[market_index], user_idx, market_index, min_token_amount=100000, rng=rngs[user_idx]),
                     n_times, 
                 )
                 agents.append(agent)
 
-                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index)
+                agent = SettleLP.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
                 agents.append(agent)
         
         # IF staker agents
         elif user_idx < n_traders + n_lps + n_stakers:
-            agent = IFStaker.random_init(max_t[market_index], user_idx, market_index)
+            agent = IFStaker.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
             agents.append(agent)
 
         if user_idx < n_traders + n_lps:
             for market_index in range(n_markets):
                 # settle pnl for traders + lps
-                agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index)
+                agent = SettlePnL.random_init(max_t[market_index], user_idx, market_index, rng=rngs[user_idx])
                 agents.append(agent)
 
+    return agents
+
+def build(seed, n_lps=0, n_traders=10, n_stakers=1):
+    ''' builds the clearing house + agents of the scenario from a seed '''
+    # setup markets + clearing houses (the oracle is historical)
+    ch = setup_ch()
+    # setup the agents -- one random stream per user
+    rngs = spawn_rngs(seed, n_lps + n_traders + n_stakers)
+    agents = setup_agents(ch, n_lps=n_lps, n_traders=n_traders, n_stakers=n_stakers, rngs=rngs)
+
+    return ch, agents
+
+def main():
+    ## EXPERIMENTS PATH 
+    path = pathlib.Path('../../experiments/init/uponly')
+    path.mkdir(exist_ok=True, parents=True)
+    print(str(path.absolute()))
+
+    seed = np.random.randint(0, 1e3)
+    print('seed', seed)
+    ch, agents = build(seed)
+
     # !! 
     from helpers import run_trial
     run_trial(agents, ch, path)
 
 if __name__ == '__main__':
+    # (here so the workers importing this module dont import plotly)
+    pd.options.plotting.backend = "plotly"
     main()
\ No newline at end of file
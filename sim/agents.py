@@ -8,8 +8,9 @@ from driftpy.math.market import calculate_mark_price, calculate_bid_ask_price
 from driftpy.constants.numeric_constants import AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO, PRICE_PRECISION as PRICE_PRECISION, PEG_PRECISION, QUOTE_PRECISION
 from driftpy._types import AssetType
 
-from solana.publickey import PublicKey
 import copy
+import heapq
+from abc import ABC, abstractmethod
 
 import pandas as pd
 import numpy as np
@@ -18,6 +19,8 @@ from sim.driftsim.clearing_house.state import Oracle, User, user
 from sim.driftsim.clearing_house.lib import ClearingHouse
 from sim.events import *
 from sim.driftsim.clearing_house.state import User 
+from sim.scheduler import AgentScheduler
+from sim.rng import get_rng, randint
 
 ''' Agents ABC '''
 
@@ -33,6 +36,22 @@ class Agent:
     def setup(self, state_i: ClearingHouse) -> list[Event]: 
         ''' called once at the start of the simulation '''
         pass
+
+    def next_wakeup(self, now: int) -> int:
+        ''' earliest timestamp >= now where run can return a non-null event 
+        (None = never again) -- default is to be polled every timestep '''
+        return now
+
+    def run_due(self, state_i: ClearingHouse) -> list[Event]:
+        ''' run by event driven loops when the AgentScheduler says the agent is due '''
+        return self.run(state_i)
+
+    # polled agents are run every timestep, others only at their next_wakeup (see AgentScheduler)
+    polled = True
+
+def next_multiple(now: int, every_x_steps: int) -> int:
+    ''' smallest t >= now with t % every_x_steps == 0 '''
+    return now + (-now) % every_x_steps
     
 def default_user_deposit(
     user_index: int, 
@@ -62,6 +81,11 @@ class MultipleAgent(Agent):
 
         self.user_index = self.subagents[0].user_index
         self.deposit_amount = sum([agent.deposit_amount for agent in self.subagents])
+        self.scheduler = AgentScheduler(self.subagents)
+
+    @property
+    def polled(self):
+        return any([agent.polled for agent in self.subagents])
 
     def setup(self, state_i: ClearingHouse) -> list[Event]: 
         event = default_user_deposit(
@@ -80,6 +104,17 @@ class MultipleAgent(Agent):
         
         return events
 
+    def run_due(self, state_i: ClearingHouse) -> list[Event]:
+        # event driven: only the subagents due now
+        events = []
+        for agent in self.scheduler.due(state_i.time):
+            events += agent.run_due(state_i)
+        
+        return events
+
+    def next_wakeup(self, now: int) -> int:
+        return self.scheduler.next_wakeup(now)
+
 @dataclass
 class IFStaker(Agent):
     stake_amount: int
@@ -89,12 +124,13 @@ class IFStaker(Agent):
     duration: int = -1
     name: str = 'if_staker'
     has_opened: bool = False
+    polled = False
 
     @staticmethod
-    def random_init(max_t, user_index, spot_market_index): 
-        start = np.random.randint(0, max_t - 2)
-        dur = np.random.randint(0, max_t - start - 1)
-        stake_amount = np.random.randint(0, QUOTE_PRECISION * 100)
+    def random_init(max_t, user_index, spot_market_index, rng=None): 
+        start = randint(rng, 0, max_t - 2)
+        dur = randint(rng, 0, max_t - start - 1)
+        stake_amount = randint(rng, 0, QUOTE_PRECISION * 100)
 
         return IFStaker(
             stake_amount, 
@@ -146,7 +182,16 @@ class IFStaker(Agent):
 
         return [event]
 
+    def next_wakeup(self, now: int) -> int:
+        if not self.has_opened:
+            return max(now, self.start_time)
+        if self.duration > 0 and self.deposit_start + self.duration >= now:
+            return self.deposit_start + self.duration
+        return None
+
 class OpenClose(Agent):
+    polled = False
+
     def __init__(
         self, 
         start_time: int = 0, 
@@ -173,24 +218,25 @@ class OpenClose(Agent):
         self.name = 'openclose'
 
     @staticmethod
-    def random_init(max_t, user_index, market_index, short_bias, leave_open_odds=0.5, leverage=1):
+    def random_init(max_t, user_index, market_index, short_bias, leave_open_odds=0.5, leverage=1, rng=None):
         assert short_bias <= 1 and short_bias >= 0, "invalid short bias value"
         assert leave_open_odds <= 1 and leave_open_odds >= 0, "invalid leave open odds value"
+        rng = get_rng(rng)
         
-        start = np.random.randint(0, max_t - 2)
-        dur = np.random.randint(0, max_t - start - 1)
-        amount = np.random.randint(0, QUOTE_PRECISION * 100)
+        start = randint(rng, 0, max_t - 2)
+        dur = randint(rng, 0, max_t - start - 1)
+        amount = randint(rng, 0, QUOTE_PRECISION * 100)
         quote_amount = amount 
 
         # dont close it ???
-        should_leave_open = np.random.choice([1, 0], p=[leave_open_odds, 1-leave_open_odds])
+        should_leave_open = rng.choice([1, 0], p=[leave_open_odds, 1-leave_open_odds])
         if should_leave_open:
             dur = max_t + 1
         
         return OpenClose(
             start_time=start,
             duration=dur, 
-            direction='long' if np.random.choice([1, 0], p=[1 - short_bias, short_bias]) else 'short',
+            direction='long' if rng.choice([1, 0], p=[1 - short_bias, short_bias]) else 'short',
             quote_amount=quote_amount, 
             deposit_amount=quote_amount//leverage,
             user_index=user_index, 
@@ -235,8 +281,17 @@ class OpenClose(Agent):
 
         event = [event]
         return event
+
+    def next_wakeup(self, now: int) -> int:
+        if not self.has_opened:
+            return max(now, self.start_time)
+        if self.duration > 0 and self.deposit_start + self.duration >= now:
+            return self.deposit_start + self.duration
+        return None
        
 class AddRemoveLiquidity(Agent):
+    polled = False
+
     def __init__(
         self, 
         lp_start_time: int = 0, 
@@ -261,10 +316,10 @@ class AddRemoveLiquidity(Agent):
         self.name = 'liquidity-provider'
 
     @staticmethod
-    def random_init(max_t, user_index, market_index, min_token_amount=0, max_token_amount=100 * AMM_RESERVE_PRECISION, leverage=1):
-        start = np.random.randint(0, max_t - 2)
-        dur = np.random.randint(0, max_t - start - 1)
-        token_amount = np.random.randint(min_token_amount, max_token_amount)
+    def random_init(max_t, user_index, market_index, min_token_amount=0, max_token_amount=100 * AMM_RESERVE_PRECISION, leverage=1, rng=None):
+        start = randint(rng, 0, max_t - 2)
+        dur = randint(rng, 0, max_t - start - 1)
+        token_amount = randint(rng, min_token_amount, max_token_amount)
 
         return AddRemoveLiquidity(
             lp_start_time=start,
@@ -318,6 +373,261 @@ class AddRemoveLiquidity(Agent):
         event = [event]
         return event
 
+    def next_wakeup(self, now: int) -> int:
+        if not self.has_deposited:
+            return max(now, self.lp_start_time)
+        if self.lp_duration > 0 and self.deposit_start + self.lp_duration >= now:
+            return self.deposit_start + self.lp_duration
+        return None
+
+def as_array(values, n, dtype=None) -> np.ndarray:
+    ''' per member values (a scalar = the same for everyone) '''
+    return np.broadcast_to(np.asarray(values, dtype=dtype), (n,)).copy()
+
+class Population(Agent, ABC):
+    ''' a cohort of open -> close agents (OpenClose / AddRemoveLiquidity) stored as numpy arrays
+
+    same (non null) events in the same order as a MultipleAgent of the equivalent subagents but only
+    the members due at t are touched: opens by a pointer into the members sorted by start
+    time, closes by a heap of close times (-> the members closing then) -- so 10k traders
+    cost O(events) python objects instead of 10k subagents
+    subclasses define open_event / close_event for member i
+    '''
+    polled = False
+
+    def __init__(self, start_time, duration, user_index, market_index, deposit_amount):
+        self.start_time = np.asarray(start_time, dtype=np.int64)
+        n = len(self.start_time)
+        self.duration = as_array(duration, n, np.int64)
+        self.user_index = as_array(user_index, n, np.int64)
+        self.market_index = as_array(market_index, n, np.int64)
+        self.deposit_amount = as_array(deposit_amount, n)
+
+        # -1 = not opened yet
+        self.open_time = np.full(n, -1, dtype=np.int64)
+        self.start_order = np.argsort(self.start_time, kind='stable')
+        self.sorted_start_time = self.start_time[self.start_order]
+        self.n_started = 0
+        # close time -> members (heap of the close times)
+        self.close_times = []
+        self.closing = {}
+
+    def __len__(self):
+        return len(self.start_time)
+
+    def setup(self, state_i: ClearingHouse) -> list[Event]:
+        # one deposit per user (the sum of its members) -- like MultipleAgent
+        users, first, inverse = np.unique(self.user_index, return_index=True, return_inverse=True)
+        deposits = np.zeros(len(users), dtype=self.deposit_amount.dtype)
+        np.add.at(deposits, inverse, self.deposit_amount)
+        events = []
+        for k in np.argsort(first, kind='stable'):
+            events.append(default_user_deposit(
+                int(users[k]),
+                state_i,
+                username=f'multiple-{self.name}',
+                deposit_amount=deposits[k].item(),
+            ))
+        return events
+
+    def schedule_closes(self, members: np.ndarray, now: int):
+        members = members[self.duration[members] > 0]
+        if len(members) == 0:
+            return
+        close_time = now + self.duration[members]
+        times, inverse = np.unique(close_time, return_inverse=True)
+        for k, t in enumerate(times.tolist()):
+            if t not in self.closing:
+                self.closing[t] = []
+                heapq.heappush(self.close_times, t)
+            self.closing[t].append(members[inverse == k])
+
+    def run(self, state_i: ClearingHouse) -> list[Event]:
+        now = state_i.time
+
+        # everyone with start_time <= now who hasnt opened (late = opens now)
+        end = np.searchsorted(self.sorted_start_time, now, side='right')
+        opens = self.start_order[self.n_started:end]
+        self.n_started = end
+        self.open_time[opens] = now
+        self.schedule_closes(opens, now)
+
+        # closes due now (a close time which was skipped is dropped -- a null event like OpenClose)
+        closes, missed = [], []
+        while len(self.close_times) > 0 and self.close_times[0] <= now:
+            t = heapq.heappop(self.close_times)
+            (closes if t == now else missed).extend(self.closing.pop(t))
+
+        members = [opens] + closes + missed
+        kinds = [np.zeros(len(opens), dtype=np.int8)]
+        kinds += [np.ones(len(m), dtype=np.int8) for m in closes]
+        kinds += [np.full(len(m), 2, dtype=np.int8) for m in missed]
+        members, kinds = np.concatenate(members), np.concatenate(kinds)
+
+        # in member order (ie the subagent order of a MultipleAgent)
+        events = []
+        order = np.argsort(members, kind='stable')
+        for i, kind in zip(members[order].tolist(), kinds[order].tolist()):
+            if kind == 0:
+                events.append(self.open_event(state_i, i))
+            elif kind == 1:
+                events.append(self.close_event(state_i, i))
+            else:
+                events.append(NullEvent(now))
+        return events
+
+    def next_wakeup(self, now: int) -> int:
+        wakeups = []
+        if self.n_started < len(self):
+            wakeups.append(max(now, int(self.sorted_start_time[self.n_started])))
+        if len(self.close_times) > 0:
+            wakeups.append(max(now, self.close_times[0]))
+        return min(wakeups, default=None)
+
+    @abstractmethod
+    def open_event(self, state_i: ClearingHouse, i: int) -> Event:
+        ''' the event of member i opening at state_i.time '''
+
+    @abstractmethod
+    def close_event(self, state_i: ClearingHouse, i: int) -> Event:
+        ''' the event of member i closing at state_i.time '''
+
+class OpenClosePopulation(Population):
+    ''' n OpenClose traders (see Population) '''
+    def __init__(
+        self,
+        start_time,
+        duration=-1,
+        quote_amount=100 * QUOTE_PRECISION,
+        direction='long',
+        user_index=0,
+        market_index=0,
+        deposit_amount=None
+    ):
+        n = len(start_time)
+        self.quote_amount = as_array(quote_amount, n)
+        self.is_long = as_array(direction, n) == 'long'
+        if deposit_amount is None:
+            deposit_amount = self.quote_amount
+        super().__init__(start_time, duration, user_index, market_index, deposit_amount)
+        self.name = 'openclose'
+
+    @staticmethod
+    def from_agents(agents: list[OpenClose]):
+        ''' the population of a list of (not yet run) OpenClose agents '''
+        return OpenClosePopulation(
+            start_time=[a.start_time for a in agents],
+            duration=[a.duration for a in agents],
+            quote_amount=[a.quote_amount for a in agents],
+            direction=[a.direction for a in agents],
+            user_index=[a.user_index for a in agents],
+            market_index=[a.market_index for a in agents],
+            deposit_amount=[a.deposit_amount for a in agents],
+        )
+
+    @staticmethod
+    def random_init(n, max_t, user_index, market_index, short_bias, leave_open_odds=0.5, leverage=1, rng=None):
+        ''' n traders drawn like OpenClose.random_init (same distributions, drawn as arrays
+        so not the same numbers) -- user_index can be one user or one per trader '''
+        assert short_bias <= 1 and short_bias >= 0, "invalid short bias value"
+        assert leave_open_odds <= 1 and leave_open_odds >= 0, "invalid leave open odds value"
+        rng = get_rng(rng)
+
+        start = randint(rng, np.zeros(n, dtype=np.int64), max_t - 2)
+        dur = randint(rng, np.zeros(n, dtype=np.int64), max_t - start - 1)
+        quote_amount = randint(rng, np.zeros(n, dtype=np.int64), QUOTE_PRECISION * 100)
+
+        # dont close it ???
+        should_leave_open = rng.choice([1, 0], size=n, p=[leave_open_odds, 1-leave_open_odds])
+        dur = np.where(should_leave_open == 1, max_t + 1, dur)
+        is_long = rng.choice([1, 0], size=n, p=[1 - short_bias, short_bias])
+
+        return OpenClosePopulation(
+            start_time=start,
+            duration=dur,
+            direction=np.where(is_long == 1, 'long', 'short'),
+            quote_amount=quote_amount,
+            deposit_amount=quote_amount//leverage,
+            user_index=user_index,
+            market_index=market_index
+        )
+
+    def open_event(self, state_i: ClearingHouse, i: int) -> Event:
+        market_index = self.market_index[i].item()
+        market = state_i.markets[market_index]
+        return OpenPositionEvent(
+            timestamp=state_i.time,
+            direction='long' if self.is_long[i] else 'short',
+            market_index=market_index,
+            user_index=self.user_index[i].item(),
+            quote_amount=min(self.quote_amount[i].item(), market.amm.quote_asset_reserve)
+        )
+
+    def close_event(self, state_i: ClearingHouse, i: int) -> Event:
+        return ClosePositionEvent(
+            timestamp=state_i.time,
+            market_index=self.market_index[i].item(),
+            user_index=self.user_index[i].item(),
+        )
+
+class LiquidityPopulation(Population):
+    ''' n AddRemoveLiquidity lps (see Population) '''
+    def __init__(
+        self,
+        lp_start_time,
+        lp_duration=-1,
+        token_amount=100 * 1e13,
+        user_index=0,
+        market_index=0,
+    ):
+        n = len(lp_start_time)
+        self.token_amount = as_array(token_amount, n)
+        super().__init__(lp_start_time, lp_duration, user_index, market_index, 10_000_000 * QUOTE_PRECISION)
+        self.name = 'liquidity-provider'
+
+    @staticmethod
+    def from_agents(agents: list[AddRemoveLiquidity]):
+        ''' the population of a list of (not yet run) AddRemoveLiquidity agents '''
+        return LiquidityPopulation(
+            lp_start_time=[a.lp_start_time for a in agents],
+            lp_duration=[a.lp_duration for a in agents],
+            token_amount=[a.token_amount for a in agents],
+            user_index=[a.user_index for a in agents],
+            market_index=[a.market_index for a in agents],
+        )
+
+    @staticmethod
+    def random_init(n, max_t, user_index, market_index, min_token_amount=0, max_token_amount=100 * AMM_RESERVE_PRECISION, rng=None):
+        ''' n lps drawn like AddRemoveLiquidity.random_init (as arrays) '''
+        start = randint(rng, np.zeros(n, dtype=np.int64), max_t - 2)
+        dur = randint(rng, np.zeros(n, dtype=np.int64), max_t - start - 1)
+        token_amount = randint(rng, np.full(n, min_token_amount, dtype=np.int64), max_token_amount)
+
+        return LiquidityPopulation(
+            lp_start_time=start,
+            lp_duration=dur,
+            token_amount=token_amount,
+            user_index=user_index,
+            market_index=market_index,
+        )
+
+    def open_event(self, state_i: ClearingHouse, i: int) -> Event:
+        return addLiquidityEvent(
+            timestamp=state_i.time,
+            market_index=self.market_index[i].item(),
+            user_index=self.user_index[i].item(),
+            token_amount=self.token_amount[i].item()
+        )
+
+    def close_event(self, state_i: ClearingHouse, i: int) -> Event:
+        # full burn
+        return removeLiquidityEvent(
+            timestamp=state_i.time,
+            market_index=self.market_index[i].item(),
+            user_index=self.user_index[i].item(),
+            lp_token_amount=self.token_amount[i].item()
+        )
+
 class Arb(Agent):
     ''' arbitrage a single market to oracle'''
     def __init__(
@@ -467,7 +777,14 @@ class Noise(Agent):
         event = [event]
         return event
 
+    def next_wakeup(self, now: int) -> int:
+        # trades on the last second of every 5 minutes
+        every_x_minutes = 60 * 5
+        return now + (every_x_minutes - 1 - now % every_x_minutes) % every_x_minutes
+
 class SettlePnL(Agent):
+    polled = False
+
     def __init__(self, user_index: int, market_index: int, every_x_steps: int = 1, start: int = 0) -> None:
         self.user_index = user_index
         self.market_index = market_index
@@ -478,12 +795,12 @@ class SettlePnL(Agent):
         self.deposit_amount = 0
 
     @staticmethod
-    def random_init(max_t, user_index, market_index, update_every=-1, start=-1):
+    def random_init(max_t, user_index, market_index, update_every=-1, start=-1, rng=None):
         if update_every == -1:
-            update_every = np.random.randint(1, max_t // 4)
+            update_every = randint(rng, 1, max_t // 4)
 
         if start == -1:
-            start = np.random.randint(1, max_t // 4)
+            start = randint(rng, 1, max_t // 4)
         
         return SettlePnL(
             user_index, 
@@ -514,7 +831,12 @@ class SettlePnL(Agent):
 
         return events
 
+    def next_wakeup(self, now: int) -> int:
+        return next_multiple(max(now, self.start + 1), self.every_x_steps)
+
 class SettleLP(Agent):
+    polled = False
+
     def __init__(self, user_index: int, market_index: int, every_x_steps: int = 1) -> None:
         self.user_index = user_index
         self.market_index = market_index
@@ -524,9 +846,9 @@ class SettleLP(Agent):
         self.deposit_amount = 0
 
     @staticmethod
-    def random_init(max_t, user_index, market_index, update_every=-1):
+    def random_init(max_t, user_index, market_index, update_every=-1, rng=None):
         if update_every == -1:
-            update_every = np.random.randint(1, max_t // 4)
+            update_every = randint(rng, 1, max_t // 4)
 
         return SettleLP(
             user_index, 
@@ -553,6 +875,9 @@ class SettleLP(Agent):
 
         return events
 
+    def next_wakeup(self, now: int) -> int:
+        return next_multiple(now, self.every_x_steps)
+
 class ArbFunding(Agent):
     ''' arbitrage a single market to oracle'''
     def __init__(self, intensity: float, market_index: int, user_index: int, lookahead:int = 0):
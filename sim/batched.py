@@ -0,0 +1,547 @@
+import copy
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from driftpy.constants.numeric_constants import *
+
+from sim.agents import Agent, OpenClose, Arb, Noise
+
+''' lockstep batched simulation of K independent single-market clearing houses
+
+for monte carlo over oracle paths: the amm / user state of every path is a (K,) / (K, n_users)
+array and the ClearingHouse math (swaps, funding, fees, twaps, margin reverts) is applied to
+all paths at once -- masks select the paths an event applies to (eg margin reverts only undo
+the paths that failed). one interpreter pass simulates all K paths:
+
+    prices = np.stack([path_0, path_1, ...])   # (K, T) oracle prices on a shared time grid
+    bch = run_batched([Arb(...), Noise(...), OpenClose(...)], market, fee_structure, prices)
+    bch.to_df()                                # one row per path
+
+supports the simple agents (OpenClose, Arb, Noise) on a market without spread or peg
+strategies -- same results (up to float rounding) as running this loop with a ClearingHouse
+per path: every agent's setup events then +1, then every timestep until end each agent's
+events run (before the next agent runs) then +1. unlike DriftSim.run there is no t0 null
+event / +1 before the setups, no oracle price events and no close out at the end
+'''
+
+class ArrayState:
+    ''' a set of arrays (one per field) whose first axis is the path '''
+    fields = ()
+
+    def copy(self):
+        other = copy.copy(self)
+        for name in self.fields:
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    def restore(self, old, mask):
+        ''' resets the masked paths to old '''
+        for name in self.fields:
+            getattr(self, name)[mask] = getattr(old, name)[mask]
+
+class BatchedAMM(ArrayState):
+    fields = (
+        'base_asset_reserve', 'quote_asset_reserve', 'sqrt_k', 'peg_multiplier',
+        'last_mark_price_twap', 'last_mark_price_twap_ts',
+        'last_oracle_price', 'last_oracle_price_twap', 'last_oracle_price_twap_ts',
+        'cumulative_funding_rate_long', 'cumulative_funding_rate_short',
+        'last_funding_rate', 'last_funding_rate_ts',
+        'base_asset_amount_long', 'base_asset_amount_short', 'base_asset_amount_with_amm',
+        'quote_asset_amount_long', 'quote_asset_amount_short',
+        'total_fee', 'total_fee_minus_distributions', 'cumulative_fee_per_lp',
+    )
+
+    def __init__(self, amm, n_paths):
+        for name in self.fields:
+            setattr(self, name, np.full(n_paths, getattr(amm, name), dtype=float))
+
+class BatchedUsers(ArrayState):
+    ''' (n_paths, n_users) -- one column per user (single market so one position each) '''
+    fields = (
+        'collateral', 'cumulative_deposits',
+        'base_asset_amount', 'quote_asset_amount', 'last_cumulative_funding_rate',
+    )
+
+    def __init__(self, n_paths):
+        for name in self.fields:
+            setattr(self, name, np.zeros((n_paths, 0)))
+
+    def add_user(self):
+        for name in self.fields:
+            value = getattr(self, name)
+            setattr(self, name, np.column_stack([value, np.zeros(len(value))]))
+
+def calculate_new_twap(last_twap, last_twap_ts, current_value, now, funding_period):
+    since_last = np.maximum(1, now - last_twap_ts)
+    from_start = np.maximum(1, funding_period - since_last)
+    return (current_value * since_last + last_twap * from_start) / (since_last + from_start)
+
+def calculate_updated_collateral(collateral, pnl):
+    return np.where((pnl < 0) & (np.abs(pnl) > collateral), 0, collateral + pnl)
+
+class BatchedClearingHouse:
+    def __init__(self, market, fee_structure, oracle_prices, timestamps=None):
+        ''' market: the initial market (its oracle is replaced by the paths)
+        oracle_prices: (n_paths, n_timestamps) prices on the shared timestamps (default 0, 1, ...) '''
+        amm = market.amm
+        assert amm.base_spread == 0, 'batched clearing house doesnt support spreads'
+        assert amm.strategies == '', 'batched clearing house doesnt support peg strategies'
+
+        self.oracle_prices = np.atleast_2d(np.asarray(oracle_prices, dtype=float))
+        self.n_paths = len(self.oracle_prices)
+        self.timestamps = np.arange(self.oracle_prices.shape[1]) if timestamps is None else np.asarray(timestamps)
+        self.time = 0
+
+        self.market_index = market.market_index
+        self.margin_ratio_initial = market.margin_ratio_initial
+        self.funding_period = amm.funding_period
+        self.amm_lp_shares = amm.amm_lp_shares
+        self.total_lp_shares = amm.total_lp_shares
+        self.minimum_quote_asset_trade_size = amm.minimum_quote_asset_trade_size
+        self.fee_structure = fee_structure
+        self.exchange_fee = float(fee_structure.numerator) / float(fee_structure.denominator)
+
+        self.amm = BatchedAMM(amm, self.n_paths)
+        oracle_price = self.get_oracle_price(amm.last_oracle_price_twap_ts)
+        self.amm.last_oracle_price = oracle_price.copy()
+        self.amm.last_oracle_price_twap = oracle_price.copy()
+
+        self.users = BatchedUsers(self.n_paths)
+        self.user_columns = {}
+        self.usernames = {}
+        self.n_margin_reverts = np.zeros(self.n_paths, dtype=int)
+
+    def change_time(self, time_delta):
+        self.time = self.time + time_delta
+        return self
+
+    def get_oracle_price(self, timestamp) -> np.ndarray:
+        # same as Oracle.get_price: the last price with timestamps[i] <= timestamp
+        index = np.searchsorted(self.timestamps, timestamp, side='right') - 1
+        return self.oracle_prices[:, index]
+
+    def mark_price(self) -> np.ndarray:
+        amm = self.amm
+        return amm.quote_asset_reserve * amm.peg_multiplier / PEG_PRECISION / amm.base_asset_reserve
+
+    def path_mask(self, mask=None) -> np.ndarray:
+        if mask is None:
+            return np.ones(self.n_paths, dtype=bool)
+        return np.broadcast_to(mask, (self.n_paths,)).copy()
+
+    def deposit_user_collateral(self, user_index, collateral_amount, name='u'):
+        if user_index not in self.user_columns:
+            self.user_columns[user_index] = len(self.user_columns)
+            self.usernames[user_index] = f"{name}{user_index}"
+            self.users.add_user()
+
+        u = self.user_columns[user_index]
+        self.users.collateral[:, u] += collateral_amount
+        self.users.cumulative_deposits[:, u] += collateral_amount
+        return self
+
+    ## twaps
+    def update_mark_twap(self, mask):
+        amm = self.amm
+        new_mark_twap = calculate_new_twap(
+            amm.last_mark_price_twap, amm.last_mark_price_twap_ts, self.mark_price(), self.time, self.funding_period
+        )
+        amm.last_mark_price_twap = np.where(mask, new_mark_twap, amm.last_mark_price_twap)
+        amm.last_mark_price_twap_ts = np.where(mask, self.time, amm.last_mark_price_twap_ts)
+
+    def update_oracle_twap(self, mask):
+        amm = self.amm
+        new_oracle_twap = calculate_new_twap(
+            amm.last_oracle_price_twap, amm.last_oracle_price_twap_ts, amm.last_oracle_price, self.time, self.funding_period
+        )
+        amm.last_oracle_price = np.where(mask, self.get_oracle_price(self.time), amm.last_oracle_price)
+        amm.last_oracle_price_twap = np.where(mask, new_oracle_twap, amm.last_oracle_price_twap)
+        amm.last_oracle_price_twap_ts = np.where(mask, self.time, amm.last_oracle_price_twap_ts)
+
+    ## swaps
+    def swap_quote_asset(self, quote_amount, direction, mask) -> np.ndarray:
+        ''' direction: +1 = long (add quote), -1 = short -- returns the base acquired '''
+        self.update_mark_twap(mask)
+        amm = self.amm
+        quote_reserve_amount = quote_amount * AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO / amm.peg_multiplier
+        new_quote_asset_reserve = amm.quote_asset_reserve + direction * quote_reserve_amount
+        new_base_asset_reserve = amm.sqrt_k * amm.sqrt_k / new_quote_asset_reserve
+
+        base_amount_acquired = np.where(mask, amm.base_asset_reserve - new_base_asset_reserve, 0)
+        amm.quote_asset_reserve = np.where(mask, new_quote_asset_reserve, amm.quote_asset_reserve)
+        amm.base_asset_reserve = np.where(mask, new_base_asset_reserve, amm.base_asset_reserve)
+        return base_amount_acquired
+
+    def swap_base_asset(self, base_amount, mask) -> np.ndarray:
+        ''' closes base_amount (long = add base) -- returns the quote acquired '''
+        self.update_mark_twap(mask)
+        amm = self.amm
+        new_base_asset_reserve = amm.base_asset_reserve + base_amount
+        new_quote_asset_reserve = amm.sqrt_k * amm.sqrt_k / new_base_asset_reserve
+
+        quote_amount_acquired = (
+            np.abs(amm.quote_asset_reserve - new_quote_asset_reserve)
+            * amm.peg_multiplier
+            / AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO
+        )
+        quote_amount_acquired += base_amount < 0 # rounding of SwapDirection.REMOVE
+
+        quote_amount_acquired = np.where(mask, quote_amount_acquired, 0)
+        amm.quote_asset_reserve = np.where(mask, new_quote_asset_reserve, amm.quote_asset_reserve)
+        amm.base_asset_reserve = np.where(mask, new_base_asset_reserve, amm.base_asset_reserve)
+        return quote_amount_acquired
+
+    def calculate_base_asset_value(self, base_amount) -> np.ndarray:
+        amm = self.amm
+        new_quote_asset_reserve = amm.sqrt_k * amm.sqrt_k / (amm.base_asset_reserve + base_amount)
+        value = (
+            np.abs(amm.quote_asset_reserve - new_quote_asset_reserve)
+            * amm.peg_multiplier
+            / AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO
+        )
+        return np.where(base_amount == 0, 0, value)
+
+    def calculate_position_pnl(self, u) -> np.ndarray:
+        base = self.users.base_asset_amount[:, u]
+        quote = self.users.quote_asset_amount[:, u]
+        value = self.calculate_base_asset_value(base)
+        pnl = np.where(base > 0, value - quote, quote - value)
+        return np.where(base == 0, 0, pnl)
+
+    ## positions
+    def track_new_base_asset(self, u, base_amount_acquired, quote_amount, mask):
+        amm, users = self.amm, self.users
+        base = users.base_asset_amount[:, u]
+
+        mask = mask & ~((base_amount_acquired == 0) & (quote_amount == 0))
+        is_new_position = (base == 0) & (base_amount_acquired != 0)
+        is_long = (is_new_position & (base_amount_acquired > 0)) | (base > 0)
+        base_amount_acquired = np.where(mask, base_amount_acquired, 0)
+        quote_amount = np.where(mask, quote_amount, 0)
+
+        amm.base_asset_amount_long += np.where(is_long, base_amount_acquired, 0)
+        amm.quote_asset_amount_long += np.where(is_long, quote_amount, 0)
+        amm.base_asset_amount_short += np.where(is_long, 0, base_amount_acquired)
+        amm.quote_asset_amount_short += np.where(is_long, 0, quote_amount)
+        amm.base_asset_amount_with_amm += base_amount_acquired
+
+        # (long/short cumulative funding rates are always equal)
+        users.last_cumulative_funding_rate[:, u] = np.where(
+            mask & is_new_position, amm.cumulative_funding_rate_short, users.last_cumulative_funding_rate[:, u]
+        )
+        users.base_asset_amount[:, u] += base_amount_acquired
+        users.quote_asset_amount[:, u] += quote_amount
+
+    def increase(self, quote_amount, direction, u, mask):
+        base_amount_acquired = self.swap_quote_asset(quote_amount, direction, mask)
+        self.track_new_base_asset(u, base_amount_acquired, quote_amount, mask)
+
+    def reduce(self, quote_amount, direction, u, mask):
+        users = self.users
+        prev_base_amount = users.base_asset_amount[:, u].copy()
+        base_amount_acquired = self.swap_quote_asset(quote_amount, direction, mask)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            initial_quote_asset_amount_closed = np.where(
+                mask, users.quote_asset_amount[:, u] * np.abs(base_amount_acquired) / np.abs(prev_base_amount), 0
+            )
+        self.track_new_base_asset(u, base_amount_acquired, -initial_quote_asset_amount_closed, mask)
+
+        pnl = np.where(
+            users.base_asset_amount[:, u] > 0,
+            quote_amount - initial_quote_asset_amount_closed,
+            initial_quote_asset_amount_closed - quote_amount,
+        )
+        users.collateral[:, u] = np.where(
+            mask, calculate_updated_collateral(users.collateral[:, u], pnl), users.collateral[:, u]
+        )
+
+    def close(self, u, mask) -> np.ndarray:
+        users = self.users
+        base = users.base_asset_amount[:, u].copy()
+        quote = users.quote_asset_amount[:, u].copy()
+
+        quote_amount_acquired = self.swap_base_asset(base, mask)
+        pnl = np.where(base > 0, quote_amount_acquired - quote, quote - quote_amount_acquired)
+        users.collateral[:, u] = np.where(
+            mask, calculate_updated_collateral(users.collateral[:, u], pnl), users.collateral[:, u]
+        )
+        self.track_new_base_asset(u, -base, -quote, mask)
+        return quote_amount_acquired
+
+    def update_position_with_quote_asset_amount(self, quote_amount, direction, u, mask):
+        base = self.users.base_asset_amount[:, u]
+        increase_position = (base == 0) | ((base > 0) & (direction > 0)) | ((base < 0) & (direction < 0))
+        base_value_in_quote = self.calculate_base_asset_value(base)
+        reduce_position = ~increase_position & (base_value_in_quote > quote_amount)
+        flip_position = ~increase_position & ~reduce_position
+
+        self.increase(quote_amount, direction, u, mask & increase_position)
+        self.reduce(quote_amount, direction, u, mask & reduce_position)
+        # close then increase in the new direction
+        self.close(u, mask & flip_position)
+        self.increase(quote_amount - base_value_in_quote, direction, u, mask & flip_position)
+
+    def fails_margin_requirements(self, u) -> np.ndarray:
+        users = self.users
+        base_asset_value = self.calculate_base_asset_value(users.base_asset_amount[:, u])
+        # ClearingHouse.check_fails_margin_requirements counts the upnl twice -- kept identical
+        unrealized_pnl = 2 * self.calculate_position_pnl(u)
+        total_collateral = calculate_updated_collateral(users.collateral[:, u], unrealized_pnl)
+        margin_requirement = base_asset_value * self.margin_ratio_initial / MARGIN_PRECISION
+        return total_collateral < margin_requirement
+
+    def apply_fee(self, fee, u, mask):
+        amm = self.amm
+        fee = np.where(mask, fee, 0)
+        self.users.collateral[:, u] += fee
+
+        fee_slice = fee * AMM_RESERVE_PRECISION / self.total_lp_shares
+        amm.total_fee_minus_distributions -= fee_slice / AMM_RESERVE_PRECISION * self.amm_lp_shares
+        amm.cumulative_fee_per_lp -= fee_slice
+        amm.total_fee -= fee
+
+    def settle_funding_rates(self, u, mask):
+        amm, users = self.amm, self.users
+        base = users.base_asset_amount[:, u]
+        last_rate = users.last_cumulative_funding_rate[:, u]
+        amm_cumulative_funding_rate = np.where(
+            base > 0, amm.cumulative_funding_rate_long, amm.cumulative_funding_rate_short
+        )
+        mask = mask & (base != 0) & (last_rate != amm_cumulative_funding_rate)
+
+        funding_payment = -(
+            (amm_cumulative_funding_rate - last_rate)
+            * base
+            / FUNDING_RATE_BUFFER
+            / AMM_TO_QUOTE_PRECISION_RATIO
+        )
+        users.collateral[:, u] += np.where(mask, funding_payment, 0)
+        users.last_cumulative_funding_rate[:, u] = np.where(mask, amm_cumulative_funding_rate, last_rate)
+
+    def update_funding_rate(self, mask):
+        amm = self.amm
+        now = self.time
+        funding_period = self.funding_period
+        last_funding_ts = amm.last_funding_rate_ts
+
+        time_since_last_update = now - last_funding_ts
+        next_update_wait = np.full(self.n_paths, funding_period, dtype=float)
+        if funding_period > 1:
+            last_update_delay = last_funding_ts % funding_period
+            two_funding_periods = funding_period * 2
+            wait = np.where(
+                last_update_delay > funding_period / 3,
+                two_funding_periods - last_update_delay,
+                funding_period - last_update_delay,
+            )
+            wait = np.where(wait > two_funding_periods, wait - funding_period, wait)
+            next_update_wait = np.where(last_update_delay != 0, wait, next_update_wait)
+
+        mask = mask & (time_since_last_update >= next_update_wait)
+        if not mask.any():
+            return
+
+        self.update_mark_twap(mask)
+        self.update_oracle_twap(mask)
+        price_spread = amm.last_mark_price_twap - amm.last_oracle_price_twap
+        max_price_spread = amm.last_oracle_price_twap / 33 # 3% of oracle price
+        clamped_price_spread = np.clip(price_spread, -max_price_spread, max_price_spread)
+        funding_rate = np.where(mask, np.trunc(clamped_price_spread * FUNDING_RATE_BUFFER), 0)
+
+        amm.cumulative_funding_rate_long += funding_rate
+        amm.cumulative_funding_rate_short += funding_rate
+        amm.last_funding_rate = np.where(mask, funding_rate, amm.last_funding_rate)
+        amm.last_funding_rate_ts = np.where(mask, now, amm.last_funding_rate_ts)
+
+    def open_position(self, direction, user_index, quote_amount, mask=None):
+        ''' direction: 'long'/'short' or a +1/-1 array (per path) '''
+        if isinstance(direction, str):
+            direction = 1 if direction == 'long' else -1
+        direction = np.broadcast_to(direction, (self.n_paths,))
+        quote_amount = np.broadcast_to(np.asarray(quote_amount, dtype=float), (self.n_paths,))
+        mask = self.path_mask(mask) & (quote_amount != 0)
+        if not mask.any():
+            return self
+
+        # incase of reverts
+        amm_before, users_before = self.amm.copy(), self.users.copy()
+        u = self.user_columns[user_index]
+
+        self.settle_funding_rates(u, mask)
+        self.update_oracle_twap(mask)
+        self.update_position_with_quote_asset_amount(quote_amount, direction, u, mask)
+
+        # revert the paths which dont meet the margin requirements
+        fails_margin_requirement = mask & self.fails_margin_requirements(u)
+        if fails_margin_requirement.any():
+            self.amm.restore(amm_before, fails_margin_requirement)
+            self.users.restore(users_before, fails_margin_requirement)
+            self.n_margin_reverts += fails_margin_requirement
+        mask = mask & ~fails_margin_requirement
+
+        exchange_fee = -np.abs(quote_amount * self.exchange_fee)
+        self.apply_fee(exchange_fee, u, mask)
+
+        self.update_funding_rate(mask)
+        return self
+
+    def close_position(self, user_index, mask=None):
+        mask = self.path_mask(mask)
+        u = self.user_columns[user_index]
+
+        self.settle_funding_rates(u, mask)
+
+        mask = mask & (self.users.base_asset_amount[:, u] != 0)
+        if not mask.any():
+            return self
+
+        quote_amount = self.close(u, mask)
+        exchange_fee = -np.abs(quote_amount * self.exchange_fee)
+        self.apply_fee(exchange_fee, u, mask)
+
+        self.update_funding_rate(mask)
+        return self
+
+    def to_df(self) -> pd.DataFrame:
+        ''' the final state -- one row per path '''
+        prefix = f'm{self.market_index}'
+        data = {f'{prefix}_{name}': getattr(self.amm, name) for name in BatchedAMM.fields}
+        data[f'{prefix}_mark_price'] = self.mark_price()
+        data[f'{prefix}_oracle_price'] = self.get_oracle_price(self.time)
+        for user_index, u in self.user_columns.items():
+            name = self.usernames[user_index]
+            for field in BatchedUsers.fields:
+                data[f'{name}_{field}'] = getattr(self.users, field)[:, u]
+            data[f'{name}_upnl'] = self.calculate_position_pnl(u)
+        data['n_margin_reverts'] = self.n_margin_reverts
+        data['timestamp'] = np.full(self.n_paths, self.time)
+        return pd.DataFrame(data)
+
+## batched events (mask = the paths it applies to)
+@dataclass
+class BatchedDepositEvent:
+    user_index: int
+    deposit_amount: int
+    username: str = 'u'
+
+    def run(self, bch: BatchedClearingHouse) -> BatchedClearingHouse:
+        return bch.deposit_user_collateral(self.user_index, self.deposit_amount, self.username)
+
+@dataclass
+class BatchedOpenPositionEvent:
+    user_index: int
+    direction: object # 'long'/'short' or +1/-1 per path
+    quote_amount: object
+    mask: np.ndarray = None
+
+    def run(self, bch: BatchedClearingHouse) -> BatchedClearingHouse:
+        return bch.open_position(self.direction, self.user_index, self.quote_amount, self.mask)
+
+@dataclass
+class BatchedClosePositionEvent:
+    user_index: int
+    mask: np.ndarray = None
+
+    def run(self, bch: BatchedClearingHouse) -> BatchedClearingHouse:
+        return bch.close_position(self.user_index, self.mask)
+
+## batched agents (same decisions as the agents in sim.agents, for every path at once)
+class BatchedOpenClose:
+    def __init__(self, agent: OpenClose):
+        self.agent = copy.deepcopy(agent)
+
+    def setup(self, bch: BatchedClearingHouse) -> list:
+        agent = self.agent
+        return [BatchedDepositEvent(agent.user_index, agent.deposit_amount, agent.name)]
+
+    def run(self, bch: BatchedClearingHouse) -> list:
+        agent = self.agent
+        now = bch.time
+        if (now == agent.start_time) or (now > agent.start_time and not agent.has_opened):
+            agent.deposit_start = now
+            agent.has_opened = True
+            amount = np.minimum(agent.quote_amount, bch.amm.quote_asset_reserve)
+            return [BatchedOpenPositionEvent(agent.user_index, agent.direction, amount)]
+        elif agent.has_opened and agent.duration > 0 and now - agent.deposit_start == agent.duration:
+            return [BatchedClosePositionEvent(agent.user_index)]
+        return []
+
+class BatchedArb:
+    def __init__(self, agent: Arb):
+        self.agent = agent
+
+    def setup(self, bch: BatchedClearingHouse) -> list:
+        return [BatchedDepositEvent(self.agent.user_index, 10_000_000 * QUOTE_PRECISION, 'arb')]
+
+    def run(self, bch: BatchedClearingHouse) -> list:
+        agent = self.agent
+        now = bch.time
+        cur_mark = bch.mark_price()
+        target_mark = bch.get_oracle_price(now + agent.lookahead)
+        target_mark = (target_mark - cur_mark) * agent.intensity + cur_mark
+
+        # account for exchange fee in arb price
+        exchange_fee = bch.exchange_fee
+        in_fee_band = (target_mark < cur_mark * (1 + exchange_fee)) & (target_mark > cur_mark * (1 - exchange_fee))
+        target_mark = np.select(
+            [in_fee_band, target_mark > cur_mark, target_mark < cur_mark],
+            [cur_mark, target_mark * (1 - exchange_fee), target_mark * (1 + exchange_fee)],
+            cur_mark,
+        )
+        direction = np.where(target_mark > cur_mark, 1, -1)
+
+        # trade size too small = no trade
+        quote_asset_reserve = (
+            QUOTE_PRECISION * 10_000
+            * AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO
+            / bch.amm.peg_multiplier
+        )
+        mask = quote_asset_reserve >= bch.minimum_quote_asset_trade_size
+        return [BatchedOpenPositionEvent(agent.user_index, direction, QUOTE_PRECISION, mask)]
+
+class BatchedNoise:
+    def __init__(self, agent: Noise):
+        self.agent = agent
+
+    def setup(self, bch: BatchedClearingHouse) -> list:
+        return [BatchedDepositEvent(self.agent.user_index, 10_000_000 * QUOTE_PRECISION, 'noise')]
+
+    def run(self, bch: BatchedClearingHouse) -> list:
+        every_x_minutes = 60 * 5
+        if bch.time % every_x_minutes < every_x_minutes - 1:
+            return []
+        return [BatchedOpenPositionEvent(self.agent.user_index, 'long', int(self.agent.size * 1e6))]
+
+BATCHED_AGENTS = {
+    OpenClose: BatchedOpenClose,
+    Arb: BatchedArb,
+    Noise: BatchedNoise,
+}
+
+def to_batched(agent: Agent):
+    if type(agent) not in BATCHED_AGENTS:
+        raise NotImplementedError(f'no batched version of {type(agent).__name__}')
+    return BATCHED_AGENTS[type(agent)](agent)
+
+def run_batched(agents: list[Agent], market, fee_structure, oracle_prices, timestamps=None, end=None) -> BatchedClearingHouse:
+    ''' runs the agents on every oracle path (rows of oracle_prices) at once
+    (each agent's setup then +1, then every timestep until end -- starts at t0 without 
+    DriftSim.run's null event and doesnt close anyone out) '''
+    bch = BatchedClearingHouse(market, fee_structure, oracle_prices, timestamps)
+    agents = [to_batched(agent) for agent in agents]
+    end = int(bch.timestamps[-1]) if end is None else end
+
+    for agent in agents:
+        for event in agent.setup(bch):
+            bch = event.run(bch)
+        bch = bch.change_time(1)
+
+    while bch.time < end:
+        for agent in agents:
+            for event in agent.run(bch):
+                bch = event.run(bch)
+        bch = bch.change_time(1)
+
+    return bch
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import shutil
+import uuid
+import hashlib
+import functools
+import importlib.metadata
+import numpy as np
+from pathlib import Path
+
+''' content-addressed cache of trial results (events.csv, chs.csv, markets_json.csv)
+
+the key is a hash of everything that determines a run: the initial clearing house
+(markets, oracle data, fee structure, users), the agents (their drawn params, so seeded
+agents are covered), extra run options and the sim code version -- a hit restores the
+artifacts instead of re-running. the cache is bounded in bytes (least recently used evicted)
+'''
+
+ARTIFACTS = ['events.csv', 'chs.csv', 'markets_json.csv']
+COLUMNAR_ARTIFACTS = ['events.csv', 'chs', 'markets_json.csv'] # chs = columnar history dir (see sim.columnar)
+
+def copy_artifact(src: Path, dst: Path):
+    if src.is_dir():
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+def canonical(obj, _seen=None):
+    ''' json-able + deterministic representation of (nested) objects '''
+    if _seen is None:
+        _seen = set()
+
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return ['ndarray', str(obj.dtype), obj.shape, hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest()]
+    if isinstance(obj, np.random.Generator):
+        return ['Generator', canonical(obj.bit_generator.state, _seen)]
+
+    if id(obj) in _seen:
+        return 'cycle'
+    _seen = _seen | {id(obj)}
+
+    if isinstance(obj, dict):
+        return [[str(k), canonical(v, _seen)] for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))]
+    if isinstance(obj, (list, tuple, set)):
+        items = sorted(obj, key=str) if isinstance(obj, set) else obj
+        return [canonical(v, _seen) for v in items]
+    if hasattr(obj, '__dict__'):
+        state = {k: v for k, v in obj.__dict__.items() if not k.startswith('_') and not callable(v)}
+        return [type(obj).__name__, canonical(state, _seen)]
+    return repr(obj)
+
+def hash_json(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+def hash_sources(h, root: Path, paths):
+    for path in sorted(paths):
+        h.update(str(path.relative_to(root)).encode())
+        h.update(path.read_bytes())
+
+@functools.lru_cache()
+def code_version() -> str:
+    ''' hash of the code a run depends on: the sim package, the trial loop 
+    (scripts/workspace/helpers.py) and driftpy (version + source) -- covers uncommitted changes too '''
+    import driftpy
+
+    h = hashlib.sha256()
+    root = Path(__file__).parent
+    hash_sources(h, root, root.rglob('*.py'))
+
+    helpers = root.parent / 'scripts' / 'workspace' / 'helpers.py'
+    if helpers.exists():
+        hash_sources(h, root.parent, [helpers])
+
+    try:
+        version = importlib.metadata.version('driftpy')
+    except importlib.metadata.PackageNotFoundError:
+        version = getattr(driftpy, '__version__', 'unknown') # (from source)
+    h.update(f'driftpy=={version}'.encode())
+    for driftpy_root in driftpy.__path__:
+        hash_sources(h, Path(driftpy_root), Path(driftpy_root).rglob('*.py'))
+    return h.hexdigest()
+
+def trial_key(ch, agents, **options) -> str:
+    data = dict(
+        code=code_version(),
+        markets=[m.to_json(0) for m in ch.markets],
+        oracles=[canonical(m.amm.oracle) for m in ch.markets],
+        fee_structure=canonical(ch.fee_structure),
+        users=canonical(ch.users),
+        time=ch.time,
+        agents=[canonical(agent) for agent in agents],
+        options=canonical(options),
+    )
+    return hash_json(data)
+
+class ResultCache:
+    def __init__(self, root, max_bytes: int = 5 * 1024**3):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+
+    def entry(self, key: str) -> Path:
+        return self.root / key
+
+    def restore(self, key: str, path: Path, artifacts=ARTIFACTS) -> bool:
+        ''' copies the cached artifacts of key into path (True = hit) '''
+        entry = self.entry(key)
+        if not all((entry/name).exists() for name in artifacts):
+            return False
+
+        path.mkdir(exist_ok=True, parents=True)
+        try:
+            for name in artifacts:
+                copy_artifact(entry/name, path/name)
+            os.utime(entry) # mark as recently used
+        except FileNotFoundError:
+            return False # replaced/evicted by another process while copying
+        return True
+
+    def store(self, key: str, path: Path, artifacts=ARTIFACTS):
+        entry = self.entry(key)
+        tmp = self.root / f'.tmp-{key}-{uuid.uuid4().hex}'
+        tmp.mkdir()
+        for name in artifacts:
+            copy_artifact(path/name, tmp/name)
+
+        # the entry only ever appears via a rename of a complete directory so
+        # concurrent runs never see a partial entry. an existing entry (same key =
+        # same results) is kept if it has the artifacts, otherwise it is moved aside
+        # first (a reader then sees a miss, never a half deleted entry)
+        if entry.exists() and all((entry/name).exists() for name in artifacts):
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            old = self.root / f'.old-{key}-{uuid.uuid4().hex}'
+            try:
+                os.rename(entry, old)
+            except FileNotFoundError:
+                pass
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # another process stored it in between -- keep theirs
+                shutil.rmtree(tmp, ignore_errors=True)
+            shutil.rmtree(old, ignore_errors=True)
+        os.utime(entry)
+        self.evict()
+
+    def size(self, entry: Path) -> int:
+        return sum(f.stat().st_size for f in entry.rglob('*') if f.is_file())
+
+    def evict(self):
+        ''' drop the least recently used entries until we fit in max_bytes '''
+        entries = [e for e in self.root.iterdir() if e.is_dir() and not e.name.startswith('.')]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        sizes = {e: self.size(e) for e in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            # moved aside first (like store) so a concurrent restore sees a miss, 
+            # never a half deleted entry
+            evicted = self.root / f'.evict-{entry.name}-{uuid.uuid4().hex}'
+            try:
+                os.rename(entry, evicted)
+            except FileNotFoundError:
+                pass # evicted/replaced by another process
+            else:
+                shutil.rmtree(evicted, ignore_errors=True)
+            total -= sizes[entry]
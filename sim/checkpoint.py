@@ -0,0 +1,100 @@
+import os
+import time
+import pickle
+import random
+import numpy as np
+
+''' periodic checkpoints of a running simulation (clearing house, agents, scheduler,
+rng state, ...) -- resuming from one continues bit-identically
+
+the history (events, clearing house snapshots) only grows, so instead of re-pickling it
+every checkpoint the new entries are appended to {path}.history (like the writer spool)
+and the checkpoint only pickles the live state + the history's offset/lengths -- a
+checkpoint costs O(new events) instead of O(run so far)
+'''
+
+def get_rng_state() -> dict:
+    return dict(np_random=np.random.get_state(), random=random.getstate())
+
+def set_rng_state(state: dict):
+    np.random.set_state(state['np_random'])
+    random.setstate(state['random'])
+
+def save_checkpoint(path, state: dict):
+    ''' pickles the state (+ the global rng state) atomically '''
+    state = state | dict(rng=get_rng_state())
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def read_history(history: dict) -> dict[str, list]:
+    ''' the lists of a checkpoint's history (entries spooled after it are ignored) '''
+    lists = {name: [] for name in history['lengths']}
+    with open(history['path'], 'rb') as f:
+        while f.tell() < history['offset']:
+            name, items = pickle.load(f)
+            lists[name] += items
+    return lists
+
+def load_checkpoint(path) -> dict:
+    ''' loads the state, its history lists (state['history'][name]) and restores the global rng state '''
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    set_rng_state(state.pop('rng'))
+    state['history_spool'] = state['history']
+    state['history'] = read_history(state['history'])
+    return state
+
+class Checkpointer:
+    def __init__(self, path, every_events: int = None, every_seconds: float = None):
+        assert every_events is not None or every_seconds is not None, 'need a checkpoint frequency'
+        # absolute: the history path is saved in the checkpoint (resume from any cwd)
+        self.path = os.path.abspath(path)
+        self.history_path = self.path + '.history'
+        self.history_offset = 0
+        self.history_lengths = {} # name -> entries already spooled
+        self.every_events = every_events
+        self.every_seconds = every_seconds
+        self.last_events = 0
+        self.last_time = time.time()
+
+    def continue_from(self, state: dict, n_events: int):
+        ''' keeps appending to the history of a loaded checkpoint (if it was ours) '''
+        self.last_events = n_events
+        history = state['history_spool']
+        if history['path'] == self.history_path:
+            self.history_offset = history['offset']
+            self.history_lengths = dict(history['lengths'])
+
+    def due(self, n_events: int) -> bool:
+        if self.every_events is not None and n_events - self.last_events >= self.every_events:
+            return True
+        if self.every_seconds is not None and time.time() - self.last_time >= self.every_seconds:
+            return True
+        return False
+
+    def append_history(self, history: dict[str, list]) -> dict:
+        with open(self.history_path, 'ab') as f:
+            # drop anything spooled after the last checkpoint (crash mid save)
+            f.truncate(self.history_offset)
+            for name, items in history.items():
+                start = self.history_lengths.get(name, 0)
+                if len(items) > start:
+                    pickle.dump((name, items[start:]), f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.history_lengths[name] = len(items)
+            f.flush()
+            self.history_offset = f.tell()
+        return dict(path=self.history_path, offset=self.history_offset, lengths=dict(self.history_lengths))
+
+    def save(self, n_events: int, state: dict, history: dict[str, list] = None):
+        ''' history: append only lists (spooled incrementally, not part of state) '''
+        self.last_events = n_events
+        self.last_time = time.time()
+        history = self.append_history({} if history is None else history)
+        save_checkpoint(self.path, state | dict(history=history))
+
+    def maybe_save(self, n_events: int, state_fcn, history: dict[str, list] = None):
+        ''' state_fcn: builds the state (only called when a checkpoint is due) '''
+        if self.due(n_events):
+            self.save(n_events, state_fcn(), history)
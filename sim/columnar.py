@@ -0,0 +1,166 @@
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from sim.writer import StreamingCSVWriter, read_spool, resolve_schema, chunk_to_df
+
+''' columnar binary histories (alternative to chs.csv / simulation_state.csv)
+
+a history is a directory with one .npy file per column + schema.json:
+    {"n_rows": N, "columns": [{"name": "m0_mark_price", "file": "c0.npy", "dtype": "float64"}, ...]}
+
+numeric columns keep their type (reserves, which to_json stringifies, are stored as ints),
+missing values are NaN (floats) and '' (text). load_columns memory-maps the columns lazily so
+opening a huge history is instant and only the columns you touch are read
+'''
+
+SCHEMA = 'schema.json'
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def as_number(value):
+    ''' numeric value of a raw cell (None = not a number) '''
+    if isinstance(value, (bool, np.bool_, int, np.integer, float, np.floating)):
+        return value
+    if isinstance(value, str):
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+        return None
+    return None
+
+class TextColumn:
+    ''' decides the storage dtype of a non numeric (object/str) column '''
+    def __init__(self):
+        self.numeric = True
+        self.ints = True
+        self.missing = False
+        self.width = 1
+
+    def add(self, values):
+        for value in values:
+            if is_missing(value):
+                self.missing = True
+                continue
+            self.width = max(self.width, len(str(value)))
+            number = as_number(value)
+            if number is None:
+                self.numeric = False
+            elif not isinstance(number, (int, np.integer)) or not INT64_MIN <= number <= INT64_MAX:
+                self.ints = False
+
+    def dtype(self):
+        if not self.numeric:
+            return np.dtype(f'U{self.width}')
+        if self.ints and not self.missing:
+            return np.dtype('int64')
+        return np.dtype('float64')
+
+def column_values(series: pd.Series, dtype: np.dtype):
+    if dtype.kind == 'U':
+        return np.array(['' if is_missing(v) else str(v) for v in series], dtype=dtype)
+    if series.dtype.kind in 'iufb':
+        return series.to_numpy(dtype)
+    return np.array([np.nan if is_missing(v) else as_number(v) for v in series], dtype=dtype)
+
+def spool_to_columns(spool_path, path):
+    ''' writes the spooled rows as a columnar history (3 streaming passes over the spool) '''
+    path = Path(path)
+    path.mkdir(exist_ok=True, parents=True)
+
+    schema = resolve_schema(read_spool(spool_path))
+    n_rows = sum(len(chunk) for chunk in read_spool(spool_path))
+
+    # storage dtypes: numeric pandas dtypes as is, object/str columns are parsed
+    text_columns = {c: TextColumn() for c, dtype in schema.items() if dtype.kind not in 'iufb'}
+    if len(text_columns) > 0:
+        for chunk in read_spool(spool_path):
+            df = chunk_to_df(chunk, schema)
+            for column, text in text_columns.items():
+                text.add(df[column])
+    dtypes = {
+        c: text_columns[c].dtype() if c in text_columns else np.dtype(dtype)
+        for c, dtype in schema.items()
+    }
+
+    files = {c: f'c{i}.npy' for i, c in enumerate(schema)}
+    arrays = {
+        c: np.lib.format.open_memmap(path/files[c], mode='w+', dtype=dtypes[c], shape=(n_rows,))
+        for c in schema
+    }
+    start = 0
+    for chunk in read_spool(spool_path):
+        df = chunk_to_df(chunk, schema)
+        end = start + len(df)
+        for column, array in arrays.items():
+            array[start:end] = column_values(df[column], dtypes[column])
+        start = end
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    columns = [dict(name=c, file=files[c], dtype=dtypes[c].str) for c in schema]
+    with open(path/SCHEMA, 'w') as f:
+        json.dump(dict(n_rows=n_rows, columns=columns), f, indent=1)
+
+class ColumnarWriter(StreamingCSVWriter):
+    ''' same interface as StreamingCSVWriter but finalizes to a columnar history directory '''
+    def __init__(self, path, chunk_size: int = 1000, layout=None):
+        super().__init__(str(path).rstrip('/'), chunk_size, layout)
+
+    def finalize(self):
+        spool_to_columns(self.spool_path, self.path)
+
+class ColumnarHistory:
+    ''' lazily memory-mapped columns of a history: history['m0_mark_price'] -> np.ndarray '''
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path/SCHEMA) as f:
+            schema = json.load(f)
+        self.n_rows = schema['n_rows']
+        self.files = {c['name']: c['file'] for c in schema['columns']}
+        self.dtypes = {c['name']: np.dtype(c['dtype']) for c in schema['columns']}
+        self.arrays = {}
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.files.keys())
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, column):
+        return column in self.files
+
+    def __getitem__(self, column) -> np.ndarray:
+        if column not in self.arrays:
+            self.arrays[column] = np.load(self.path/self.files[column], mmap_mode='r')
+        return self.arrays[column]
+
+    def to_df(self, columns: list[str] = None) -> pd.DataFrame:
+        ''' materializes (a subset of) the columns '''
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({c: np.asarray(self[c]) for c in columns})
+
+def load_columns(path) -> ColumnarHistory:
+    return ColumnarHistory(path)
+
+def write_columns(rows, path, chunk_size: int = 1000):
+    ''' rows (eg ch.to_json() for each snapshot) -> columnar history '''
+    writer = ColumnarWriter(path, chunk_size)
+    for row in rows:
+        writer.append(row)
+    writer.close()
+
+def csv_to_columns(csv_path, path, chunk_size: int = 100_000):
+    ''' converts an existing chs.csv / simulation_state.csv '''
+    writer = ColumnarWriter(path, chunk_size)
+    for df in pd.read_csv(csv_path, chunksize=chunk_size):
+        for row in df.to_dict('records'):
+            writer.append(row)
+    writer.close()
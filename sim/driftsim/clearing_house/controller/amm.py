@@ -9,7 +9,7 @@ from driftpy.constants.numeric_constants import *
 import numpy as np 
 
 from sim.driftsim.clearing_house.math.quote_asset import asset_to_reserve_amount, reserve_to_asset_amount
-from sim.driftsim.clearing_house.math.amm import calculate_quote_asset_amount_swapped, update_mark_twap
+from sim.driftsim.clearing_house.math.amm import calculate_quote_asset_amount_swapped
 from sim.driftsim.clearing_house.state.market import SimulationAMM
 
 def swap_quote_asset(
@@ -19,9 +19,9 @@ def swap_quote_asset(
     now,
     use_spread=False,
 ):
-    update_mark_twap(amm, now)
+    amm.twaps.update_mark_twap(now)
 
-    oracle_price = amm.oracle.get_price(now)
+    oracle_price = amm.twaps.get_oracle_price(now)
 
     if use_spread:
         (new_base_asset_amount,
@@ -69,7 +69,7 @@ def swap_base_asset(
     now,
     use_spread=False, 
 ):
-    update_mark_twap(amm, now)
+    amm.twaps.update_mark_twap(now)
 
     if use_spread:
         (new_base_asset_amount,
@@ -7,6 +7,7 @@ def settle_funding_rates(
     user: User, 
     markets: list[Market],
     now: int,
+    headless: bool = False,
 ):
     total_funding_payment = 0 
     for position in user.positions: 
@@ -38,11 +39,12 @@ def settle_funding_rates(
             funding_payment = -funding_payment
 
             total_funding_payment += funding_payment 
-            position.market_funding_payments += funding_payment
+            if not headless:
+                position.market_funding_payments += funding_payment
             
             position.last_cumulative_funding_rate = amm_cumulative_funding_rate
             position.last_funding_rate_ts = now 
             
     # dont pay more than the total number of fees 
-    total_funding_payment = max_collateral_change(user, total_funding_payment)
+    total_funding_payment = max_collateral_change(user, total_funding_payment, headless)
     user.collateral += total_funding_payment
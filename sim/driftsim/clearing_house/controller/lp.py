@@ -1,5 +1,6 @@
 from sim.driftsim.clearing_house.state import User, SimulationMarket
-from sim.driftsim.clearing_house.math.lp import get_lp_metrics
+from sim.driftsim.clearing_house.state import LPMetrics
+from sim.driftsim.clearing_house.math.lp import get_lp_metrics, get_lp_metrics_batch
 from sim.driftsim.clearing_house.helpers import max_collateral_change
 
 ## converts the current virtual lp position into a real position 
@@ -8,9 +9,34 @@ def settle_lp_shares(
     user: User, 
     market: SimulationMarket, 
     lp_token_amount: int, 
+    headless: bool = False,
+):
+    position = user.positions[market.market_index]
+    lp_metrics = get_lp_metrics(position, lp_token_amount, market, headless)
+    return apply_lp_metrics(user, market, lp_metrics, headless)
+
+## settles the full lp_shares of all the users (who are lps) in one pass  
+## same result as calling settle_lp_shares on each user 
+def settle_all_lp_shares(
+    users: list[User], 
+    market: SimulationMarket, 
+    headless: bool = False,
+):
+    positions = [user.positions[market.market_index] for user in users]
+    all_lp_metrics = get_lp_metrics_batch(positions, market, headless)
+    
+    for user, lp_metrics in zip(users, all_lp_metrics):
+        apply_lp_metrics(user, market, lp_metrics, headless)
+
+    return all_lp_metrics
+
+def apply_lp_metrics(
+    user: User, 
+    market: SimulationMarket, 
+    lp_metrics: LPMetrics,
+    headless: bool = False,
 ):
     position = user.positions[market.market_index]
-    lp_metrics = get_lp_metrics(position, lp_token_amount, market)
     
     # print('--- lp settle ---')
     # print(f"metrics :: lp{position.user_index} (baa qaa):", lp_metrics.base_asset_amount, lp_metrics.quote_asset_amount / 1e6)
@@ -35,10 +61,11 @@ def settle_lp_shares(
 
     # payments 
     lp_payment = lp_metrics.fee_payment + lp_metrics.unsettled_pnl + lp_metrics.funding_payment
-    position.lp_funding_payments += lp_metrics.funding_payment
-    position.lp_fee_payments += lp_metrics.fee_payment
+    if not headless: 
+        position.lp_funding_payments += lp_metrics.funding_payment
+        position.lp_fee_payments += lp_metrics.fee_payment
 
-    lp_payment = max_collateral_change(user, lp_payment)
+    lp_payment = max_collateral_change(user, lp_payment, headless)
     user.collateral += lp_payment
     
     assert lp_metrics.unsettled_pnl <= 0, 'shouldnt happen'
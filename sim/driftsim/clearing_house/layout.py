@@ -0,0 +1,196 @@
+import copy
+import numpy as np
+import pandas as pd
+
+from sim.driftsim.clearing_house.state import SimulationMarket, User
+
+''' fixed column layout for ClearingHouse snapshots
+
+ClearingHouse.to_json merges/renames dicts per row and only emits the position columns of
+users with an open position, so the schema changes from row to row. a SnapshotLayout computes
+the column indexs of every market x field, user x field and user x market x field once (when
+the market/user/position first shows up) and writes the values straight into a row of a
+preallocated block by index -- no per row dicts. inactive positions are NaN, columns are only
+ever appended so the schema is stable for the run
+'''
+
+SCALARS = (int, float, str, bool, type(None), np.number)
+
+class MarketColumns:
+    ''' column indexs of one market's fields '''
+    def __init__(self, layout, market_index, market, headless):
+        prefix = f'm{market_index}'
+        self.n_attrs = (len(market.__dict__), len(market.amm.__dict__))
+        self.attrs = [
+            (layout.column(f'{prefix}_{k}'), k)
+            for k in market.__dict__ if k not in SimulationMarket.SKIPPED
+        ]
+        self.amm_attrs = [
+            (layout.column(f'{prefix}_{k}'), k)
+            for k in market.amm.__dict__ if k not in SimulationMarket.AMM_SKIPPED
+        ]
+        # to_json: metrics | market attributes | amm attributes (later ones win)
+        attrs = self.attrs + self.amm_attrs
+        overridden = {i for i, _ in attrs}
+        metrics = [layout.column(f'{prefix}_{k}') for k in market.metric_names(headless)]
+        self.metrics = [(j, i) for j, i in enumerate(metrics) if i not in overridden]
+        self.reserves = [i for i, k in self.amm_attrs if k in SimulationMarket.RESERVES]
+        self.rescaled = list({i for i, k in attrs if k in SimulationMarket.RESCALED})
+        # non scalar attributes are copied (the block is only spooled every chunk_size rows)
+        self.copied = [
+            i for i, k in self.attrs if not isinstance(market.__dict__[k], SCALARS)
+        ] + [
+            i for i, k in self.amm_attrs if not isinstance(market.amm.__dict__[k], SCALARS)
+        ]
+
+    def is_stale(self, market) -> bool:
+        # an attribute was added since the columns were computed
+        return self.n_attrs != (len(market.__dict__), len(market.amm.__dict__))
+
+    def write(self, market, now, headless, out):
+        # attributes are read before metrics() updates base_asset_amount (like to_json)
+        values = market.__dict__
+        for i, k in self.attrs:
+            out[i] = values[k]
+        values = market.amm.__dict__
+        for i, k in self.amm_attrs:
+            out[i] = values[k]
+        metrics = market.metrics(now, headless)
+        for j, i in self.metrics:
+            out[i] = metrics[j]
+
+        for i in self.copied:
+            out[i] = copy.deepcopy(out[i])
+        for i in self.reserves:
+            out[i] = f'{out[i]:.0f}'
+        for i in self.rescaled:
+            out[i] /= 1e6
+
+class SnapshotLayout:
+    def __init__(self):
+        self.columns = []
+        self.index = {}
+        self.markets = [] # market index -> MarketColumns
+        self.users = {} # user index -> (base field indexs, total_collateral index)
+        self.positions = {} # (user index, market index) -> field indexs
+        self.n_positions = {} # user index -> positions with columns
+        self.timestamp = None
+
+    def __len__(self):
+        return len(self.columns)
+
+    def column(self, name) -> int:
+        if name not in self.index:
+            self.index[name] = len(self.columns)
+            self.columns.append(name)
+        return self.index[name]
+
+    def prepare(self, ch) -> int:
+        ''' adds the columns of any new market/user/position in ch (returns the row width) '''
+        for market_index, market in enumerate(ch.markets):
+            if market_index == len(self.markets):
+                self.markets.append(MarketColumns(self, market_index, market, ch.headless))
+            elif self.markets[market_index].is_stale(market):
+                self.markets[market_index] = MarketColumns(self, market_index, market, ch.headless)
+
+        for user_index, user in ch.users.items():
+            prefix = ch.usernames[user_index]
+            if user_index not in self.users:
+                base = [self.column(f'{prefix}_{k}') for k in User.BASE_FIELDS]
+                self.users[user_index] = (base, self.column(f'{prefix}_total_collateral'))
+                self.n_positions[user_index] = 0
+
+            n_positions = self.n_positions[user_index]
+            if n_positions < len(user.positions):
+                for position in user.positions[n_positions:]:
+                    key = (user_index, position.market_index)
+                    if key not in self.positions:
+                        name = f'{prefix}_m{position.market_index}'
+                        self.positions[key] = [
+                            self.column(f'{name}_{k}') for k in User.POSITION_FIELDS + User.POSITION_METRICS
+                        ]
+                self.n_positions[user_index] = len(user.positions)
+
+        if self.timestamp is None:
+            self.timestamp = self.column('timestamp')
+        return len(self)
+
+    def write(self, ch, out: np.ndarray):
+        ''' writes the ch.to_json() values of a prepared ch into out (a NaN row) '''
+        now = ch.time
+        markets = ch.markets
+        for market_index, market in enumerate(markets):
+            self.markets[market_index].write(market, now, ch.headless, out)
+
+        n_fields = len(User.POSITION_FIELDS)
+        for user_index, user in ch.users.items():
+            base, total_collateral = self.users[user_index]
+            # (element wise -- a fancy index assignment would cast the ints to floats)
+            for i, value in zip(base, user.base_values(markets)):
+                out[i] = value
+
+            total_pnl = 0
+            for position in user.positions:
+                if position.base_asset_amount != 0:
+                    indexs = self.positions[(user_index, position.market_index)]
+                    for i, k in zip(indexs, User.POSITION_FIELDS):
+                        out[i] = getattr(position, k)
+                    metrics = user.position_metrics(position, markets)
+                    for i, value in zip(indexs[n_fields:], metrics):
+                        out[i] = value
+                    total_pnl += metrics[0]
+            out[total_collateral] = user.collateral + total_pnl
+
+        out[self.timestamp] = now
+
+    def row(self, ch) -> np.ndarray:
+        ''' the ch.to_json() values in layout order (an object array, NaN = not set) '''
+        out = np.full(self.prepare(ch), np.nan, dtype=object)
+        self.write(ch, out)
+        return out
+
+    def to_json(self, ch) -> dict:
+        ''' ch.to_json() with the layout's (stable) columns '''
+        return dict(zip(self.columns, self.row(ch)))
+
+class SnapshotTable:
+    ''' preallocated 2d block of snapshot rows (grows by doubling) '''
+    def __init__(self, layout: SnapshotLayout = None, capacity: int = 1024):
+        self.layout = SnapshotLayout() if layout is None else layout
+        self.values = np.full((capacity, len(self.layout)), np.nan, dtype=object)
+        self.n_rows = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def reserve(self, n_rows, n_columns):
+        capacity, width = self.values.shape
+        if n_rows <= capacity and n_columns <= width:
+            return
+        if n_rows > capacity:
+            capacity = max(2 * capacity, n_rows)
+        if n_columns > width:
+            width = max(width + width // 2, n_columns) # (users join over the run)
+        values = np.full((capacity, width), np.nan, dtype=object)
+        values[:self.n_rows, :self.values.shape[1]] = self.values[:self.n_rows]
+        self.values = values
+
+    def append_ch(self, ch, event_index: int = None):
+        ''' event_index: written to an event_index column (the first one when given from the start) '''
+        if event_index is not None:
+            i = self.layout.column('event_index')
+        self.reserve(self.n_rows + 1, self.layout.prepare(ch))
+        row = self.values[self.n_rows]
+        self.layout.write(ch, row)
+        if event_index is not None:
+            row[i] = event_index
+        self.n_rows += 1
+
+    @property
+    def block(self) -> np.ndarray:
+        ''' the filled rows x the layout's columns '''
+        return self.values[:self.n_rows, :len(self.layout)]
+
+    def to_df(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.block, columns=self.layout.columns)
+        return df.infer_objects()
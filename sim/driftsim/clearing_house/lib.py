@@ -29,6 +29,14 @@ class ClearingHouse:
     usernames: dict = field(default_factory=dict)
     time: int = 0 
     name: str = ''
+    # skip debug-only bookkeeping/prints/metrics (same core accounting)
+    headless: bool = False
+    # pre-trade peg options (see PegDecisionCache)
+    peg_cache: PegDecisionCache = None
+    peg_once_per_ts: bool = False
+    last_peg_ts: dict = field(default_factory=dict)
+    # open_positions reverted for failing the margin requirement
+    n_margin_reverts: int = 0
             
     def change_time(self, time_delta):
         self.time = self.time + time_delta
@@ -73,7 +81,7 @@ class ClearingHouse:
         # TODO: margin requirements ... 
         
         if user_position.lp_shares > 0:
-            settle_lp_shares(user, market, user_position.lp_shares)
+            settle_lp_shares(user, market, user_position.lp_shares, self.headless)
         else: 
             user_position.last_cumulative_base_asset_amount_with_amm_per_lp = market.amm.cumulative_base_asset_amount_with_amm_per_lp
             user_position.last_cumulative_funding_rate_lp = market.amm.cumulative_funding_payment_per_lp
@@ -104,17 +112,32 @@ class ClearingHouse:
         position: PerpPosition = user.positions[market_index]
 
         if position.lp_shares <= 0:
-            print("warning: trying to settle user who is not an lp")
+            if not self.headless:
+                print("warning: trying to settle user who is not an lp")
             return self
         
         settle_lp_shares(
             user, 
             market, 
-            position.lp_shares # settle the full amount 
+            position.lp_shares, # settle the full amount 
+            self.headless,
         )
 
         return self
 
+    def settle_all_lps(
+        self, 
+        market_index: int, 
+    ):
+        market: SimulationMarket = self.markets[market_index]
+        users = [
+            user for user in self.users.values() 
+            if user.positions[market_index].lp_shares > 0
+        ]
+        settle_all_lp_shares(users, market, self.headless)
+
+        return self
+
     ## burns the lp tokens, earns fees+funding, 
     ## and takes on the AMM's position (for realz)
     def remove_liquidity(
@@ -140,11 +163,12 @@ class ClearingHouse:
         settle_lp_shares(
             user,
             market,
-            position.lp_shares # settle the full amount 
+            position.lp_shares, # settle the full amount 
+            self.headless,
         )
 
         # settle funding on any existing market positions
-        settle_funding_rates(user, self.markets, self.time)
+        settle_funding_rates(user, self.markets, self.time, self.headless)
 
         # give them the market position of the portion 
         position: PerpPosition = user.positions[market_index]
@@ -187,7 +211,7 @@ class ClearingHouse:
                 pnl = quote_amount - quote_closed 
             else: 
                 pnl = quote_closed - quote_amount
-            pnl = max_collateral_change(user, pnl)
+            pnl = max_collateral_change(user, pnl, self.headless)
             user.collateral += pnl 
 
             track_new_base_assset(
@@ -204,7 +228,7 @@ class ClearingHouse:
                 pnl = quote_amount - position.quote_asset_amount
             else: 
                 pnl = position.quote_asset_amount - quote_amount
-            pnl = max_collateral_change(user, pnl)
+            pnl = max_collateral_change(user, pnl, self.headless)
             user.collateral += pnl 
 
             # close position 
@@ -222,7 +246,7 @@ class ClearingHouse:
                 pnl = quote_closed - position.quote_asset_amount
             else:
                 pnl = position.quote_asset_amount - quote_closed
-            pnl = max_collateral_change(user, pnl)
+            pnl = max_collateral_change(user, pnl, self.headless)
             user.collateral += pnl
 
             track_new_base_assset(
@@ -297,8 +321,8 @@ class ClearingHouse:
         
         if time_since_last_update >= next_update_wait:
             # print('updating funding ...')
-            mark_twap = update_mark_twap(market.amm, now) # not MARK_PRICE
-            oracle_twap = update_oracle_twap(market.amm, now) # not MARK_PRICE
+            mark_twap = market.amm.twaps.update_mark_twap(now) # not MARK_PRICE
+            oracle_twap = market.amm.twaps.update_oracle_twap(now) # not MARK_PRICE
             
             # print(mark_twap, oracle_twap)
             price_spread = mark_twap - oracle_twap 
@@ -551,7 +575,7 @@ class ClearingHouse:
         user: User = self.users[user_index]
         position: PerpPosition = user.positions[market_index]
         
-        settle_funding_rates(user, self.markets, self.time)
+        settle_funding_rates(user, self.markets, self.time, self.headless)
 
         if position.lp_shares > 0:
             lp_shares = position.lp_shares
@@ -595,7 +619,7 @@ class ClearingHouse:
         self,
         user_index: int
     ):
-        settle_funding_rates(self.users[user_index], self.markets, self.time)
+        settle_funding_rates(self.users[user_index], self.markets, self.time, self.headless)
         return self
         
     def open_position(
@@ -615,7 +639,7 @@ class ClearingHouse:
         user: User = self.users[user_index]
         position: PerpPosition = user.positions[market_index]
         market = self.markets[market_index]
-        oracle_price = market.amm.oracle.get_price(now)
+        oracle_price = market.amm.twaps.get_oracle_price(now)
         # assert user.positions[market_index].lp_shares == 0, 'Cannot lp and open position'
 
         mark_price_before = calculate_mark_price(market)
@@ -624,41 +648,25 @@ class ClearingHouse:
         budget_cost = max(0, fee_pool)
         # print('BUDGET_COST', budget_cost)
 
-        if 'PreFreePeg' in market.amm.strategies:
-            freepeg_cost, base_scale, quote_scale, new_peg = calculate_freepeg_cost(market, oracle_price, budget_cost)
-            # if abs(freepeg_cost) > 1e-4:
-                # print('NOW:', now)
-                # print(freepeg_cost)
-                # print('freepegging:', 'scales:', base_scale, quote_scale,  'peg:', market.amm.peg_multiplier, '->', new_peg)
-
-            # print('NOW:', now)
-            market.amm.base_asset_reserve *= base_scale
-            market.amm.quote_asset_reserve *= quote_scale
-            market.amm.peg_multiplier = new_peg  
-            market.amm.sqrt_k = np.sqrt(market.amm.base_asset_reserve * market.amm.quote_asset_reserve)
-            market.amm.terminal_quote_asset_reserve = market.amm.sqrt_k**2 / (market.amm.base_asset_reserve+market.amm.base_asset_amount_with_amm)
-            market.amm.total_fee_minus_distributions -= int(freepeg_cost*QUOTE_PRECISION)
-            # print('new price:', calculate_mark_price(market))
-            # print('post fpeg:', market.amm.base_asset_reserve, market.amm.quote_asset_reserve)
-        elif 'PrePeg' in market.amm.strategies:
-            new_peg = calculate_peg_multiplier(market.amm, oracle_price, now, budget_cost=budget_cost)
-            if new_peg != market.amm.peg_multiplier:
-                print('repegging', market.amm.peg_multiplier, '->', new_peg)
-                self.repeg(market.amm, new_peg)        
+        # at most one peg decision per timestamp per market 
+        already_pegged = self.peg_once_per_ts and self.last_peg_ts.get(market_index) == now
+        if not already_pegged:
+            self.pre_trade_peg(market, oracle_price, budget_cost)
+            self.last_peg_ts[market_index] = now
         
         mark_price_before_2 = calculate_mark_price(market)
-        update_mark_price_std(market.amm, self.time, abs(mark_price_before-mark_price_before_2))
+        market.amm.twaps.update_mark_price_std(self.time, abs(mark_price_before-mark_price_before_2))
 
         user: User = self.users[user_index]
         position: PerpPosition = user.positions[market_index]
                         
         # settle funding rates
-        settle_funding_rates(user, self.markets, self.time)
+        settle_funding_rates(user, self.markets, self.time, self.headless)
 
         # update oracle twaps 
         oracle_is_valid = True # TODO 
         if oracle_is_valid: 
-            update_oracle_twap(market.amm, now)
+            market.amm.twaps.update_oracle_twap(now)
         
         # print(market.amm.last_oracle_price)
         # update position 
@@ -676,13 +684,15 @@ class ClearingHouse:
         # check if meets margin requirements -- if not revert 
         fails_margin_requirement = self.check_fails_margin_requirements(user)
         if fails_margin_requirement: 
-            print(f'WARNING: u{user_index} margin requirement not met, reverting...')
+            if not self.headless:
+                print(f'WARNING: u{user_index} margin requirement not met, reverting...')
+            self_copy.n_margin_reverts += 1
             return self_copy
             
         # apply user fee
         # print(quote_amount, float(self.fee_structure.numerator) / float(self.fee_structure.denominator))
         exchange_fee = -abs(quote_amount * float(self.fee_structure.numerator) / float(self.fee_structure.denominator))
-        exchange_fee = max_collateral_change(user, exchange_fee)
+        exchange_fee = max_collateral_change(user, exchange_fee, self.headless)
         self.apply_fee(exchange_fee, user, market)
 
         # total_fee = exchange_fee + quote_asset_amount_surplus
@@ -699,11 +709,82 @@ class ClearingHouse:
 
         return self 
 
+    def pre_trade_peg(self, market: SimulationMarket, oracle_price, budget_cost):
+        now = self.time
+        amm = market.amm
+        
+        if 'PreFreePeg' in amm.strategies:
+            strategy = 'PreFreePeg'
+        elif 'PrePeg' in amm.strategies:
+            strategy = 'PrePeg'
+        else: 
+            return 
+
+        if self.peg_cache is not None: 
+            key = self.peg_cache.key(strategy, amm, oracle_price, now, budget_cost)
+            decision = self.peg_cache.get(key)
+            if decision is not None: 
+                self.apply_peg_decision(amm, decision)
+                return 
+
+        if strategy == 'PreFreePeg':
+            freepeg_cost, base_scale, quote_scale, new_peg = calculate_freepeg_cost(market, oracle_price, budget_cost)
+            # if abs(freepeg_cost) > 1e-4:
+                # print('NOW:', now)
+                # print(freepeg_cost)
+                # print('freepegging:', 'scales:', base_scale, quote_scale,  'peg:', amm.peg_multiplier, '->', new_peg)
+
+            base_asset_reserve = amm.base_asset_reserve * base_scale
+            quote_asset_reserve = amm.quote_asset_reserve * quote_scale
+            sqrt_k = np.sqrt(base_asset_reserve * quote_asset_reserve)
+            terminal_quote_asset_reserve = sqrt_k**2 / (base_asset_reserve+amm.base_asset_amount_with_amm)
+            decision = (
+                base_asset_reserve, 
+                quote_asset_reserve, 
+                new_peg, 
+                sqrt_k, 
+                terminal_quote_asset_reserve, 
+                -int(freepeg_cost*QUOTE_PRECISION)
+            )
+        else: 
+            new_peg = calculate_peg_multiplier(amm, oracle_price, now, budget_cost=budget_cost)
+            if new_peg != amm.peg_multiplier:
+                cost = calculate_repeg_cost(amm, new_peg)
+                fee_delta = -cost*QUOTE_PRECISION
+            else: 
+                fee_delta = None
+            decision = (None, None, new_peg, None, None, fee_delta)
+
+        if self.peg_cache is not None: 
+            self.peg_cache.put(key, decision)
+        self.apply_peg_decision(amm, decision)
+        # print('new price:', calculate_mark_price(market))
+
+    def apply_peg_decision(self, amm: SimulationAMM, decision):
+        base_asset_reserve, quote_asset_reserve, new_peg, sqrt_k, terminal_quote_asset_reserve, fee_delta = decision
+        
+        if base_asset_reserve is None: # repeg 
+            if fee_delta is not None:
+                if not self.headless:
+                    print('repegging', amm.peg_multiplier, '->', new_peg)
+                amm.peg_multiplier = new_peg
+                amm.total_fee_minus_distributions += fee_delta
+            return 
+
+        # freepeg 
+        amm.base_asset_reserve = base_asset_reserve
+        amm.quote_asset_reserve = quote_asset_reserve
+        amm.peg_multiplier = new_peg  
+        amm.sqrt_k = sqrt_k
+        amm.terminal_quote_asset_reserve = terminal_quote_asset_reserve
+        amm.total_fee_minus_distributions += fee_delta
+
     def apply_fee(self, fee, user, market):
-        fee = max_collateral_change(user, fee)
+        fee = max_collateral_change(user, fee, self.headless)
         assert fee < 0, f"fee: {fee}"
         user.collateral += fee 
-        user.positions[market.market_index].market_fee_payments += fee 
+        if not self.headless:
+            user.positions[market.market_index].market_fee_payments += fee 
 
         fee_slice = fee * AMM_RESERVE_PRECISION / market.amm.total_lp_shares
         
@@ -730,7 +811,7 @@ class ClearingHouse:
         now = self.time
         for market_index in range(len(self.markets)):
             prefix = f"m{market_index}" # m0 = 0th market
-            market_data = self.markets[market_index].to_json(now)
+            market_data = self.markets[market_index].to_json(now, self.headless)
             add_prefix(market_data, prefix)
             
             data = data | market_data # combine dicts
@@ -6,11 +6,37 @@ from driftpy.math.amm import (
     calculate_swap_output, 
 )
 from driftpy.types import SwapDirection
+import numpy as np 
+
+def calculate_close_quote_asset_reserve(
+    market: SimulationMarket, 
+    amm_net_position_change: float
+):
+    ''' quote reserve after the amm closes `amm_net_position_change` base '''
+    direction_to_close = {
+        True: SwapDirection.REMOVE,
+        False: SwapDirection.ADD,
+    }[amm_net_position_change > 0]
+
+    if market.amm.base_spread == 0: 
+        new_quote_asset_reserve, _ = calculate_swap_output(
+            abs(amm_net_position_change), 
+            market.amm.base_asset_reserve,
+            direction_to_close,
+            market.amm.sqrt_k
+        )
+    else: 
+        new_quote_asset_reserve = calculate_base_swap_output_with_spread(
+            market.amm, abs(amm_net_position_change), direction_to_close
+        )[1]
+
+    return new_quote_asset_reserve
 
 def get_lp_metrics(
     position: MarketPosition, 
     lp_shares_to_settle: int, 
-    market: SimulationMarket
+    market: SimulationMarket, 
+    headless: bool = False,
 ) -> LPMetrics: 
     lp_token_amount = lp_shares_to_settle
 
@@ -44,22 +70,7 @@ def get_lp_metrics(
     unsettled_pnl = 0 
 
     if amm_net_position_change != 0: 
-        direction_to_close = {
-            True: SwapDirection.REMOVE,
-            False: SwapDirection.ADD,
-        }[amm_net_position_change > 0]
-
-        if market.amm.base_spread == 0: 
-            new_quote_asset_reserve, _ = calculate_swap_output(
-                abs(amm_net_position_change), 
-                market.amm.base_asset_reserve,
-                direction_to_close,
-                market.amm.sqrt_k
-            )
-        else: 
-            new_quote_asset_reserve = calculate_base_swap_output_with_spread(
-                market.amm, abs(amm_net_position_change), direction_to_close
-            )[1]
+        new_quote_asset_reserve = calculate_close_quote_asset_reserve(market, amm_net_position_change)
 
         base_asset_amount = (
             amm_net_position_change
@@ -89,8 +100,9 @@ def get_lp_metrics(
             market_baa = base_asset_amount
             market_qaa = quote_asset_amount
         else:
-            print('warning market position to small')
-            print(f"{base_asset_amount} {min_baa} : {quote_asset_amount} {min_qaa}")
+            if not headless:
+                print('warning market position to small')
+                print(f"{base_asset_amount} {min_baa} : {quote_asset_amount} {min_qaa}")
             tsize = market.amm.minimum_quote_asset_trade_size
             unsettled_pnl = -tsize
         
@@ -103,3 +115,70 @@ def get_lp_metrics(
     )
 
     return lp_metrics
+
+def get_lp_metrics_batch(
+    positions: list[MarketPosition], 
+    market: SimulationMarket, 
+    headless: bool = False,
+) -> list[LPMetrics]: 
+    ''' get_lp_metrics for all of the positions (settling their full lp_shares) in one pass 
+    
+    the amm close-out swap only depends on the lp's last cumulative base per lp -- 
+    so its only simulated once per distinct value (lps settled together share it) '''
+    amm = market.amm
+    if len(positions) == 0:
+        return []
+
+    lp_token_amount = np.array([p.lp_shares for p in positions], dtype=float)
+    last_fee = np.array([p.last_cumulative_fee_per_lp for p in positions], dtype=float)
+    last_funding = np.array([p.last_cumulative_funding_rate_lp for p in positions], dtype=float)
+    last_baa_per_lp = np.array([p.last_cumulative_base_asset_amount_with_amm_per_lp for p in positions], dtype=float)
+
+    # same ops (+ order) as get_lp_metrics 
+    fee_payment = (amm.cumulative_fee_per_lp - last_fee) * lp_token_amount / 1e13
+    change_in_funding = (amm.cumulative_funding_payment_per_lp - last_funding) * -1
+    funding_payment = change_in_funding * lp_token_amount / 1e13
+    amm_net_position_change = (last_baa_per_lp - amm.cumulative_base_asset_amount_with_amm_per_lp) * amm.total_lp_shares
+
+    market_baa = np.zeros(len(positions))
+    market_qaa = np.zeros(len(positions))
+    unsettled_pnl = np.zeros(len(positions))
+
+    changes, change_index = np.unique(amm_net_position_change, return_inverse=True)
+    new_quote_asset_reserves = np.array([
+        calculate_close_quote_asset_reserve(market, float(change)) if change != 0 else amm.quote_asset_reserve
+        for change in changes
+    ])[change_index]
+
+    base_asset_amount = amm_net_position_change * lp_token_amount / amm.total_lp_shares
+    amm_quote_position_change = new_quote_asset_reserves - amm.quote_asset_reserve
+    # python ints to keep the exact rounding of int(..) * peg 
+    quote_asset_amount = np.array([
+        abs(int(x) * amm.peg_multiplier / AMM_TIMES_PEG_TO_QUOTE_PRECISION_RATIO)
+        for x in amm_quote_position_change * lp_token_amount / amm.total_lp_shares
+    ])
+
+    min_baa = amm.base_asset_amount_step_size
+    min_qaa = amm.minimum_quote_asset_trade_size
+    has_change = amm_net_position_change != 0
+    large_enough = (np.abs(base_asset_amount) > min_baa) & (quote_asset_amount > min_qaa)
+
+    is_position = has_change & large_enough
+    market_baa[is_position] = base_asset_amount[is_position]
+    market_qaa[is_position] = quote_asset_amount[is_position]
+
+    too_small = has_change & ~large_enough
+    if too_small.any() and not headless:
+        print(f'warning {too_small.sum()} market positions to small')
+    unsettled_pnl[too_small] = -amm.minimum_quote_asset_trade_size
+
+    return [
+        LPMetrics(
+            base_asset_amount=float(market_baa[i]) if is_position[i] else 0, 
+            quote_asset_amount=float(market_qaa[i]) if is_position[i] else 0, 
+            fee_payment=float(fee_payment[i]), 
+            funding_payment=float(funding_payment[i]), 
+            unsettled_pnl=float(unsettled_pnl[i]) if too_small[i] else 0
+        )
+        for i in range(len(positions))
+    ]
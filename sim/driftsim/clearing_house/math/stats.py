@@ -1,3 +1,36 @@
+def calculate_weighted_average(
+    data1, 
+    data2, 
+    weight1, 
+    weight2
+):
+    denominator = weight1 + weight2
+    prev_twap_99 = data1 * weight1
+    latest_price_01 = data2 * weight2
+    
+    result = (
+        (prev_twap_99 + latest_price_01) / denominator
+    )
+    return result
+
+def calculate_new_twap(
+    last_twap, 
+    last_twap_ts, 
+    current_value, 
+    now, 
+    funding_period
+):
+    since_last = max(1, now - last_twap_ts)
+    from_start = max(1, funding_period - since_last)
+    
+    new_twap = calculate_weighted_average(
+        current_value, 
+        last_twap, 
+        since_last, 
+        from_start
+    )
+    return new_twap 
+
 def calculate_rolling_average(
     data1, 
     data2, 
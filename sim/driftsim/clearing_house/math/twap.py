@@ -0,0 +1,125 @@
+from operator import attrgetter
+
+from driftpy.types import PositionDirection
+from driftpy.math.amm import calculate_mark_price_amm, calculate_bid_price_amm, calculate_ask_price_amm
+
+from sim.driftsim.clearing_house.math.stats import calculate_new_twap, calculate_rolling_average
+
+ONE_MIN = 60
+
+class TWAPAccumulator:
+    ''' the mark/bid/ask/oracle twap, mark std and intensity updates of one amm (amm.twaps)
+
+    every update goes through this component: the oracle is read once per timestamp
+    and the bid/ask quotes are memoized on the timestamp + the amm fields the spread
+    math reads (like PegDecisionCache) so a hit gives the exact same quotes as
+    recomputing them. the twaps themselves stay amm fields (to_json/driftpy math
+    are unchanged) and same-timestamp updates still roll one after the other
+    '''
+    # amm fields read by calculate_bid/ask_price_amm (spread + peg math)
+    QUOTE_FIELDS = (
+        'base_asset_reserve', 'quote_asset_reserve', 'sqrt_k', 'terminal_quote_asset_reserve',
+        'base_asset_amount_with_amm', 'peg_multiplier', 'quote_asset_amount_long', 'quote_asset_amount_short',
+        'total_fee', 'total_exchange_fee', 'total_fee_minus_distributions',
+        'base_spread', 'max_spread', 'mark_std', 'last_oracle_price', 'strategies',
+    )
+    quote_fields = attrgetter(*QUOTE_FIELDS)
+
+    def __init__(self, amm):
+        self.amm = amm
+        self.oracle = None
+        self.oracle_ts = None
+        self.oracle_price = None
+        self.quotes_key = None
+        self.quotes = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_oracle_price(self, now: int) -> float:
+        oracle = self.amm.oracle
+        if now != self.oracle_ts or oracle is not self.oracle:
+            self.oracle_price = oracle.get_price(now)
+            self.oracle = oracle
+            self.oracle_ts = now
+        return self.oracle_price
+
+    def get_quotes(self, now: int) -> tuple:
+        ''' (bid price, ask price) of the current amm state '''
+        amm = self.amm
+        oracle_price = self.get_oracle_price(now)
+        key = (now, oracle_price, self.quote_fields(amm))
+        if 'PrePeg' in amm.strategies:
+            # peg multiplier reads the mark twap
+            key += (amm.last_mark_price_twap, amm.last_mark_price_twap_ts)
+
+        if key == self.quotes_key:
+            self.hits += 1
+            bid_price, ask_price, last_spread = self.quotes
+            if last_spread is not None:
+                amm.last_spread = last_spread # (the spread math sets it)
+            return bid_price, ask_price
+
+        self.misses += 1
+        bid_price = calculate_bid_price_amm(amm, oracle_price) #* PRICE_PRECISION
+        ask_price = calculate_ask_price_amm(amm, oracle_price) #* PRICE_PRECISION
+        self.quotes_key = key
+        self.quotes = (bid_price, ask_price, getattr(amm, 'last_spread', None))
+        return bid_price, ask_price
+
+    def roll(self, last_twap, last_twap_ts, value, now: int):
+        return calculate_new_twap(last_twap, last_twap_ts, value, now, self.amm.funding_period)
+
+    def update_oracle_twap(self, now: int):
+        amm = self.amm
+        new_oracle_twap = self.roll(
+            amm.last_oracle_price_twap,
+            amm.last_oracle_price_twap_ts,
+            amm.last_oracle_price,
+            now
+        )
+
+        amm.last_oracle_price = self.get_oracle_price(now)
+        amm.last_oracle_price_twap = new_oracle_twap
+        amm.last_oracle_price_twap_ts = now
+
+        return new_oracle_twap
+
+    def update_mark_twap(self, now: int):
+        amm = self.amm
+        mark_price = calculate_mark_price_amm(amm)
+        last_twap_ts = amm.last_mark_price_twap_ts
+
+        new_mark_twap = self.roll(amm.last_mark_price_twap, last_twap_ts, mark_price, now)
+        new_bid_twap = self.roll(amm.last_bid_price_twap, last_twap_ts, amm.bid_price_before, now)
+        new_ask_twap = self.roll(amm.last_ask_price_twap, last_twap_ts, amm.ask_price_before, now)
+
+        amm.last_mark_price_twap = new_mark_twap
+        amm.last_bid_price_twap = new_bid_twap
+        amm.last_ask_price_twap = new_ask_twap
+        amm.last_mark_price_twap_ts = now
+
+        amm.bid_price_before, amm.ask_price_before = self.get_quotes(now)
+
+        return new_mark_twap
+
+    def update_mark_price_std(self, now: int, price_change):
+        amm = self.amm
+        since_last = now - amm.last_mark_price_twap_ts
+        amm.mark_std = calculate_rolling_average(amm.mark_std, abs(price_change), since_last, ONE_MIN*60)
+
+    def update_intensity(self, now: int, quote_asset_amount, direction: PositionDirection):
+        amm = self.amm
+        since_last = now - amm.last_mark_price_ts
+
+        amm.last_buy_intensity = calculate_rolling_average(
+            amm.last_buy_intensity,
+            abs(quote_asset_amount) if direction == PositionDirection.LONG else 0,
+            since_last,
+            ONE_MIN
+        )
+        amm.last_sell_intensity = calculate_rolling_average(
+            amm.last_sell_intensity,
+            abs(quote_asset_amount) if direction == PositionDirection.SHORT else 0,
+            since_last,
+            ONE_MIN
+        )
@@ -3,3 +3,4 @@ from sim.driftsim.clearing_house.state.oracle import *
 from sim.driftsim.clearing_house.state.state import *
 from sim.driftsim.clearing_house.state.user import *
 from sim.driftsim.clearing_house.state.lp import *
+from sim.driftsim.clearing_house.state.peg import *
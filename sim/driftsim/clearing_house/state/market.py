@@ -90,6 +90,10 @@ class SimulationAMM(AMM):
         self.last_funding_rate_ts = now
         self.mark_std = 0
 
+        # twap/std/intensity updates (math imports state so it's imported here)
+        from sim.driftsim.clearing_house.math.twap import TWAPAccumulator
+        self.twaps = TWAPAccumulator(self)
+
 @dataclass
 class SimulationMarket(Market): 
     amm: SimulationAMM
@@ -104,52 +108,62 @@ class SimulationMarket(Market):
         for a in args: 
             setattr(self, a, args[a])
 
-    def to_json(self, now):
+    # to_json's computed (non attribute) values
+    METRICS = ('mark_price', 'oracle_price', 'bid_price', 'ask_price')
+    DEBUG_METRICS = ('wouldbe_peg', 'wouldbe_peg_cost', 'predicted_long_funding', 'predicted_short_funding')
+    # attributes to_json leaves out / stringifies / rescales
+    SKIPPED = ("amm", "pubkey", "pnl_pool")
+    AMM_SKIPPED = ("oracle", "twaps")
+    RESERVES = ('base_asset_reserve', 'quote_asset_reserve')
+    RESCALED = ('total_fee', 'total_mm_fees', 'total_exchange_fees', 'total_fee_minus_distributions')
+
+    @classmethod
+    def metric_names(cls, headless=False) -> tuple:
+        if headless:
+            return cls.METRICS + ('last_mid_price_twap',)
+        return cls.METRICS + cls.DEBUG_METRICS + ('last_mid_price_twap', 'repeg_to_oracle_cost')
+
+    def metrics(self, now, headless=False) -> tuple:
+        ''' the computed values in metric_names(headless) order '''
         # current prices 
-        mark_price = calculate_mark_price(self)
-        oracle_price = self.amm.oracle.get_price(now)
-        
-        market_dict = copy.deepcopy(self.__dict__)
-        market_dict.pop("amm")
-        market_dict.pop("pubkey")
-        market_dict.pop("pnl_pool")
-        
-        amm_dict = copy.deepcopy(self.amm.__dict__)
-        amm_dict.pop("oracle")
-        b1 = amm_dict['base_asset_reserve']
-        q1 = amm_dict['quote_asset_reserve']
-        amm_dict['base_asset_reserve'] = f'{b1:.0f}'
-        amm_dict['quote_asset_reserve'] = f'{q1:.0f}'
+        oracle_price = self.amm.twaps.get_oracle_price(now)
 
         self.base_asset_amount = self.amm.base_asset_amount_with_amm
         mark_price = calculate_mark_price(self, oracle_price)
         bid_price = calculate_bid_price(self, oracle_price)
         ask_price = calculate_ask_price(self, oracle_price)
+        last_mid_price_twap = (self.amm.last_bid_price_twap + self.amm.last_ask_price_twap)/2
+
+        values = (mark_price, oracle_price, bid_price, ask_price)
+        if headless:
+            return values + (last_mid_price_twap,)
+
+        # debug-only metrics 
         peg = calculate_peg_multiplier(self.amm, oracle_price)
         wouldbe_peg_cost = calculate_repeg_cost(self.amm, peg)
-        
         long_funding, short_funding = calculate_long_short_funding(self)
-        predicted_long_funding = long_funding
-        predicted_short_funding = short_funding
-        last_mid_price_twap = (amm_dict['last_bid_price_twap']+amm_dict['last_ask_price_twap'])/2
         repeg_to_oracle_cost = calculate_repeg_cost(self.amm, int(oracle_price * 1e3))
-                    
+
+        return values + (
+            peg/1e3, wouldbe_peg_cost, long_funding, short_funding, 
+            last_mid_price_twap, repeg_to_oracle_cost, 
+        )
+
+    def to_json(self, now, headless=False):
+        # (attributes are read before metrics() updates base_asset_amount)
+        market_dict = {k: v for k, v in self.__dict__.items() if k not in self.SKIPPED}
+        market_dict = copy.deepcopy(market_dict)
+        
+        amm_dict = copy.deepcopy({k: v for k, v in self.amm.__dict__.items() if k not in self.AMM_SKIPPED})
+        for key in self.RESERVES:
+            amm_dict[key] = f'{amm_dict[key]:.0f}'
+
         # all in one 
-        data = dict(
-            mark_price=mark_price, 
-            oracle_price=oracle_price,
-            bid_price=bid_price, 
-            ask_price=ask_price, 
-            wouldbe_peg=peg/1e3, 
-            wouldbe_peg_cost=wouldbe_peg_cost, 
-            predicted_long_funding=predicted_long_funding,
-            predicted_short_funding=predicted_short_funding,
-            last_mid_price_twap=last_mid_price_twap,
-            repeg_to_oracle_cost=repeg_to_oracle_cost
-        ) | market_dict | amm_dict
+        data = dict(zip(self.metric_names(headless), self.metrics(now, headless)))
+        data = data | market_dict | amm_dict
         
         # rescale
-        for key in ['total_fee', 'total_mm_fees', 'total_exchange_fees', 'total_fee_minus_distributions']:
+        for key in self.RESCALED:
             if key in data:
                 data[key] /= 1e6
         
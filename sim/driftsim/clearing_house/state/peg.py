@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+class PegDecisionCache:
+    ''' caches the outcome of the pre-trade peg/freepeg in open_position
+
+    keyed on everything the peg math reads (oracle price, reserves, peg, ...)
+    so a hit gives the exact same amm state as recomputing it.
+    shared across deepcopies of the clearing house (snapshots/reverts)
+    '''
+    def __init__(self, max_size: int = 100_000, budget_resolution: float = None):
+        self.max_size = max_size
+        # None = key on the exact budget, otherwise budgets in the same bucket share a decision
+        self.budget_resolution = budget_resolution
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def budget_bucket(self, budget_cost):
+        if self.budget_resolution is None:
+            return budget_cost
+        return round(budget_cost / self.budget_resolution)
+
+    def key(self, strategy: str, amm, oracle_price, now: int, budget_cost):
+        key = (
+            strategy,
+            oracle_price,
+            amm.base_asset_reserve,
+            amm.quote_asset_reserve,
+            amm.sqrt_k,
+            amm.terminal_quote_asset_reserve,
+            amm.base_asset_amount_with_amm,
+            amm.peg_multiplier,
+            self.budget_bucket(budget_cost),
+        )
+        if strategy == 'PrePeg':
+            # peg multiplier reads the mark twap
+            key += (amm.last_mark_price_twap, now - amm.last_mark_price_twap_ts)
+        return key
+
+    def get(self, key):
+        decision = self.decisions.get(key)
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.decisions.move_to_end(key)
+        return decision
+
+    def put(self, key, decision):
+        self.decisions[key] = decision
+        if len(self.decisions) > self.max_size:
+            self.decisions.popitem(last=False)
@@ -1,5 +1,5 @@
 import copy 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 
 from driftpy.math.positions import calculate_position_pnl, calculate_position_funding_pnl
 from driftpy.math.market import calculate_mark_price
@@ -45,40 +45,59 @@ class User:
     open_orders: int = 0 
     cumulative_deposits: int = 0 
     
+    BASE_FIELDS = (
+        'collateral', 'free_collateral', 'margin_ratio', 'total_position_value', 
+        'total_fee_paid', 'total_fee_rebate', 'open_orders', 'cumulative_deposits',
+    )
+    # position fields (minus market_index) + pnl metrics
+    POSITION_FIELDS = tuple(f.name for f in fields(MarketPosition) if f.name != 'market_index')
+    POSITION_METRICS = ('upnl', 'upnl_noslip', 'ufunding')
+
+    def base_values(self, markets) -> tuple:
+        ''' in BASE_FIELDS order '''
+        return (
+            self.collateral,
+            get_free_collateral(self, markets),
+            get_margin_ratio(self, markets),
+            get_total_position_value(self.positions, markets),
+            self.total_fee_paid,
+            self.total_fee_rebate,
+            self.open_orders,
+            self.cumulative_deposits,
+        )
+
+    def base_json(self, markets):
+        return dict(zip(self.BASE_FIELDS, self.base_values(markets)))
+
+    def position_metrics(self, position, markets) -> tuple:
+        ''' in POSITION_METRICS order '''
+        market = markets[position.market_index]
+        mark = calculate_mark_price(market)
+        position_pnl = calculate_position_pnl(market, position)
+        
+        if position.base_asset_amount > 0:
+            upnl_noslip = mark*position.base_asset_amount/AMM_RESERVE_PRECISION - position.quote_asset_amount
+        else:
+            upnl_noslip = position.quote_asset_amount - mark*position.base_asset_amount/AMM_RESERVE_PRECISION
+
+        return position_pnl, upnl_noslip, calculate_position_funding_pnl(market, position)
+
+    def position_json(self, position, markets):
+        position_data = copy.deepcopy(position.__dict__)
+        position_data.pop("market_index")
+        position_data |= dict(zip(self.POSITION_METRICS, self.position_metrics(position, markets)))
+        return position_data
+
     def to_json(self, clearing_house):
         markets = clearing_house.markets
-        data = dict(
-            collateral=self.collateral,
-            free_collateral=get_free_collateral(self, markets),
-            margin_ratio=get_margin_ratio(self, markets),
-            total_position_value=get_total_position_value(self.positions, markets),
-            total_fee_paid=self.total_fee_paid,
-            total_fee_rebate=self.total_fee_rebate,
-            open_orders=self.open_orders,
-            cumulative_deposits=self.cumulative_deposits,
-        )
+        data = self.base_json(markets)
         
         total_pnl = 0 
         for position in self.positions:
             if position.base_asset_amount != 0: 
                 name = f"m{position.market_index}"
-                position_data = copy.deepcopy(position.__dict__)
-                position_data.pop("market_index")
-                
-                market = clearing_house.markets[position.market_index]
-                mark = calculate_mark_price(market)
-                position_pnl = calculate_position_pnl(market, position)
-                position_data['upnl'] = position_pnl
-                
-                if position.base_asset_amount > 0:
-                    upnl_noslip = mark*position.base_asset_amount/AMM_RESERVE_PRECISION - position.quote_asset_amount
-                else:
-                    upnl_noslip = position.quote_asset_amount - mark*position.base_asset_amount/AMM_RESERVE_PRECISION
-
-                position_data['upnl_noslip'] = upnl_noslip
-                position_data['ufunding'] = calculate_position_funding_pnl(market, position)
-                
-                total_pnl += position_pnl
+                position_data = self.position_json(position, markets)
+                total_pnl += position_data['upnl']
                 
                 add_prefix(position_data, name)        
                 data = data | position_data
@@ -86,4 +105,3 @@ class User:
         data["total_collateral"] = data["collateral"] + total_pnl
         
         return data
-
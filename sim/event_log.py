@@ -0,0 +1,290 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+''' typed binary event log (alternative to events.csv)
+
+a log is a directory:
+    index.npy          (timestamp, type, row) of every event in order
+    t{k}.npy           one structured array per event type (its parameters as typed fields)
+    users.npy / markets.npy, *_offsets.npy, *_events.npy
+                       per user / market index the positions of its events (csr)
+    schema.json        the event types and how each field is stored
+
+everything is memory-mapped on load so opening, filtering (by type / user / market / time)
+and reading the fields of one type never copies -- only event(i) builds a python Event
+
+    log = load_event_log('experiments/init/lunaCrash/event_log')
+    log = cached_event_log('experiments/init/lunaCrash/events.csv', ...) # (re)converted when the csv changes
+    log.of_type('open_position')['quote_amount']   # np.ndarray (memmap)
+    log.for_user(3)                                # positions of user 3's events
+    [log.event(i) for i in log.between(0, 60)]     # Events
+'''
+
+SCHEMA = 'schema.json'
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+def index_dtype(timestamp_kind='int'):
+    return np.dtype([('timestamp', 'i8' if timestamp_kind == 'int' else 'f8'), ('type', 'i2'), ('row', 'i8')])
+
+def event_parameters(event) -> dict:
+    ''' the parameters of an event as in events.csv (sorted, without timestamp / _event_name) '''
+    return {k: v for k, v in sorted(event.__dict__.items()) if k not in ('timestamp', '_event_name')}
+
+def is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+def is_float(value):
+    return isinstance(value, (float, np.floating))
+
+def field_kind(values) -> str:
+    ''' how a parameter is stored: bool / int / float / number (mixed int + float: an f8
+    column of every value + the ints exactly in an i8 column + an int flag) / str / json
+    (anything else, as its json string) '''
+    if all(isinstance(v, (bool, np.bool_)) for v in values):
+        return 'bool'
+    if all(is_int(v) and INT64_MIN <= v <= INT64_MAX for v in values):
+        return 'int'
+    if all(is_float(v) for v in values):
+        return 'float'
+    if all((is_int(v) and INT64_MIN <= v <= INT64_MAX) or is_float(v) for v in values):
+        return 'number'
+    if all(isinstance(v, str) for v in values):
+        return 'str'
+    return 'json'
+
+def encode_table(rows: list[dict]) -> tuple[np.ndarray, list[dict]]:
+    ''' parameter dicts (of one event type) -> structured array + field schema '''
+    names = []
+    for row in rows:
+        for name in row:
+            if name not in names:
+                names.append(name)
+
+    columns, dtypes, fields = {}, [], []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        kind = field_kind(values)
+        if kind == 'json':
+            values = [json.dumps(v) for v in values]
+        if kind in ('str', 'json'):
+            dtypes.append((name, f'U{max([1] + [len(v) for v in values])}'))
+        else:
+            dtypes.append((name, {'bool': '?', 'int': 'i8'}.get(kind, 'f8')))
+        columns[name] = values
+        if kind == 'number':
+            # (the f8 column alone would round big ints)
+            dtypes.append((f'{name}:int', 'i8'))
+            columns[f'{name}:int'] = [v if is_int(v) else 0 for v in values]
+            dtypes.append((f'{name}:is_int', '?'))
+            columns[f'{name}:is_int'] = [is_int(v) for v in values]
+        fields.append(dict(name=name, kind=kind))
+
+    table = np.empty(len(rows), dtype=np.dtype(dtypes))
+    for name, values in columns.items():
+        table[name] = values
+    return table, fields
+
+def decode_value(record, field):
+    name, kind = field['name'], field['kind']
+    value = record[name]
+    if kind == 'bool':
+        return bool(value)
+    if kind == 'int':
+        return int(value)
+    if kind == 'float':
+        return float(value)
+    if kind == 'number':
+        return int(record[f'{name}:int']) if record[f'{name}:is_int'] else float(value)
+    if kind == 'str':
+        return str(value)
+    return json.loads(str(value))
+
+def csr(keys: np.ndarray, positions: np.ndarray):
+    ''' key -> positions with that key: (unique keys, offsets, positions grouped by key) '''
+    order = np.argsort(keys, kind='stable')
+    ids, counts = np.unique(keys[order], return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return ids.astype(np.int64), offsets, positions[order].astype(np.int64)
+
+def write_rows(rows, path, **info):
+    ''' rows = (event_name, timestamp, parameters dict) in order -> event log at path 
+    (info: extra schema.json entries) '''
+    path = Path(path)
+    path.mkdir(exist_ok=True, parents=True)
+    rows = list(rows)
+
+    # (float timestamps are kept as floats)
+    timestamp_kind = 'int' if all(is_int(row[1]) for row in rows) else 'float'
+    names = []
+    type_rows = {}
+    index = np.empty(len(rows), dtype=index_dtype(timestamp_kind))
+    user_keys, user_positions, market_keys, market_positions = [], [], [], []
+    for i, (event_name, timestamp, params) in enumerate(rows):
+        if event_name not in type_rows:
+            names.append(event_name)
+            type_rows[event_name] = []
+        index[i] = (timestamp, names.index(event_name), len(type_rows[event_name]))
+        type_rows[event_name].append(params)
+
+        if is_int(params.get('user_index')):
+            user_keys.append(params['user_index'])
+            user_positions.append(i)
+        if is_int(params.get('market_index')):
+            market_keys.append(params['market_index'])
+            market_positions.append(i)
+
+    types = []
+    for k, event_name in enumerate(names):
+        table, fields = encode_table(type_rows[event_name])
+        np.save(path/f't{k}.npy', table)
+        types.append(dict(name=event_name, file=f't{k}.npy', fields=fields))
+    np.save(path/'index.npy', index)
+
+    for group, keys, positions in [('users', user_keys, user_positions), ('markets', market_keys, market_positions)]:
+        ids, offsets, grouped = csr(np.array(keys, dtype=np.int64), np.array(positions, dtype=np.int64))
+        np.save(path/f'{group}.npy', ids)
+        np.save(path/f'{group}_offsets.npy', offsets)
+        np.save(path/f'{group}_events.npy', grouped)
+
+    is_sorted = bool(np.all(np.diff(index['timestamp']) >= 0))
+    with open(path/SCHEMA, 'w') as f:
+        json.dump(dict(n_events=len(rows), sorted=is_sorted, timestamp_kind=timestamp_kind, types=types) | info, f, indent=1)
+
+def write_event_log(events, path):
+    ''' Events -> event log (null events are skipped, like events.csv) '''
+    write_rows(
+        ((e._event_name, e.timestamp, event_parameters(e)) for e in events if e._event_name != 'null'),
+        path,
+    )
+
+def csv_to_event_log(csv_path, path, **info):
+    df = pd.read_csv(csv_path)
+    parameters = json.loads('[' + ','.join(df['parameters']) + ']')
+    write_rows(zip(df['event_name'], df['timestamp'].to_numpy().tolist(), parameters), path, **info)
+
+def file_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def cached_event_log(csv_path, path) -> 'EventLog':
+    ''' the event log of an events.csv -- converted when missing or when the csv changed since 
+    (its hash is kept in schema.json). the log is written to a temp dir and renamed into 
+    place so a crash (or a concurrent reader) never sees a partial log '''
+    path = Path(path)
+    csv_hash = file_hash(csv_path)
+    if (path/SCHEMA).exists():
+        with open(path/SCHEMA) as f:
+            if json.load(f).get('csv_hash') == csv_hash:
+                return EventLog(path)
+
+    tmp = path.parent / f'.{path.name}.tmp-{uuid.uuid4().hex}'
+    csv_to_event_log(csv_path, tmp, csv_hash=csv_hash)
+    old = path.parent / f'.{path.name}.old-{uuid.uuid4().hex}'
+    if path.exists():
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return EventLog(path)
+
+class EventLog:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path/SCHEMA) as f:
+            schema = json.load(f)
+        self.n_events = schema['n_events']
+        self.sorted = schema['sorted']
+        self.types = schema['types']
+        self.names = [t['name'] for t in self.types]
+
+        load = lambda name: np.load(self.path/name, mmap_mode='r')
+        self.index = load('index.npy')
+        self.tables = [load(t['file']) for t in self.types]
+        self.groups = {
+            group: (load(f'{group}.npy'), load(f'{group}_offsets.npy'), load(f'{group}_events.npy'))
+            for group in ('users', 'markets')
+        }
+        self._event_types = None
+
+    def __len__(self):
+        return self.n_events
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.index['timestamp']
+
+    def name(self, i) -> str:
+        return self.names[self.index['type'][i]]
+
+    def of_type(self, event_name) -> np.ndarray:
+        ''' the structured array of all events of a type (empty if there are none) '''
+        if event_name not in self.names:
+            return np.empty(0)
+        return self.tables[self.names.index(event_name)]
+
+    def positions_of_type(self, event_name) -> np.ndarray:
+        if event_name not in self.names:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.index['type'] == self.names.index(event_name))
+
+    def group(self, group, key) -> np.ndarray:
+        ids, offsets, positions = self.groups[group]
+        k = np.searchsorted(ids, key)
+        if k == len(ids) or ids[k] != key:
+            return np.empty(0, dtype=np.int64)
+        return positions[offsets[k]:offsets[k + 1]]
+
+    def for_user(self, user_index) -> np.ndarray:
+        return self.group('users', user_index)
+
+    def for_market(self, market_index) -> np.ndarray:
+        return self.group('markets', market_index)
+
+    def user_indexs(self) -> np.ndarray:
+        return self.groups['users'][0]
+
+    def between(self, start, end) -> np.ndarray:
+        ''' positions of the events with start <= timestamp < end '''
+        timestamps = self.timestamps
+        if self.sorted:
+            return np.arange(np.searchsorted(timestamps, start), np.searchsorted(timestamps, end))
+        return np.flatnonzero((timestamps >= start) & (timestamps < end))
+
+    def parameters(self, i) -> dict:
+        _, k, row = self.index[i]
+        record = self.tables[k][row]
+        return {field['name']: decode_value(record, field) for field in self.types[k]['fields']}
+
+    def event(self, i):
+        ''' the i-th Event (see sim.events) '''
+        if self._event_types is None:
+            from sim.replay import event_types
+            self._event_types = event_types()
+        timestamp = self.index['timestamp'][i].item()
+        return self._event_types[self.name(i)](timestamp=timestamp, **self.parameters(i))
+
+    def __iter__(self):
+        for i in range(self.n_events):
+            yield self.event(i)
+
+    def to_df(self) -> pd.DataFrame:
+        ''' the events.csv rows '''
+        return pd.DataFrame(dict(
+            event_name=[self.name(i) for i in range(self.n_events)],
+            timestamp=self.timestamps,
+            parameters=[json.dumps(self.parameters(i)) for i in range(self.n_events)],
+        ))
+
+def load_event_log(path) -> EventLog:
+    return EventLog(path)
+
+def event_log_to_csv(path, csv_path):
+    load_event_log(path).to_df().to_csv(csv_path, index=False)
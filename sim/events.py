@@ -1,17 +1,14 @@
-from driftpy.accounts import *
-from driftpy.clearing_house import ClearingHouse as SDKClearingHouse
-from driftpy.setup.helpers import get_feed_data
-from driftpy.math.amm import calculate_price
 from driftpy.constants.numeric_constants import AMM_RESERVE_PRECISION, QUOTE_PRECISION
-from driftpy.clearing_house import ClearingHouse as ClearingHouseSDK
 from driftpy.types import PositionDirection
 
 import json 
 from dataclasses import dataclass
-from backtest.helpers import adjust_oracle_pretrade, set_price_feed_detailed
-from driftpy.setup.helpers import get_set_price_feed_detailed_ix
+from operator import attrgetter
 from sim.driftsim.clearing_house.lib import ClearingHouse
 
+# the on-chain (run_sdk) side of the events lives in backtest/adapters.py -- it pulls in
+# driftpy's sdk / anchorpy / solana so it's only imported when a backtest runs an event
+
 @dataclass
 class Event:     
     timestamp: int 
@@ -46,10 +43,10 @@ class Event:
     
     @staticmethod
     def deserialize_from_row(class_type, event_row):
-        event = json.loads(event_row.to_json())
-        params = json.loads(event["parameters"])
-        params["_event_name"] = event["event_name"]
-        params["timestamp"] = event["timestamp"]
+        # (a whole file at once: sim.replay.decode_events)
+        params = json.loads(event_row["parameters"])
+        params["_event_name"] = event_row["event_name"]
+        params["timestamp"] = int(event_row["timestamp"])
         event = class_type(**params)
         return event
     
@@ -67,9 +64,53 @@ class Event:
     def run(self, clearing_house: ClearingHouse) -> ClearingHouse:
         raise NotImplementedError
 
-    # theres a lot of different inputs for this :/ 
-    async def run_sdk(self, *args, **kwargs) -> ClearingHouse:
-        raise NotImplementedError
+    # theres a lot of different inputs for this :/ (see backtest/adapters.py)
+    async def run_sdk(self, *args, **kwargs):
+        from backtest.adapters import SDK_ADAPTERS
+        if self._event_name not in SDK_ADAPTERS:
+            raise NotImplementedError
+        return await SDK_ADAPTERS[self._event_name](self, *args, **kwargs)
+
+def parameter_getter(class_type):
+    ''' (number of attributes, sorted parameter names, getter of their values) of an Event type '''
+    names = sorted(n for n in class_type.__dataclass_fields__ if n not in ('timestamp', '_event_name'))
+    getter = attrgetter(*names) if len(names) > 1 else (lambda e: tuple(getattr(e, n) for n in names))
+    return len(names) + 2, names, getter
+
+def serialize_events(events, skip_null=True) -> dict:
+    ''' events -> the events.csv columns (event_name, timestamp, parameters)
+
+    same output as serialize_to_row on every event but one json.dumps per event straight
+    from its field values (the getters are built once per Event type) instead of three
+    json passes -- events with values json cant encode fall back to serialize_to_row '''
+    event_names, timestamps, parameters = [], [], []
+    getters = {}
+    dumps = json.JSONEncoder(sort_keys=True).encode
+    for e in events:
+        if skip_null and e._event_name == 'null':
+            continue
+
+        class_type = type(e)
+        if class_type not in getters:
+            getters[class_type] = parameter_getter(class_type)
+        n_attributes, names, getter = getters[class_type]
+
+        row = None
+        if len(e.__dict__) == n_attributes: # no extra attributes
+            try:
+                row = (e._event_name, e.timestamp, dumps(dict(zip(names, getter(e)))))
+            except TypeError:
+                pass
+        if row is None:
+            row = tuple(e.serialize_to_row().values())
+
+        event_names.append(row[0])
+        timestamps.append(row[1])
+        parameters.append(row[2])
+
+    if len(event_names) == 0:
+        return {}
+    return dict(event_name=event_names, timestamp=timestamps, parameters=parameters)
 
 @dataclass
 class NullEvent(Event):     
@@ -100,16 +141,6 @@ class DepositCollateralEvent(Event):
         )    
         return clearing_house
 
-    async def run_sdk(self, provider, program, usdc_mint, user_keypair, is_initialized):
-        # if not initialized .. initialize ... // mint + deposit ix 
-        user_clearing_house = SDKClearingHouse(program, user_keypair)
-
-        if not is_initialized:
-            await user_clearing_house.intialize_user()
-
-        sig = await user_clearing_house.deposit(self.deposit_amount, 0, user_keypair.public_key)
-        return sig
-        
 @dataclass 
 class oraclePriceEvent(Event):
     market_index: int = 0 
@@ -121,15 +152,6 @@ class oraclePriceEvent(Event):
     def run(self, clearing_house: ClearingHouse, verbose=False) -> ClearingHouse:
         pass
 
-    async def run_sdk(self, program, oracle_program): 
-        market = await get_perp_market_account(
-            program,
-            self.market_index
-        )
-        return await get_set_price_feed_detailed_ix(
-            oracle_program, market.amm.oracle, self.price, self.conf, self.slot
-        )
-
 @dataclass 
 class addLiquidityEvent(Event):
     market_index: int = 0 
@@ -149,17 +171,6 @@ class addLiquidityEvent(Event):
         )
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK): 
-        return await clearing_house.get_add_liquidity_ix(
-            self.token_amount, 
-            self.market_index
-        )
-
-        # return await clearing_house.add_liquidity(
-        #     self.token_amount, 
-        #     self.market_index
-        # )
-
 @dataclass
 class removeLiquidityEvent(Event):
     market_index: int = 0 
@@ -178,29 +189,7 @@ class removeLiquidityEvent(Event):
             self.lp_token_amount
         )    
         return clearing_house
-    
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        if self.lp_token_amount == -1: 
-            user = await get_user_account(clearing_house.program, clearing_house.authority)
-            position = None 
-            for _position in user.perp_positions: 
-                if _position.market_index == self.market_index: 
-                    position = _position
-                    break 
-            assert position is not None, "user not in market"
-
-            self.lp_token_amount = position.lp_shares
-            if position.lp_shares == 0:
-                return None
-
-            # assert self.lp_token_amount > 0, 'trying to burn full zero tokens'
 
-        ix = await clearing_house.get_remove_liquidity_ix(
-            self.lp_token_amount, 
-            self.market_index
-        )
-        return ix
-    
 @dataclass
 class OpenPositionEvent(Event): 
     user_index: int 
@@ -227,79 +216,6 @@ class OpenPositionEvent(Event):
         
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK, init_leverage=None, oracle_program=None, adjust_oracle_pre_trade=False) -> ClearingHouse:
-        # tmp -- sim is quote open position v2 is base only
-        market = await get_perp_market_account(clearing_house.program, self.market_index)
-
-        mark_price = calculate_price(
-            market.amm.base_asset_reserve,
-            market.amm.quote_asset_reserve,
-            market.amm.peg_multiplier,
-        )
-        baa = int(self.quote_amount * AMM_RESERVE_PRECISION / QUOTE_PRECISION / mark_price)
-        baa = min(baa, market.amm.base_asset_reserve // 2)
-        if baa == 0: 
-            print('warning: baa too small -> rounding up')
-            baa = market.amm.base_asset_amount_step_size
-        is_ioc = False
-        direction = {
-            "long": PositionDirection.LONG(),
-            "short": PositionDirection.SHORT(),
-        }[self.direction]
-
-        if adjust_oracle_pre_trade: 
-            assert oracle_program is not None
-            await adjust_oracle_pretrade(
-                baa, 
-                direction, 
-                market, 
-                oracle_program
-            )
-
-        if init_leverage:
-            data = await get_feed_data(oracle_program, market.amm.oracle)
-            price = data.price
-            print('get_feed_data oracle price:', price, data)
-            user = await clearing_house.get_user()
-            from driftpy.clearing_house_user import ClearingHouseUser
-            chu = ClearingHouseUser(clearing_house) 
-            collateral = await chu.get_total_collateral()
-
-            pos = None
-            for position in user.perp_positions:
-                # print(position)
-                if position.market_index == self.market_index and (position.base_asset_amount!=0 or position.quote_asset_amount!=0):
-                    pos = position
-
-            if pos is not None:
-                if pos.open_orders > 15:
-                    return await clearing_house.cancel_orders()
-
-            max_baa = collateral * init_leverage / price
-            # update 
-            baa = int(min(max_baa, baa))
-
-        if baa == 0:
-            print('trying to open position with baa == 0 : early exiting open position')
-            return 
-
-        print(f'opening baa: {baa} {direction} {self.market_index}')
-
-        pchange = 0.99 # 50% change
-        if self.direction == 'long':
-            limit_price = price * (1 + pchange)
-        else: 
-            limit_price = price * (1 - pchange)
-
-        ix = await clearing_house.get_open_position_ix(
-            direction, 
-            baa, 
-            self.market_index, 
-            ioc=is_ioc,
-            limit_price=limit_price,
-        )
-        return ix
-                
 @dataclass
 class ClosePositionEvent(Event): 
     user_index: int 
@@ -315,34 +231,7 @@ class ClosePositionEvent(Event):
         )
         
         return clearing_house
-    
-    async def run_sdk(self, clearing_house: ClearingHouseSDK, oracle_program=None, adjust_oracle_pre_trade=False) -> ClearingHouse:
-        # tmp -- sim is quote open position v2 is base only
-        market = await get_perp_market_account(clearing_house.program, self.market_index)
-        user = await get_user_account(clearing_house.program, clearing_house.authority)
-
-        position = None 
-        for _position in user.perp_positions: 
-            if _position.market_index == self.market_index: 
-                position = _position
-                break 
-        assert position is not None, "user not in market"
-
-        direction = PositionDirection.LONG() if position.base_asset_amount < 0 else PositionDirection.SHORT()
-
-        print(f'closing: {abs(position.base_asset_amount)} {direction}')
 
-        if adjust_oracle_pre_trade: 
-            assert oracle_program is not None
-            await adjust_oracle_pretrade(
-                position.base_asset_amount, 
-                direction, 
-                market, 
-                oracle_program
-            )
-
-        return await clearing_house.get_close_position_ix(self.market_index)
-         
 @dataclass
 class SettleLPEvent(Event): 
     user_index: int 
@@ -360,12 +249,6 @@ class SettleLPEvent(Event):
         
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        return await clearing_house.get_settle_lp_ix(
-            clearing_house.authority, 
-            self.market_index
-        )
-         
 @dataclass
 class SettlePnLEvent(Event): 
     user_index: int 
@@ -377,16 +260,6 @@ class SettlePnLEvent(Event):
         # not implemented yet... 
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        position = await clearing_house.get_user_position(self.market_index)
-        if position is None or position.base_asset_amount == 0: 
-            return None
-
-        return await clearing_house.get_settle_pnl_ix(
-            clearing_house.authority, 
-            self.market_index
-        )
-         
 @dataclass
 class InitIfStakeEvent(Event): 
     user_index: int 
@@ -398,11 +271,6 @@ class InitIfStakeEvent(Event):
         # not implemented yet... 
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        return clearing_house.get_initialize_insurance_fund_stake_ix(
-            self.market_index, 
-        )
-
 @dataclass
 class AddIfStakeEvent(Event): 
     user_index: int 
@@ -415,12 +283,6 @@ class AddIfStakeEvent(Event):
         # not implemented yet... 
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        return await clearing_house.get_add_insurance_fund_stake_ix(
-            self.market_index, 
-            self.amount
-        )
-
 @dataclass
 class RemoveIfStakeEvent(Event): 
     user_index: int 
@@ -433,35 +295,4 @@ class RemoveIfStakeEvent(Event):
         # not implemented yet... 
         return clearing_house
 
-    async def run_sdk(self, clearing_house: ClearingHouseSDK):
-        spot = await get_spot_market_account(clearing_house.program, 0)
-        total_shares = spot.insurance_fund.total_shares
-        if_stake = await get_if_stake_account(clearing_house.program, clearing_house.authority, 0)
-        n_shares = if_stake.if_shares
-
-        conn = clearing_house.program.provider.connection
-        vault_pk = get_insurance_fund_vault_public_key(clearing_house.program_id, 0)
-        v_amount = int((await conn.get_token_account_balance(vault_pk))['result']['value']['amount'])
-
-        print(
-            f'vault_amount: {v_amount} n_shares: {n_shares} total_shares: {total_shares}'
-        )
-
-        withdraw_amount = int(v_amount * n_shares / total_shares)
-        if withdraw_amount > 1:
-            withdraw_amount = 0
-        
-        if withdraw_amount == 0:
-            print('WARNING: if_stake withdraw amount == 0')
-            return
-
-        ix1 = await clearing_house.get_request_remove_insurance_fund_stake_ix(
-            self.market_index, 
-            withdraw_amount
-        )
-        ix2 = await clearing_house.get_remove_insurance_fund_stake_ix(
-            self.market_index, 
-        )
-        return [ix1, ix2]
-
 # %%
@@ -11,11 +11,13 @@ from driftpy.math.user import *
 
 from sim.events import * 
 from sim.agents import * 
+from sim.rng import get_rng, randint
 
 from sim.driftsim.clearing_house.state.market import SimulationMarket
 from sim.driftsim.clearing_house.state.user import MarketPosition
 
-def random_walk_oracle(start_price, n_steps=100):
+def random_walk_oracle(start_price, n_steps=100, rng=None):
+    rng = get_rng(rng)
     prices = []
     timestamps = []
     
@@ -25,9 +27,9 @@ def random_walk_oracle(start_price, n_steps=100):
         prices.append(price)
         timestamps.append(time)
 
-        sign = np.random.choice([-1, 1])
-        price = price + sign * np.random.normal()
-        time = time + np.random.randint(low=1, high=10)
+        sign = rng.choice([-1, 1])
+        price = price + sign * rng.normal()
+        time = time + randint(rng, low=1, high=10)
 
     # normalize prices 
     prices = np.array(prices)
@@ -39,7 +41,8 @@ def random_walk_oracle(start_price, n_steps=100):
     return prices, timestamps
 
 
-def rand_heterosk_oracle(start_price, n_steps=100):
+def rand_heterosk_oracle(start_price, n_steps=100, rng=None):
+    rng = get_rng(rng)
     prices = []
     timestamps = []
     
@@ -51,13 +54,13 @@ def rand_heterosk_oracle(start_price, n_steps=100):
         prices.append(price)
         timestamps.append(time)
 
-        sign = np.random.choice([-1, 1])
-        if np.random.randint(low=1, high=9) > 7:
-            price_delta = sign * abs(np.random.normal(scale=1))
+        sign = rng.choice([-1, 1])
+        if randint(rng, low=1, high=9) > 7:
+            price_delta = sign * abs(rng.normal(scale=1))
         else:
-            price_delta = sign * abs(np.random.normal(scale=std))
+            price_delta = sign * abs(rng.normal(scale=std))
 
-        time_delta = np.random.randint(low=1, high=9)
+        time_delta = randint(rng, low=1, high=9)
 
         std = np.sqrt((price_delta**2 * time_delta + std**2 * (k_period-time_delta))/k_period)
         # print(std)
@@ -169,8 +172,9 @@ def compute_total_collateral(ch):
     return total_collateral
 
 class RandomSimulation():
-    def __init__(self, ch: ClearingHouse) -> None:
+    def __init__(self, ch: ClearingHouse, rng=None) -> None:
         self.ch = ch 
+        self.rng = rng
         market = ch.markets[0]
         self.max_t = len(market.amm.oracle)
         self.amm_tokens = market.amm.amm_lp_shares
@@ -178,7 +182,7 @@ class RandomSimulation():
 
     def generate_lp_settler(self, user_index, market_index, update_every=-1) -> Agent:
         if update_every == -1:
-            update_every = np.random.randint(1, self.max_t // 2)
+            update_every = randint(self.rng, 1, self.max_t // 2)
 
         return SettleLP(
             user_index, 
@@ -187,14 +191,14 @@ class RandomSimulation():
         )
     
     def generate_trade(self, user_index, market_index) -> Agent:
-        start = np.random.randint(0, self.max_t)
-        dur = np.random.randint(0, self.max_t // 2)
-        amount = np.random.randint(0, self.market.amm.quote_asset_reserve * QUOTE_PRECISION / AMM_RESERVE_PRECISION)
+        start = randint(self.rng, 0, self.max_t)
+        dur = randint(self.rng, 0, self.max_t // 2)
+        amount = randint(self.rng, 0, self.market.amm.quote_asset_reserve * QUOTE_PRECISION / AMM_RESERVE_PRECISION)
         
         return OpenClose(
             start_time=start,
             duration=dur, 
-            direction='long' if np.random.choice([0, 1]) == 0 else 'short',
+            direction='long' if get_rng(self.rng).choice([0, 1]) == 0 else 'short',
             quote_amount=amount, 
             user_index=user_index, 
             market_index=market_index
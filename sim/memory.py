@@ -0,0 +1,228 @@
+import os
+import sys
+import copy
+import json
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+''' optional memory profiler for the run loops (tracemalloc)
+
+    profiler = MemoryProfiler(every_events=10_000)
+    sim.run(memory_profiler=profiler)         # or run_trial(..., memory_profiler=profiler)
+    sim.to_df()                               # -> run_info.json['memory'] = summary + samples
+
+every sample attributes the live traced memory to a component by where it was allocated
+(the first of these with a frame in the allocation's traceback):
+    to_json_rows   rows built by to_json (writer buffers, to_df's rows)
+    oracle         the Oracle prices / timestamps (loaded / generated)
+    snapshots      deep copies (the clearing house snapshot list + open_position's revert copies)
+    dataframes     anything else allocated inside pandas
+    other          everything else (agents, the live clearing house, ...)
+and measures two things tracemalloc can't separate:
+    events         the event objects in the events list (object + attribute dict)
+    oracle_arrays  distinct oracle arrays held by the live clearing house + the snapshots
+                   (ie how much of the snapshots are oracle copies)
+'''
+
+RUN_INFO = 'run_info.json'
+
+def code_region(fcn):
+    ''' (filename, first line, last line) of a function's code '''
+    code = getattr(fcn, '__func__', fcn).__code__
+    lines = [line for _, _, line in code.co_lines() if line is not None]
+    return code.co_filename, min(lines + [code.co_firstlineno]), max(lines + [code.co_firstlineno])
+
+def default_components() -> dict:
+    ''' component -> (files, code regions) -- in priority order '''
+    from sim.writer import StreamingCSVWriter
+    from sim.driftsim.clearing_house.lib import ClearingHouse
+    from sim.driftsim.clearing_house.state import Oracle, SimulationMarket, User
+    from sim.driftsim.clearing_house.layout import SnapshotLayout, SnapshotTable, MarketColumns
+    from sim.helpers import rand_heterosk_oracle
+
+    to_json = [
+        ClearingHouse.to_json, SimulationMarket.to_json, User.to_json,
+        StreamingCSVWriter.append_ch, SnapshotLayout.write, MarketColumns.write, SnapshotTable.append_ch,
+    ]
+    return {
+        'to_json_rows': ([], [code_region(f) for f in to_json]),
+        'oracle': ([sys.modules[Oracle.__module__].__file__], [code_region(rand_heterosk_oracle)]),
+        'snapshots': ([copy.__file__], []),
+        'dataframes': ([os.path.dirname(pd.__file__) + os.sep], []),
+    }
+
+def array_nbytes(values):
+    if isinstance(values, np.ndarray):
+        return values.nbytes
+    if isinstance(values, list):
+        return sys.getsizeof(values) + sum([sys.getsizeof(v) for v in values])
+    return 0
+
+def array_key(values):
+    ''' the buffer behind an oracle array (copies have their own) '''
+    if isinstance(values, np.ndarray):
+        return values.__array_interface__['data'][0]
+    return id(values)
+
+class MemoryProfiler:
+    def __init__(self, every_events: int = 10_000, every_seconds: float = None, nframes: int = 25, top: int = 10):
+        ''' every_events / every_seconds: how often maybe_sample takes a sample
+        nframes: traceback depth (deeper = better attribution, slower) '''
+        self.every_events = every_events
+        self.every_seconds = every_seconds
+        self.nframes = nframes
+        self.top = top
+
+        self.components = None
+        self.classified = {}
+        self.samples = []
+        self.top_allocations = []
+        self.started_tracing = False
+        self.start_time = None
+        self.last_sample_events = 0
+        self.last_sample_time = None
+        self.sample_seconds = 0
+
+        # incremental (the lists are append only)
+        self.n_measured_events = 0
+        self.event_bytes = 0
+        self.n_measured_snapshots = 0
+        self.snapshot_oracle_arrays = {}
+
+    @property
+    def running(self):
+        return self.start_time is not None
+
+    def start(self):
+        if self.running:
+            return self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            self.started_tracing = True
+        self.components = default_components()
+        self.start_time = self.last_sample_time = time.perf_counter()
+        return self
+
+    def classify(self, traceback) -> str:
+        if traceback not in self.classified:
+            self.classified[traceback] = next(
+                (name for name in self.components if any(self.in_component(name, frame) for frame in traceback)),
+                'other',
+            )
+        return self.classified[traceback]
+
+    def in_component(self, name, frame):
+        files, regions = self.components[name]
+        if any(frame.filename.startswith(f) for f in files):
+            return True
+        return any(frame.filename == f and start <= frame.lineno <= end for f, start, end in regions)
+
+    def measure_events(self, events):
+        for event in events[self.n_measured_events:]:
+            self.event_bytes += sys.getsizeof(event) + sys.getsizeof(event.__dict__)
+        self.n_measured_events = len(events)
+
+    def oracle_arrays(self, clearing_houses, ch) -> dict:
+        for snapshot in clearing_houses[self.n_measured_snapshots:]:
+            for market in snapshot.markets:
+                oracle = market.amm.oracle
+                for values in (oracle.prices, oracle.timestamps):
+                    self.snapshot_oracle_arrays[array_key(values)] = array_nbytes(values)
+        self.n_measured_snapshots = len(clearing_houses)
+
+        arrays = dict(self.snapshot_oracle_arrays)
+        if ch is not None:
+            for market in ch.markets:
+                for values in (market.amm.oracle.prices, market.amm.oracle.timestamps):
+                    arrays[array_key(values)] = array_nbytes(values)
+        return dict(oracle_arrays=sum(arrays.values()), n_oracle_arrays=len(arrays))
+
+    def maybe_sample(self, events, clearing_houses=None, ch=None):
+        if not self.running:
+            return
+        due = self.every_events is not None and len(events) - self.last_sample_events >= self.every_events
+        due = due or (self.every_seconds is not None and time.perf_counter() - self.last_sample_time >= self.every_seconds)
+        if due:
+            self.sample(events, clearing_houses, ch)
+
+    def sample(self, events, clearing_houses=None, ch=None, label=None):
+        ''' one sample (bytes per component) of the live memory '''
+        if not self.running:
+            return
+        start = time.perf_counter()
+        clearing_houses = clearing_houses or []
+
+        # (without the profiler's own allocations)
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        components = {name: 0 for name in list(self.components) + ['other']}
+        for stat in snapshot.statistics('traceback'):
+            components[self.classify(stat.traceback)] += stat.size
+        current, peak = tracemalloc.get_traced_memory()
+
+        self.measure_events(events)
+        sample = dict(
+            t=start - self.start_time,
+            label=label,
+            n_events=len(events),
+            n_snapshots=len(clearing_houses),
+            traced=current,
+            traced_peak=peak,
+            **components,
+            events=self.event_bytes,
+            **self.oracle_arrays(clearing_houses, ch),
+        )
+        self.samples.append(sample)
+        self.top_allocations = [
+            dict(location=f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', size=stat.size, count=stat.count)
+            for stat in snapshot.statistics('lineno')[:self.top]
+        ]
+
+        self.last_sample_events = len(events)
+        self.last_sample_time = time.perf_counter()
+        self.sample_seconds += self.last_sample_time - start
+        return sample
+
+    def stop(self):
+        if not self.running:
+            return self
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.start_time = None
+        self.classified = {}
+        return self
+
+    def summary(self) -> dict:
+        if len(self.samples) == 0:
+            return {}
+        first, last = self.samples[0], self.samples[-1]
+        measured = ['events', 'oracle_arrays']
+        components = [name for name in list(self.components or {}) + ['other'] if name in last]
+        return dict(
+            n_samples=len(self.samples),
+            traced_peak=max([s['traced_peak'] for s in self.samples]),
+            final={name: last[name] for name in ['traced'] + components + measured},
+            growth={name: last[name] - first[name] for name in ['traced'] + components + measured},
+            peak={name: max([s[name] for s in self.samples]) for name in components + measured},
+            top_allocations=self.top_allocations,
+            sample_seconds=self.sample_seconds,
+        )
+
+    def report(self) -> dict:
+        return dict(summary=self.summary(), samples=self.samples)
+
+    def save(self, path):
+        ''' adds the report to path/run_info.json (next to the run metadata) '''
+        run_info_path = os.path.join(str(path), RUN_INFO)
+        run_info = {}
+        if os.path.exists(run_info_path):
+            with open(run_info_path) as f:
+                run_info = json.load(f)
+        run_info['memory'] = self.report()
+        with open(run_info_path, 'w') as f:
+            json.dump(run_info, f, indent=1, default=float)
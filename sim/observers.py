@@ -0,0 +1,148 @@
+import numpy as np
+
+from driftpy.math.user import get_margin_ratio
+from driftpy.constants.numeric_constants import *
+
+from sim.helpers import compute_total_collateral
+
+''' online aggregates of a run (no history needed)
+
+observers are fed the live clearing house after every event (or timestep) and keep O(1)
+state -- run with snapshot=False and read the reductions off them at the end:
+
+    observers = [FeePoolDrawdown(0), PeakOpenInterest(0), MinMarginRatio(), FundingPaid(0), CollateralConservation()]
+    run_agents(agents, ch, snapshot=False, observers=observers)
+    results(observers) # -> {'m0_max_fee_pool_drawdown': ..., ...}
+'''
+
+class Observer:
+    def update(self, ch, event=None):
+        raise NotImplementedError
+
+    def result(self) -> dict:
+        raise NotImplementedError
+
+class Reducer(Observer):
+    ''' generic: fcn(state, ch) -> state '''
+    def __init__(self, name, fcn, init=None):
+        self.name = name
+        self.fcn = fcn
+        self.state = init
+
+    def update(self, ch, event=None):
+        self.state = self.fcn(self.state, ch)
+
+    def result(self) -> dict:
+        return {self.name: self.state}
+
+class FeePoolDrawdown(Observer):
+    ''' max drop of total_fee_minus_distributions from its running peak '''
+    def __init__(self, market_index=0):
+        self.market_index = market_index
+        self.peak = None
+        self.max_drawdown = 0
+        self.min_fee_pool = None
+
+    def update(self, ch, event=None):
+        fee_pool = ch.markets[self.market_index].amm.total_fee_minus_distributions / QUOTE_PRECISION
+        self.peak = fee_pool if self.peak is None else max(self.peak, fee_pool)
+        self.min_fee_pool = fee_pool if self.min_fee_pool is None else min(self.min_fee_pool, fee_pool)
+        self.max_drawdown = max(self.max_drawdown, self.peak - fee_pool)
+
+    def result(self) -> dict:
+        prefix = f'm{self.market_index}'
+        return {
+            f'{prefix}_max_fee_pool_drawdown': self.max_drawdown,
+            f'{prefix}_min_fee_pool': self.min_fee_pool,
+        }
+
+class PeakOpenInterest(Observer):
+    ''' max of long + |short| base (in base units) '''
+    def __init__(self, market_index=0):
+        self.market_index = market_index
+        self.peak = 0
+
+    def update(self, ch, event=None):
+        amm = ch.markets[self.market_index].amm
+        open_interest = (amm.base_asset_amount_long - amm.base_asset_amount_short) / AMM_RESERVE_PRECISION
+        self.peak = max(self.peak, open_interest)
+
+    def result(self) -> dict:
+        return {f'm{self.market_index}_peak_open_interest': self.peak}
+
+class MinMarginRatio(Observer):
+    ''' min margin ratio of every user (while they have a position) + over all users '''
+    def __init__(self, per_user=True):
+        self.per_user = per_user
+        self.min_ratio = {}
+
+    def update(self, ch, event=None):
+        for user_index, user in ch.users.items():
+            if all(position.base_asset_amount == 0 for position in user.positions):
+                continue
+            ratio = get_margin_ratio(user, ch.markets)
+            self.min_ratio[user_index] = min(self.min_ratio.get(user_index, ratio), ratio)
+
+    def result(self) -> dict:
+        data = dict(min_margin_ratio=min(self.min_ratio.values(), default=np.nan))
+        if self.per_user:
+            data |= {f'u{user_index}_min_margin_ratio': ratio for user_index, ratio in self.min_ratio.items()}
+        return data
+
+class FundingPaid(Observer):
+    ''' cumulative funding paid by the users (positive) to the amm -- from the funding updates,
+    so it also works headless (where per position funding payments arent tracked) '''
+    def __init__(self, market_index=0):
+        self.market_index = market_index
+        self.last_funding_rate_ts = None
+        self.total = 0
+
+    def update(self, ch, event=None):
+        amm = ch.markets[self.market_index].amm
+        if self.last_funding_rate_ts is not None and amm.last_funding_rate_ts != self.last_funding_rate_ts:
+            self.total += (
+                amm.last_funding_rate
+                * amm.base_asset_amount_with_amm
+                / FUNDING_RATE_BUFFER
+                / AMM_TO_QUOTE_PRECISION_RATIO
+            ) / QUOTE_PRECISION
+        self.last_funding_rate_ts = amm.last_funding_rate_ts
+
+    def result(self) -> dict:
+        return {f'm{self.market_index}_funding_paid': self.total}
+
+class CollateralConservation(Observer):
+    ''' deposits - (user collateral + fee pools): max |error| over the run + the last one
+    (unrealized pnl isnt counted so it only closes out once everyone is closed) '''
+    def __init__(self):
+        self.max_abs_error = 0
+        self.last_error = 0
+
+    def update(self, ch, event=None):
+        total_deposits = sum([user.cumulative_deposits for user in ch.users.values()]) / 1e6
+        self.last_error = total_deposits - compute_total_collateral(ch)
+        self.max_abs_error = max(self.max_abs_error, abs(self.last_error))
+
+    def result(self) -> dict:
+        return dict(max_abs_collateral_error=self.max_abs_error, collateral_error=self.last_error)
+
+def observe(observers: list[Observer], ch, event=None):
+    for observer in observers:
+        observer.update(ch, event)
+
+def results(observers: list[Observer]) -> dict:
+    data = {}
+    for observer in observers:
+        data |= observer.result()
+    return data
+
+def default_observers(ch, per_user=True) -> list[Observer]:
+    ''' the standard set for every market of ch (per_user=False: fixed columns, no matter the #users) '''
+    observers = [MinMarginRatio(per_user), CollateralConservation()]
+    for market in ch.markets:
+        observers += [
+            FeePoolDrawdown(market.market_index),
+            PeakOpenInterest(market.market_index),
+            FundingPaid(market.market_index),
+        ]
+    return observers
@@ -0,0 +1,139 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from driftpy.types import FeeStructure
+
+from sim.events import *
+from sim.driftsim.clearing_house.lib import ClearingHouse
+from sim.driftsim.clearing_house.state import Oracle, SimulationAMM, SimulationMarket
+from sim.observers import observe
+from sim.sampling import snapshot_of
+
+''' replays an events.csv through the python ClearingHouse
+
+    events = load_events('experiments/init/lunaCrash/events.csv')
+    ch = clearing_house_from_json('experiments/init/lunaCrash/markets_json.csv', events)
+    result = replay(events, ch, observers=default_observers(ch))
+    result['ch'], result['events_per_second']
+
+the whole file is decoded in one pass (one json.loads for every parameters cell) into the
+typed Event dataclasses. oracle_price events are no-ops for the python model (it reads
+amm.oracle) -- clearing_house_from_json rebuilds each market's oracle from them instead
+'''
+
+# the markets_json.csv fields needed to rebuild a SimulationAMM (init_amm derives the rest)
+AMM_JSON_FIELDS = ['funding_period', 'peg_multiplier', 'base_spread', 'strategies', 'minimum_quote_asset_trade_size']
+MARKET_JSON_FIELDS = ['margin_ratio_initial', 'margin_ratio_partial', 'margin_ratio_maintenance']
+
+def event_types() -> dict:
+    ''' _event_name -> Event subclass '''
+    types = {}
+    subclasses = list(Event.__subclasses__())
+    while len(subclasses) > 0:
+        cls = subclasses.pop()
+        subclasses += cls.__subclasses__()
+        field = cls.__dataclass_fields__.get('_event_name')
+        if field is not None:
+            types[field.default] = cls
+    return types
+
+def decode_events(df: pd.DataFrame) -> list[Event]:
+    ''' events.csv dataframe -> Events (same as Event.deserialize_from_row on every row) '''
+    types = event_types()
+    unknown = set(df['event_name']) - set(types)
+    if len(unknown) > 0:
+        raise ValueError(f'unknown events: {sorted(unknown)}')
+
+    parameters = json.loads('[' + ','.join(df['parameters']) + ']')
+    timestamps = df['timestamp'].to_numpy().tolist()
+    return [
+        types[event_name](timestamp=timestamp, **params)
+        for event_name, timestamp, params in zip(df['event_name'], timestamps, parameters)
+    ]
+
+def load_events(path) -> list[Event]:
+    return decode_events(pd.read_csv(path))
+
+def oracles_from_events(events: list[Event], initial_prices: list[float]) -> list[Oracle]:
+    ''' the oracle of every market from its oracle_price events (initial price at t=0) '''
+    points = [[(0, price)] for price in initial_prices]
+    for event in events:
+        if event._event_name == 'oracle_price':
+            points[event.market_index].append((event.timestamp, event.price))
+
+    oracles = []
+    for market_points in points:
+        timestamps, prices = zip(*sorted(market_points, key=lambda p: p[0]))
+        oracles.append(Oracle(prices=np.array(prices), timestamps=np.array(timestamps)))
+    return oracles
+
+def clearing_house_from_json(path, events: list[Event], fee_structure: FeeStructure = None) -> ClearingHouse:
+    ''' the initial clearing house of a trial from its markets_json.csv + events
+    (the fee structure isnt saved -- defaults to the workspace scenarios' 1/1000) '''
+    with open(path) as f:
+        json_markets = json.load(f)
+    if fee_structure is None:
+        fee_structure = FeeStructure(numerator=1, denominator=1000)
+
+    oracles = oracles_from_events(events, [m['oracle_price'] for m in json_markets])
+    markets = []
+    for market_index, (json_market, oracle) in enumerate(zip(json_markets, oracles)):
+        amm = SimulationAMM(
+            oracle=oracle,
+            base_asset_reserve=int(float(json_market['base_asset_reserve'])),
+            quote_asset_reserve=int(float(json_market['quote_asset_reserve'])),
+            **{k: json_market[k] for k in AMM_JSON_FIELDS if k in json_market},
+        )
+        market = SimulationMarket(
+            amm=amm,
+            market_index=market_index,
+            **{k: json_market[k] for k in MARKET_JSON_FIELDS if k in json_market},
+        )
+        markets.append(market)
+
+    return ClearingHouse(markets, fee_structure)
+
+def replay(events: list[Event], ch: ClearingHouse, snapshot=False, sampling=None, observers=None, writer=None, progress=False) -> dict:
+    ''' runs the events (in order) on ch
+
+    snapshot: keep a copy of the clearing house after every event (clearing_houses)
+    sampling / observers / writer: same as run_agents (sim.sampling, sim.observers, sim.writer)
+
+    returns dict(ch, clearing_houses, n_events, elapsed, events_per_second) '''
+    clearing_houses = []
+    n_events = 0
+
+    start = time.perf_counter()
+    for i, event in enumerate(tqdm(events, disable=not progress)):
+        if event._event_name in ('null', 'oracle_price'):
+            continue
+
+        ch = ch.change_time(event.timestamp - ch.time)
+        ch = event.run(ch)
+        n_events += 1
+
+        if observers is not None:
+            observe(observers, ch, event)
+        if sampling is not None and not sampling.sample(event, ch):
+            continue
+        # (only sampled snapshots get an event_index column)
+        event_index = None if sampling is None else i
+        if writer is not None:
+            writer.append_ch(ch, event_index)
+        elif snapshot:
+            clearing_houses.append(snapshot_of(ch, event_index))
+    elapsed = time.perf_counter() - start
+
+    if writer is not None:
+        writer.close()
+
+    return dict(
+        ch=ch,
+        clearing_houses=clearing_houses,
+        n_events=n_events,
+        elapsed=elapsed,
+        events_per_second=n_events / max(elapsed, 1e-9),
+    )
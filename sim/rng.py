@@ -0,0 +1,21 @@
+import numpy as np
+
+''' random streams for agents + generators
+
+rng=None -> the global np.random state (old behaviour: results depend on the order things are built in)
+rng=np.random.Generator -> an independent stream, eg one per agent from spawn_rngs(seed, n_agents)
+so any subset of a population can be regenerated (or run in another process) identically
+'''
+
+def get_rng(rng=None):
+    return np.random if rng is None else rng
+
+def randint(rng, low, high=None):
+    rng = get_rng(rng)
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(low, high)
+    return rng.randint(low, high)
+
+def spawn_rngs(seed, n: int) -> list[np.random.Generator]:
+    ''' n independent streams derived from one seed (stream i only depends on (seed, i)) '''
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n)]
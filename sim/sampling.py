@@ -0,0 +1,107 @@
+import copy
+
+''' snapshot sampling policies for the run loops (which events get a clearing house snapshot)
+
+every event gets a full snapshot by default -- a policy decides per event (after it ran) whether
+to deep-copy / serialize the clearing house, trading history size for fidelity:
+
+    EveryNEvents(100)                              every 100th event
+    EveryTSeconds(60)                              at most once per 60s of simulated time
+    OnChange(['markets.0.amm.peg_multiplier'])     when any of the fields changed
+    AroundEvents(['remove_liquidity'], after=5)    interesting events (+ margin reverts) and the 5 events after
+    AnyOf(EveryTSeconds(3600), AroundEvents())     combine policies
+'''
+
+INTERESTING_EVENTS = ('remove_liquidity', 'remove_if_stake')
+
+def snapshot_of(ch, event_index: int = None):
+    ''' a copy of ch tagged with the index of the event it was taken after (snapshot.event_index) 
+    -- with a policy the snapshots dont line up with the events list anymore (None = untagged) '''
+    snapshot = copy.deepcopy(ch)
+    if event_index is not None:
+        snapshot.event_index = event_index
+    return snapshot
+
+class SamplingPolicy:
+    def sample(self, event, ch) -> bool:
+        raise NotImplementedError
+
+class EveryEvent(SamplingPolicy):
+    def sample(self, event, ch) -> bool:
+        return True
+
+class EveryNEvents(SamplingPolicy):
+    def __init__(self, n: int):
+        self.n = n
+        self.count = 0
+
+    def sample(self, event, ch) -> bool:
+        self.count += 1
+        return (self.count - 1) % self.n == 0
+
+class EveryTSeconds(SamplingPolicy):
+    ''' seconds of simulated time (ch.time) '''
+    def __init__(self, t: int):
+        self.t = t
+        self.last_time = None
+
+    def sample(self, event, ch) -> bool:
+        if self.last_time is not None and ch.time - self.last_time < self.t:
+            return False
+        self.last_time = ch.time
+        return True
+
+def get_field(ch, path: str):
+    ''' 'markets.0.amm.peg_multiplier' -> ch.markets[0].amm.peg_multiplier '''
+    value = ch
+    for name in path.split('.'):
+        if name.isdigit():
+            value = value[int(name)]
+        elif isinstance(value, dict):
+            value = value[name]
+        else:
+            value = getattr(value, name)
+    return value
+
+class OnChange(SamplingPolicy):
+    def __init__(self, fields: list[str]):
+        self.fields = fields
+        self.last_values = None
+
+    def sample(self, event, ch) -> bool:
+        values = tuple(get_field(ch, field) for field in self.fields)
+        if values == self.last_values:
+            return False
+        self.last_values = values
+        return True
+
+class AroundEvents(SamplingPolicy):
+    ''' the interesting events (by name, + margin reverts) and the `after` events following them '''
+    def __init__(self, event_names=INTERESTING_EVENTS, margin_reverts=True, after: int = 0):
+        self.event_names = set(event_names)
+        self.margin_reverts = margin_reverts
+        self.after = after
+        self.remaining = 0
+        self.n_margin_reverts = 0
+
+    def sample(self, event, ch) -> bool:
+        interesting = event._event_name in self.event_names
+        if self.margin_reverts:
+            interesting |= ch.n_margin_reverts > self.n_margin_reverts
+            self.n_margin_reverts = ch.n_margin_reverts
+
+        if interesting:
+            self.remaining = self.after
+            return True
+        if self.remaining > 0:
+            self.remaining -= 1
+            return True
+        return False
+
+class AnyOf(SamplingPolicy):
+    def __init__(self, *policies: SamplingPolicy):
+        self.policies = policies
+
+    def sample(self, event, ch) -> bool:
+        # evaluate all of them (they are stateful)
+        return any([policy.sample(event, ch) for policy in self.policies])
@@ -0,0 +1,55 @@
+import heapq
+
+class AgentScheduler:
+    ''' priority queue of (wakeup time, agent order, agent) for agents with a known schedule
+
+    agents with a deterministic schedule (agent.polled == False) are only touched when
+    they are due -- O(log n) per action instead of O(agents) per timestep.
+    state dependent agents (agent.polled == True) are asked for their next_wakeup every timestep.
+    agents due at the same timestamp are always run in their original order
+    '''
+    def __init__(self, agents: list):
+        self.agents = agents
+        self.heap = None # compiled at the first timestamp we see
+        self.polled = []
+
+    def compile(self, now: int):
+        self.heap = []
+        self.polled = []
+        for order, agent in enumerate(self.agents):
+            if agent.polled:
+                self.polled.append((order, agent))
+            else:
+                self.push(agent.next_wakeup(now), order, agent)
+
+    def push(self, wakeup: int, order: int, agent):
+        # None = agent is done
+        if wakeup is not None:
+            heapq.heappush(self.heap, (wakeup, order, agent))
+
+    def next_wakeup(self, now: int) -> int:
+        ''' earliest timestamp >= now where an agent is due (None = never again) '''
+        if self.heap is None:
+            self.compile(now)
+        wakeups = [agent.next_wakeup(now) for _, agent in self.polled]
+        if len(self.heap) > 0:
+            wakeups.append(max(now, self.heap[0][0]))
+        return min([t for t in wakeups if t is not None], default=None)
+
+    def due(self, now: int):
+        ''' yields the agents due at `now` (in order) -- each agent is rescheduled
+        after it has been yielded (ie after it has run) '''
+        if self.heap is None:
+            self.compile(now)
+
+        due = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            _, order, agent = heapq.heappop(self.heap)
+            due.append((order, agent))
+        due += [(order, agent) for order, agent in self.polled if agent.next_wakeup(now) == now]
+        due.sort(key=lambda x: x[0])
+
+        for order, agent in due:
+            yield agent
+            if not agent.polled:
+                self.push(agent.next_wakeup(now + 1), order, agent)
@@ -1,5 +1,4 @@
 import pandas as pd
-pd.options.plotting.backend = "plotly"
 
 import sys
 sys.path.insert(0, '../driftpy/src/')
@@ -24,6 +23,14 @@ import pandas as pd
 from sim.driftsim.clearing_house.state import * 
 
 from sim.agents import * 
+from sim.scheduler import AgentScheduler
+from sim.checkpoint import Checkpointer, load_checkpoint
+from sim.sampling import SamplingPolicy, snapshot_of
+from sim.observers import Observer, observe
+from sim.writer import StreamingCSVWriter
+from sim.columnar import ColumnarWriter, load_columns
+from sim.memory import MemoryProfiler
+from sim.driftsim.clearing_house.layout import SnapshotLayout
 import subprocess
 
 def get_git_revision_hash() -> str:
@@ -56,7 +63,7 @@ def clearing_house_to_df(x: ClearingHouse):
     ask_price = calculate_ask_price(market, oracle_price)
     peg = calculate_peg_multiplier(market.amm, oracle_price)
     wouldbe_peg_cost = calculate_repeg_cost(market, peg)[0]
-    amm_df = amm_df.drop(['oracle'],axis=1)
+    amm_df = amm_df.drop(['oracle', 'twaps'],axis=1)
     
     if x.users.get(0, None):
         user0: User = x.users[0]
@@ -191,52 +198,133 @@ class DriftSim:
 
         setup_run_info(self.ch_name, self.name)
 
-    def run(self, debug=None):
-        clearing_house, oracle, agents = self.clearing_house, self.oracle, self.agents
-        simulation_results = {
-            'events': [], 
-            'clearing_houses': [],
-        }
+    def run(self, debug=None, event_driven=False, checkpointer: Checkpointer = None, resume: dict = None, stream=False, fixed_schema=False, sampling: SamplingPolicy = None, observers: list[Observer] = None, memory_profiler: MemoryProfiler = None):
+        ''' event_driven: only step to timestamps where an agent wakes up (see AgentScheduler) 
+        and dont record null events -- the default polls every agent every timestep 
+        checkpointer: periodically save the full sim state (see sim.checkpoint) 
+        resume: a loaded checkpoint to continue from (see DriftSim.resume) 
+        stream: write simulation_state.csv while running instead of keeping 
+        every clearing house in memory (see sim.writer) -- stream='columnar' writes 
+        the columnar history simulation_state/ instead (see sim.columnar) 
+        fixed_schema: stream the rows with a stable SnapshotLayout 
+        sampling: which events get a clearing house snapshot (see sim.sampling, default = all) 
+        observers: online reducers fed the clearing house after every event (see sim.observers) 
+        memory_profiler: periodically attribute the traced memory per component into 
+        run_info.json (see sim.memory) -- to_df adds the serialization and stops it '''
+        oracle = self.oracle
         start, end = oracle.get_timestamp_range()
-        print('running simulation for %i timesteps' % (end-start))
-
-        # timestamp 0 
-        noop = NullEvent(timestamp=clearing_house.time)
-        simulation_results['events'].append(noop)
-        simulation_results['clearing_houses'].append(copy.deepcopy(clearing_house))
-        clearing_house.change_time(+1)
-
-        # setup agents
-        for agent in self.agents:        
-            event_i = agent.setup(clearing_house)
-            clearing_house = event_i.run(clearing_house)
-            
-            simulation_results['events'].append(event_i)
-            simulation_results['clearing_houses'].append(copy.deepcopy(clearing_house))
-            
-            clearing_house = clearing_house.change_time(+1)
 
-        # run the simulation 
-        print('running sim from timestamp', start,'to', end)
-        for x in range(start, end):
-            if x < clearing_house.time:
+        if resume is None: 
+            clearing_house, agents = self.clearing_house, self.agents
+            simulation_results = {
+                'events': [], 
+                'clearing_houses': [],
+                'writer': None,
+                'sampling': sampling,
+                'observers': observers,
+            }
+            layout = SnapshotLayout() if fixed_schema else None
+            if stream == 'columnar':
+                simulation_results['writer'] = ColumnarWriter(self.ch_name+"/simulation_state", layout=layout)
+            elif stream:
+                simulation_results['writer'] = StreamingCSVWriter(self.ch_name+"/simulation_state.csv", layout=layout)
+            print('running simulation for %i timesteps' % (end-start))
+        else:
+            simulation_results = resume['simulation_results'] | resume['history']
+        writer = simulation_results.get('writer')
+        sampling = simulation_results.get('sampling')
+        observers = simulation_results.get('observers')
+
+        self.memory_profiler = memory_profiler
+        if memory_profiler is not None:
+            memory_profiler.start()
+
+        def record(event, clearing_house):
+            simulation_results['events'].append(event)
+            if memory_profiler is not None:
+                memory_profiler.maybe_sample(simulation_results['events'], simulation_results['clearing_houses'], clearing_house)
+            if observers is not None:
+                observe(observers, clearing_house, event)
+            if sampling is not None and not sampling.sample(event, clearing_house):
+                return
+            # (only sampled snapshots get an event_index column)
+            event_index = None if sampling is None else len(simulation_results['events']) - 1
+            if writer is not None:
+                writer.append_ch(clearing_house, event_index)
+            else:
+                simulation_results['clearing_houses'].append(snapshot_of(clearing_house, event_index))
+
+        if resume is None: 
+            # timestamp 0 
+            noop = NullEvent(timestamp=clearing_house.time)
+            record(noop, clearing_house)
+            clearing_house.change_time(+1)
+
+            # setup agents
+            for agent in self.agents:        
+                for event_i in agent.setup(clearing_house):
+                    clearing_house = event_i.run(clearing_house)
+                    record(event_i, clearing_house)
+                
+                clearing_house = clearing_house.change_time(+1)
+
+            # run the simulation 
+            print('running sim from timestamp', start,'to', end)
+            scheduler = AgentScheduler(agents) if event_driven else None
+            if event_driven:
+                clearing_house.change_time(max(0, start - clearing_house.time))
+            x = start
+        else:
+            clearing_house, agents, scheduler = resume['clearing_house'], resume['agents'], resume['scheduler']
+            event_driven, x = resume['event_driven'], resume['x']
+            self.agents = agents
+            print('resuming sim from timestamp', x, 'to', end)
+
+        # polled: every timestep x in [start, end) like the for loop it was (the 
+        # clearing house time only moves on the timesteps which are run)
+        while x < end:
+            if event_driven:
+                next_t = scheduler.next_wakeup(clearing_house.time)
+                if next_t is None or next_t >= end: 
+                    break
+                clearing_house = clearing_house.change_time(next_t - clearing_house.time)
+                x = next_t
+                run_agents = scheduler.due(x)
+            elif x < clearing_house.time:
                 print(f"skipping time step: {x} ... ch time: {clearing_house.time}")
+                x += 1
                 continue
+            else:
+                run_agents = agents
             
             # run the agents at each timestep 
-            for i, agent in enumerate(agents):
-                event_i = agent.run(clearing_house)
-                clearing_house = event_i.run(clearing_house)
-                
-                simulation_results['events'].append(event_i)
-                simulation_results['clearing_houses'].append(copy.deepcopy(clearing_house))
-                
-                if debug == x:
-                    print('debugging event #%i:' % x)
-                    print(event_i)
-                    print(clearing_house)
+            for i, agent in enumerate(run_agents):
+                for event_i in (agent.run_due(clearing_house) if event_driven else agent.run(clearing_house)):
+                    if event_driven and event_i._event_name == 'null':
+                        continue
+                    clearing_house = event_i.run(clearing_house)
+                    record(event_i, clearing_house)
+                    
+                    if debug == x:
+                        print('debugging event #%i:' % x)
+                        print(event_i)
+                        print(clearing_house)
             
             clearing_house = clearing_house.change_time(1)
+            x += 1
+
+            # checkpoint between timesteps (the history is spooled incrementally)
+            if checkpointer is not None:
+                history = {k: simulation_results[k] for k in ('events', 'clearing_houses')}
+                checkpointer.maybe_save(len(simulation_results['events']), lambda: dict(
+                    clearing_house=clearing_house, agents=agents, scheduler=scheduler, 
+                    simulation_results={k: v for k, v in simulation_results.items() if k not in history}, 
+                    event_driven=event_driven, x=x,
+                ), history)
+
+        # event driven: skipped timesteps still pass time
+        if event_driven and clearing_house.time < end:
+            clearing_house = clearing_house.change_time(end - clearing_house.time)
             
         # close out all the users 
         for market_index in range(len(clearing_house.markets)):
@@ -247,29 +335,54 @@ class DriftSim:
                     market_index=market_index,
                 )
                 clearing_house = close_event.run(clearing_house)
-                
-                simulation_results['events'].append(close_event)
-                simulation_results['clearing_houses'].append(copy.deepcopy(clearing_house))
+                record(close_event, clearing_house)
                 
                 clearing_house = clearing_house.change_time(1)
         
+        if writer is not None:
+            writer.close()
+
+        if memory_profiler is not None:
+            memory_profiler.sample(simulation_results['events'], simulation_results['clearing_houses'], clearing_house, label='run')
+            memory_profiler.save(self.ch_name)
+
         self.simulation_results = simulation_results # save sim run results 
         return simulation_results
 
+    def resume(self, checkpoint_path, debug=None, checkpointer: Checkpointer = None):
+        ''' continues a run from its last checkpoint (same results as an uninterrupted run) '''
+        resume = load_checkpoint(checkpoint_path)
+        if checkpointer is not None:
+            checkpointer.continue_from(resume, len(resume['history']['events']))
+        return self.run(debug=debug, checkpointer=checkpointer, resume=resume)
+
     def to_df(self, save=True):
         simulation_results = self.simulation_results
         SIM_NAME = self.ch_name
+        writer = simulation_results.get('writer')
+        streamed = writer is not None
         
         # serialize clearing house state 
-        json_chs = [
-            ch.to_json() for ch in tqdm(simulation_results['clearing_houses'])
-        ]
-        result_df = pd.DataFrame(json_chs)
+        if isinstance(writer, ColumnarWriter):
+            result_df = load_columns(writer.path).to_df()
+        elif streamed:
+            # already written during the run
+            result_df = pd.read_csv(SIM_NAME+"/simulation_state.csv")
+        else:
+            json_chs = [
+                ch.to_json() for ch in tqdm(simulation_results['clearing_houses'])
+            ]
+            if simulation_results.get('sampling') is not None:
+                # the snapshots dont line up with the events
+                json_chs = [
+                    {'event_index': ch.event_index} | row 
+                    for ch, row in zip(simulation_results['clearing_houses'], json_chs)
+                ]
+            result_df = pd.DataFrame(json_chs)
 
         if save:
             # serialize events 
-            simulation_event_rows = [e.serialize_to_row() for e in simulation_results['events']]
-            simulation_df = pd.DataFrame(simulation_event_rows)
+            simulation_df = pd.DataFrame(serialize_events(simulation_results['events'], skip_null=False))
             oracle = self.oracle
 
             # serialize oracles
@@ -277,7 +390,8 @@ class DriftSim:
 
             oracle_df.to_csv(SIM_NAME+"/oracle_prices.csv", index=False)
             simulation_df.to_csv(SIM_NAME+"/events.csv", index=False)
-            result_df.to_csv(SIM_NAME+"/simulation_state.csv", index=False)
+            if not streamed:
+                result_df.to_csv(SIM_NAME+"/simulation_state.csv", index=False)
             
             # save oracle data for rust/ts reprod 
             max_t = int(max(oracle.timestamps))
@@ -286,6 +400,11 @@ class DriftSim:
             oracle_df = pd.DataFrame({'timestamp': all_timestamps, 'price': all_prices})
             oracle_df.to_csv(SIM_NAME+"/all_oracle_prices.csv", index=False)
 
+        memory_profiler = getattr(self, 'memory_profiler', None)
+        if memory_profiler is not None and memory_profiler.running:
+            memory_profiler.sample(simulation_results['events'], simulation_results['clearing_houses'], label='serialization')
+            memory_profiler.stop().save(SIM_NAME)
+
         return result_df
     
 class SimpleDriftSim(DriftSim):
@@ -0,0 +1,193 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+''' streaming csv writer for the per-event rows (chs.csv / simulation_state.csv)
+
+rows are buffered and spooled to disk in pickled chunks as the sim runs (constant memory,
+flushed chunks survive a crash). close() converts the spool into the csv in two streaming
+passes -- one to resolve the columns/dtypes of the whole history (the same way
+pd.DataFrame(rows) would) and one to write -- so the csv is identical to
+pd.DataFrame(rows).to_csv(path, index=False)
+
+with a SnapshotLayout the clearing house rows are written straight into a preallocated
+SnapshotTable and spooled as Blocks (2d value arrays) instead of lists of dicts
+'''
+
+class Block:
+    ''' a spooled chunk of fixed schema rows (columns + a rows x columns object array) '''
+    def __init__(self, columns: list, values: np.ndarray):
+        self.columns = columns
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+class StreamingCSVWriter:
+    def __init__(self, path, chunk_size: int = 1000, layout=None):
+        ''' layout: a SnapshotLayout for fixed schema clearing house rows (see append_ch) '''
+        # absolute: the paths are part of a checkpoint (resume from any cwd)
+        self.path = os.path.abspath(path)
+        self.spool_path = self.path + '.spool'
+        self.chunk_size = chunk_size
+        self.layout = layout
+        self.buffer = []
+        self.table = None # layout rows (SnapshotTable)
+        self.n_rows = 0
+        self.spool_offset = 0
+        open(self.spool_path, 'wb').close()
+
+    def __getstate__(self):
+        # checkpoint = spool position + the unflushed rows
+        self.flush()
+        return self.__dict__.copy()
+
+    def __setstate__(self, state):
+        # drop anything spooled after the checkpoint was taken
+        self.__dict__.update(state)
+        with open(self.spool_path, 'ab') as f:
+            f.truncate(self.spool_offset)
+
+    def append(self, row: dict):
+        self.buffer.append(row)
+        self.n_rows += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def append_ch(self, ch, event_index: int = None):
+        ''' event_index: the index (in the events list) of the event the snapshot was taken 
+        after -- the first column when given (rows dont line up with the events when sampling) '''
+        if self.layout is None:
+            row = ch.to_json()
+            if event_index is not None:
+                row = {'event_index': event_index} | row
+            self.append(row)
+            return
+
+        if self.table is None:
+            from sim.driftsim.clearing_house.layout import SnapshotTable
+            self.table = SnapshotTable(self.layout, self.chunk_size)
+        self.table.append_ch(ch, event_index)
+        self.n_rows += 1
+        if len(self.table) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        chunks = []
+        if len(self.buffer) > 0:
+            chunks.append(self.buffer)
+        if self.table is not None and len(self.table) > 0:
+            chunks.append(Block(list(self.layout.columns), self.table.block))
+        if len(chunks) == 0:
+            return
+        with open(self.spool_path, 'ab') as f:
+            for chunk in chunks:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            self.spool_offset = f.tell()
+        self.buffer = []
+        self.table = None
+
+    def close(self):
+        self.flush()
+        self.finalize()
+        os.remove(self.spool_path)
+
+    def finalize(self):
+        spool_to_csv(self.spool_path, self.path)
+
+def read_spool(spool_path):
+    with open(spool_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+            except pickle.UnpicklingError:
+                return # partially written chunk (crash)
+
+class ColumnTypes:
+    ''' the value types seen in one column -- enough to reproduce pandas' dtype inference
+    without keeping the column around '''
+    def __init__(self):
+        self.examples = {}
+        self.int_min = None
+        self.int_max = None
+        self.missing = False
+
+    def add(self, value):
+        if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            self.int_min = value if self.int_min is None else min(self.int_min, value)
+            self.int_max = value if self.int_max is None else max(self.int_max, value)
+        else:
+            self.examples.setdefault(type(value), value)
+
+    def dtype(self):
+        values = list(self.examples.values())
+        values += [v for v in {self.int_min, self.int_max} if v is not None]
+        rows = [{'c': v} for v in values]
+        if self.missing:
+            rows.append({})
+        return pd.DataFrame(rows)['c'].dtype
+
+def resolve_schema(chunks):
+    ''' column order (first appearance) + dtype of every column '''
+    columns = {}
+    n_rows = 0
+    for chunk in chunks:
+        if isinstance(chunk, Block):
+            for column in columns.keys() - set(chunk.columns):
+                columns[column].missing = True
+            for j, column in enumerate(chunk.columns):
+                if column not in columns:
+                    columns[column] = ColumnTypes()
+                    columns[column].missing = n_rows > 0
+                # (NaN cells are NaN values -- the same dtype as missing ones)
+                for value in chunk.values[:, j]:
+                    columns[column].add(value)
+            n_rows += len(chunk)
+            continue
+
+        for row in chunk:
+            for column in columns.keys() - row.keys():
+                columns[column].missing = True
+            for column, value in row.items():
+                if column not in columns:
+                    columns[column] = ColumnTypes()
+                    columns[column].missing = n_rows > 0
+                columns[column].add(value)
+            n_rows += 1
+    return {column: types.dtype() for column, types in columns.items()}
+
+def chunk_to_df(chunk, schema):
+    if isinstance(chunk, Block):
+        df = pd.DataFrame(chunk.values, columns=chunk.columns).reindex(columns=list(schema.keys()))
+        for column, dtype in schema.items():
+            if dtype != object:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    df = pd.DataFrame(chunk, columns=list(schema.keys()))
+    for column, dtype in schema.items():
+        if df[column].dtype == dtype:
+            continue
+        if dtype.kind in 'iufb':
+            df[column] = df[column].astype(dtype)
+        else:
+            # non numeric: keep the raw values (like a single frame would)
+            raw = pd.Series([row.get(column, np.nan) for row in chunk], dtype=object)
+            df[column] = raw if dtype == object else raw.astype(dtype)
+    return df
+
+def spool_to_csv(spool_path, csv_path):
+    schema = resolve_schema(read_spool(spool_path))
+    if len(schema) == 0:
+        pd.DataFrame([]).to_csv(csv_path, index=False)
+        return
+
+    with open(csv_path, 'w', newline='') as f:
+        header = True
+        for chunk in read_spool(spool_path):
+            chunk_to_df(chunk, schema).to_csv(f, index=False, header=header)
+            header = False
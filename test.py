@@ -1,5 +1,6 @@
 import sys
 sys.path.insert(0, './driftpy/src/')
+sys.path.insert(0, './scripts/workspace/')
 
 import driftpy
 
@@ -16,15 +17,39 @@ from driftpy.math.amm import (
 
 from sim.driftsim.clearing_house.math.pnl import *
 from sim.driftsim.clearing_house.math.amm import *
+from sim.driftsim.clearing_house.math.stats import calculate_new_twap
 from sim.driftsim.clearing_house.state import *
 from sim.driftsim.clearing_house.lib import * 
 from sim.events import * 
-from sim.helpers import compute_total_collateral, close_all_users
+from sim.agents import * 
+from sim.scheduler import AgentScheduler
+from sim.helpers import compute_total_collateral, close_all_users, rand_heterosk_oracle
+from sim.rng import spawn_rngs
+from sim.cache import ResultCache, ARTIFACTS, canonical, hash_json
+from sim.checkpoint import Checkpointer, load_checkpoint
+from sim.sampling import EveryNEvents, EveryTSeconds, OnChange, AroundEvents, AnyOf
+from sim.observers import FeePoolDrawdown, PeakOpenInterest, FundingPaid, CollateralConservation, Reducer, default_observers, results
+from sim.writer import StreamingCSVWriter
+from sim.driftsim.clearing_house.layout import SnapshotLayout, SnapshotTable
+from sim.columnar import ColumnarWriter, write_columns, load_columns, csv_to_columns
+from sim.batched import run_batched
+from sim.replay import load_events, replay
+from sim.event_log import write_event_log, load_event_log, csv_to_event_log, event_log_to_csv, cached_event_log
+from sim.memory import MemoryProfiler
+from sim.sim import SimpleDriftSim
+from helpers import run_trial
 
 import numpy as np 
 import pandas as pd
 
+import os
+import copy
+import json
+import pickle
 import unittest
+import tempfile
+import pathlib
+import time
 
 def default_set_up(self, n_users=1, default_collateral=1000, bq_ar=1e6):
     length = 10 
@@ -179,7 +204,77 @@ class TestLP(unittest.TestCase):
         # should have made money from fees 
         self.assertGreater(user.collateral, prev_collateral)
         self.assertEqual(user.positions[0].lp_shares, 0)
-  
+
+    def test_settle_all_lps(self):
+        default_set_up(self, n_users=4, default_collateral=10_000_000, bq_ar=1e6)
+        ch = self.clearing_house
+
+        ch = ch.add_liquidity(0, 0, 1e6 * QUOTE_PRECISION)
+        ch = ch.add_liquidity(0, 1, 5e5 * QUOTE_PRECISION)
+        for direction, lp_index in [('long', 2), ('short', 2), ('long', None), ('short', None)]:
+            ch = OpenPositionEvent(
+                user_index=3,
+                direction=direction,
+                quote_amount=1e4 * QUOTE_PRECISION,
+                market_index=0,
+                timestamp=ch.time,
+            ).run(ch)
+            ch.change_time(1)
+            # an lp joins midway (different cumulative values)
+            if lp_index is not None and ch.users[lp_index].positions[0].lp_shares == 0:
+                ch = ch.add_liquidity(0, lp_index, 2e5 * QUOTE_PRECISION)
+
+        sequential_ch = copy.deepcopy(ch)
+        for user_index in [0, 1, 2]:
+            sequential_ch = sequential_ch.settle_lp(0, user_index)
+        ch = ch.settle_all_lps(0)
+
+        for user_index in [0, 1, 2, 3]:
+            self.assertEqual(
+                ch.users[user_index].collateral,
+                sequential_ch.users[user_index].collateral
+            )
+            position, sequential_position = ch.users[user_index].positions[0], sequential_ch.users[user_index].positions[0]
+            self.assertEqual(position.lp_base_asset_amount, sequential_position.lp_base_asset_amount)
+            self.assertEqual(position.lp_quote_asset_amount, sequential_position.lp_quote_asset_amount)
+            self.assertEqual(position.lp_fee_payments, sequential_position.lp_fee_payments)
+            self.assertEqual(position.lp_funding_payments, sequential_position.lp_funding_payments)
+
+    def test_close_out_order(self):
+        default_set_up(self, n_users=4, default_collateral=10_000_000, bq_ar=1e6)
+        ch = self.clearing_house
+
+        ch = ch.add_liquidity(0, 0, 1e6 * QUOTE_PRECISION)
+        ch = ch.add_liquidity(0, 1, 5e5 * QUOTE_PRECISION)
+        for direction, lp_index in [('long', 2), ('short', None), ('long', None)]:
+            ch = ch.open_position({'long': PositionDirection.LONG, 'short': PositionDirection.SHORT}[direction], 3, 1e4 * QUOTE_PRECISION, 0)
+            ch.change_time(1)
+            if lp_index is not None:
+                ch = ch.add_liquidity(0, lp_index, 2e5 * QUOTE_PRECISION)
+
+        closed_ch, (_, events, _) = close_all_users(copy.deepcopy(ch))
+
+        # per user: remove liquidity then close the position (one timestamp each)
+        expected_ch = copy.deepcopy(ch).change_time(1)
+        expected_ch.update_funding_rate(0)
+        expected = []
+        for user_index in [0, 1, 2, 3]:
+            if expected_ch.users[user_index].positions[0].lp_shares > 0:
+                expected.append(('remove_liquidity', user_index, expected_ch.time))
+                expected_ch = expected_ch.remove_liquidity(0, user_index).change_time(1)
+            if expected_ch.users[user_index].positions[0].base_asset_amount != 0:
+                expected.append(('close_position', user_index, expected_ch.time))
+                expected_ch = expected_ch.close_position(user_index, 0).change_time(1)
+
+        self.assertEqual([(e._event_name, e.user_index, e.timestamp) for e in events], expected)
+        self.assertEqual(closed_ch.time, expected_ch.time)
+        for user_index in [0, 1, 2, 3]:
+            user, expected_user = closed_ch.users[user_index], expected_ch.users[user_index]
+            self.assertEqual(user.collateral, expected_user.collateral)
+            self.assertEqual(user.positions[0].lp_shares, 0)
+            self.assertEqual(user.positions[0].base_asset_amount, 0)
+        self.assertEqual(closed_ch.markets[0].amm.total_fee_minus_distributions, expected_ch.markets[0].amm.total_fee_minus_distributions)
+
     def test_lp(self):
         # make bar larger for larger trades
         
@@ -277,7 +372,46 @@ class TestLP(unittest.TestCase):
         abs_difference = abs(init_collateral - final_collateral)
         print('abs diff:', abs_difference)
         self.assertLessEqual(abs_difference, 1)
-        
+
+
+class TestPegCache(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=2, default_collateral=10_000)
+        self.market.amm.strategies = 'PreFreePeg'
+
+    def run_trades(self, ch):
+        for t in range(4):
+            for user_index, direction in [(0, PositionDirection.LONG), (1, PositionDirection.SHORT), (0, PositionDirection.LONG)]:
+                ch = ch.open_position(direction, user_index, 100 * QUOTE_PRECISION, 0)
+            ch.change_time(1)
+        return ch
+
+    def test_cache_matches_uncached(self):
+        ch = copy.deepcopy(self.clearing_house)
+        cached_ch = copy.deepcopy(self.clearing_house)
+        cached_ch.peg_cache = PegDecisionCache()
+
+        ch = self.run_trades(ch)
+        cached_ch = self.run_trades(cached_ch)
+
+        json, cached_json = ch.to_json(), cached_ch.to_json()
+        for k in json:
+            if json[k] != json[k] and cached_json[k] != cached_json[k]: # nan
+                continue
+            self.assertEqual(json[k], cached_json[k])
+        self.assertGreater(cached_ch.peg_cache.misses, 0)
+
+    def test_peg_once_per_ts(self):
+        ch = self.clearing_house
+        ch.peg_cache = PegDecisionCache()
+        ch.peg_once_per_ts = True
+
+        ch = self.run_trades(ch)
+
+        # one peg decision per timestamp
+        self.assertEqual(ch.peg_cache.hits + ch.peg_cache.misses, 4)
+
 
 class TestTWAPs(unittest.TestCase):
     
@@ -321,9 +455,44 @@ class TestTWAPs(unittest.TestCase):
         self.assertGreater(mark_price, prev_mark_price)
         # timstamp is correct 
         self.assertGreater(twap_ts, prev_twap_ts)
-        # twap is smaller than mark price (bc of weighted average) 
+        # twap is smaller than mark price (bc of weighted average)
         self.assertLess(twap, mark_price)
 
+    def test_accumulator(self):
+        amm = self.clearing_house.markets[0].amm
+        twaps = amm.twaps
+        now = 5
+        oracle_price = amm.oracle.get_price(now)
+
+        # same timestamp updates roll one after the other
+        expected_twap = amm.last_mark_price_twap
+        expected_ts = amm.last_mark_price_twap_ts
+        for quote_asset_reserve in [1.01, 1.02, 0.99]:
+            amm.quote_asset_reserve *= quote_asset_reserve
+            mark_price = calculate_mark_price_amm(amm)
+            expected_twap = calculate_new_twap(expected_twap, expected_ts, mark_price, now, amm.funding_period)
+            expected_ts = now
+
+            self.assertEqual(twaps.update_mark_twap(now), expected_twap)
+            self.assertEqual(amm.last_mark_price_twap, expected_twap)
+            self.assertEqual(amm.bid_price_before, calculate_bid_price_amm(amm, oracle_price))
+            self.assertEqual(amm.ask_price_before, calculate_ask_price_amm(amm, oracle_price))
+
+        # quotes are only recomputed when the amm changes
+        hits = twaps.hits
+        quotes = twaps.get_quotes(now)
+        self.assertEqual(twaps.hits, hits + 1)
+        self.assertEqual(quotes, (calculate_bid_price_amm(amm, oracle_price), calculate_ask_price_amm(amm, oracle_price)))
+        amm.quote_asset_reserve *= 1.01
+        twaps.get_quotes(now)
+        self.assertEqual(twaps.hits, hits + 1)
+        self.assertEqual(twaps.get_oracle_price(now), oracle_price)
+
+        # snapshots get their own accumulator
+        amm_copy = copy.deepcopy(amm)
+        self.assertIs(amm_copy.twaps.amm, amm_copy)
+        self.assertNotIn('m0_twaps', self.clearing_house.to_json())
+
 class TestClearingHouseFundingTimestamp(unittest.TestCase):
         
     def setUp(self):
@@ -912,10 +1081,37 @@ class TestClearingHousePositions(unittest.TestCase):
 
 import math 
 class TestCollateral(unittest.TestCase):
-        
+
     def setUp(self):
         default_set_up(self, n_users=2)
 
+    def test_headless(self):
+        ch = copy.deepcopy(self.clearing_house)
+        headless_ch = copy.deepcopy(self.clearing_house)
+        headless_ch.headless = True
+
+        for _ch in [ch, headless_ch]:
+            _ch.add_liquidity(0, 1, 100 * QUOTE_PRECISION)
+            _ch.open_position(PositionDirection.LONG, 0, 100 * QUOTE_PRECISION, 0)
+            _ch.change_time(61)
+            _ch.update_funding_rate(0)
+            _ch.settle_lp(0, 1)
+            _ch.close_position(0, 0)
+            _ch.remove_liquidity(0, 1)
+
+        # same core accounting
+        for user_index in [0, 1]:
+            self.assertEqual(ch.users[user_index].collateral, headless_ch.users[user_index].collateral)
+        self.assertEqual(
+            ch.markets[0].amm.total_fee_minus_distributions,
+            headless_ch.markets[0].amm.total_fee_minus_distributions
+        )
+
+        # without the debug metrics
+        self.assertEqual(headless_ch.users[0].positions[0].market_fee_payments, 0)
+        self.assertNotIn('m0_wouldbe_peg_cost', headless_ch.to_json())
+        self.assertIn('m0_wouldbe_peg_cost', ch.to_json())
+
     def test_long_short(self):
         """
         user goes long 
@@ -995,6 +1191,952 @@ class TestCollateral(unittest.TestCase):
         expected_total_collateral = user0.collateral + user1.collateral + market.amm.total_fee_minus_distributions
         math.isclose(total_collateral/1e6, expected_total_collateral/1e6, abs_tol=1e-3)
 
+class TestAgentWakeups(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=2)
+
+    def agent_events(self, agents, end, event_driven):
+        ch = self.clearing_house
+        ch.time = 0
+        events = []
+        scheduler = AgentScheduler(agents)
+        while ch.time < end:
+            if event_driven:
+                next_t = scheduler.next_wakeup(ch.time)
+                if next_t is None or next_t >= end: 
+                    break
+                ch.time = next_t
+                run_agents = scheduler.due(ch.time)
+            else:
+                run_agents = agents
+
+            for agent in run_agents:
+                events += [
+                    (e._event_name, e.timestamp, e.user_index) for e in (agent.run_due(ch) if event_driven else agent.run(ch))
+                    if e._event_name != 'null'
+                ]
+            ch.time += 1
+        return events
+
+    def test_event_driven_matches_polling(self):
+        def make_agents():
+            return [
+                OpenClose(start_time=3, duration=4, user_index=0),
+                OpenClose(start_time=0, duration=-1, user_index=1),
+                AddRemoveLiquidity(lp_start_time=5, lp_duration=2, user_index=1),
+                IFStaker(100, 0, 0, start_time=7, duration=10),
+                SettleLP(1, 0, every_x_steps=3),
+                Noise(1, 0, 0),
+            ]
+
+        end = 700
+        polled = self.agent_events(make_agents(), end, event_driven=False)
+        driven = self.agent_events(make_agents(), end, event_driven=True)
+
+        self.assertGreater(len(polled), 0)
+        self.assertEqual(polled, driven)
+
+    def test_multiple_agent_schedule(self):
+        def make_agent():
+            return MultipleAgent(
+                iter([
+                    OpenClose(start_time=t, duration=d, user_index=0) 
+                    for t, d in [(9, 2), (1, 5), (9, 1), (4, -1)]
+                ]).__next__, 
+                4
+            )
+
+        end = 20
+        polled = self.agent_events([make_agent()], end, event_driven=False)
+        driven = self.agent_events([make_agent()], end, event_driven=True)
+
+        self.assertEqual(len(polled), 7)
+        self.assertEqual(polled, driven)
+
+    def make_agents(self):
+        return [
+            OpenClose(start_time=3, duration=40, user_index=0, quote_amount=100 * QUOTE_PRECISION, direction='long'),
+            OpenClose(start_time=20, duration=-1, user_index=1, quote_amount=50 * QUOTE_PRECISION, direction='short'),
+            AddRemoveLiquidity(lp_start_time=5, lp_duration=200, token_amount=1e5 * QUOTE_PRECISION, user_index=2),
+            SettleLP(2, 0, every_x_steps=50),
+            SettlePnL(0, 0, every_x_steps=70),
+            Noise(1, 0, 3),
+        ]
+
+    def clearing_house_state(self, ch):
+        amm = ch.markets[0].amm
+        return dict(
+            time=ch.time,
+            amm=[amm.base_asset_reserve, amm.quote_asset_reserve, amm.total_fee_minus_distributions, amm.cumulative_funding_rate_long, amm.last_mark_price_twap, amm.last_oracle_price_twap],
+            users={
+                user_index: [user.collateral, user.positions[0].base_asset_amount, user.positions[0].quote_asset_amount, user.positions[0].lp_shares]
+                for user_index, user in ch.users.items()
+            },
+        )
+
+    def test_drift_sim_event_driven(self):
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 400), timestamps=np.arange(400))
+        runs = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for event_driven in [False, True]:
+                sim = SimpleDriftSim(str(pathlib.Path(tmp)/str(event_driven)), copy.deepcopy(self.clearing_house), self.make_agents())
+                history = sim.run(event_driven=event_driven)
+                runs[event_driven] = (
+                    [e for e in history['events'] if e._event_name != 'null'], 
+                    self.clearing_house_state(history['clearing_houses'][-1]),
+                )
+
+        polled, driven = runs[False], runs[True]
+        self.assertGreater(len([e for e in polled[0] if e._event_name == 'open_position']), 2)
+        self.assertEqual(polled[0], driven[0])
+        self.assertEqual(polled[1], driven[1])
+
+    def test_drift_sim_polled_baseline(self):
+        # oracle starting after the setup -> the first timesteps are run with a lagging clearing house time
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 60), timestamps=np.arange(10, 70))
+        def make_agents():
+            return [
+                MultipleAgent(iter([
+                    OpenClose(start_time=t, duration=d, user_index=0, quote_amount=100 * QUOTE_PRECISION) 
+                    for t, d in [(15, 5), (12, -1), (30, 10)]
+                ]).__next__, 3),
+                OpenClose(start_time=20, duration=15, user_index=1, quote_amount=50 * QUOTE_PRECISION, direction='short'),
+            ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            sim = SimpleDriftSim(str(pathlib.Path(tmp)/'polled'), copy.deepcopy(self.clearing_house), make_agents())
+            history = sim.run()
+
+        # the polled loop as it was before the scheduler: every agent (+ subagent) every timestep
+        ch, agents = copy.deepcopy(self.clearing_house), make_agents()
+        events, chs = [NullEvent(timestamp=ch.time)], [self.clearing_house_state(ch)]
+        ch.change_time(+1)
+        for agent in agents:
+            for event in agent.setup(ch):
+                ch = event.run(ch)
+                events.append(event)
+                chs.append(self.clearing_house_state(ch))
+            ch = ch.change_time(+1)
+        start, end = ch.markets[0].amm.oracle.get_timestamp_range()
+        for x in range(start, end):
+            if x < ch.time:
+                continue
+            for agent in agents:
+                for event in agent.run(ch):
+                    ch = event.run(ch)
+                    events.append(event)
+                    chs.append(self.clearing_house_state(ch))
+            ch = ch.change_time(1)
+        for market_index in range(len(ch.markets)):
+            for user_index in ch.users:
+                event = ClosePositionEvent(user_index=user_index, timestamp=ch.time, market_index=market_index)
+                ch = event.run(ch)
+                events.append(event)
+                chs.append(self.clearing_house_state(ch))
+                ch = ch.change_time(1)
+
+        # idle subagents still give their null events
+        self.assertGreater(len([e for e in events if e._event_name == 'null']), 3 * (end - start))
+        self.assertEqual(history['events'], events)
+        self.assertEqual([self.clearing_house_state(c) for c in history['clearing_houses']], chs)
+
+    def test_run_trial_event_driven(self):
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 400), timestamps=np.arange(400))
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            run_trial(self.make_agents(), copy.deepcopy(self.clearing_house), tmp/'polled')
+            run_trial(self.make_agents(), copy.deepcopy(self.clearing_house), tmp/'driven', event_driven=True)
+
+            # same events + the same clearing house after every one of them (incl. the close out)
+            polled_events, driven_events = pd.read_csv(tmp/'polled'/'events.csv'), pd.read_csv(tmp/'driven'/'events.csv')
+            self.assertIn('settle_lp', set(polled_events['event_name']))
+            pd.testing.assert_frame_equal(polled_events, driven_events)
+            pd.testing.assert_frame_equal(pd.read_csv(tmp/'polled'/'chs.csv'), pd.read_csv(tmp/'driven'/'chs.csv'))
+
+class TestPopulations(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=2)
+
+    def agent_events(self, agents, start, end):
+        ch = self.clearing_house
+        ch.time = start
+        events = []
+        for agent in agents:
+            events += agent.setup(ch)
+        while ch.time < end:
+            for agent in agents:
+                events += agent.run(ch)
+            ch.time += 1
+        return events
+
+    def test_matches_multiple_agent(self):
+        rngs = spawn_rngs(7, 2)
+        traders = [OpenClose.random_init(40, 0, 0, short_bias=0.5, rng=rngs[0]) for _ in range(20)]
+        lps = [AddRemoveLiquidity.random_init(40, 1, 0, rng=rngs[1]) for _ in range(20)]
+
+        # (starting at t=5 -> some members open late)
+        multiple = self.agent_events([
+            MultipleAgent(iter(copy.deepcopy(traders)).__next__, len(traders)),
+            MultipleAgent(iter(copy.deepcopy(lps)).__next__, len(lps)),
+        ], 5, 50)
+        population = self.agent_events([
+            OpenClosePopulation.from_agents(traders),
+            LiquidityPopulation.from_agents(lps),
+        ], 5, 50)
+
+        self.assertGreater(len([e for e in multiple if e._event_name == 'close_position']), 0)
+        # (the MultipleAgent also returns a null event per idle subagent)
+        non_null = lambda events: [e for e in events if e._event_name != 'null']
+        self.assertEqual(non_null(multiple), non_null(population))
+
+    def test_random_init(self):
+        n = 1_000
+        population = OpenClosePopulation.random_init(n, 100, np.arange(n), 0, short_bias=0.5, rng=np.random.default_rng(0))
+        deposits = population.setup(self.clearing_house)
+        self.assertEqual([e.user_index for e in deposits], list(range(n)))
+
+        # event driven: only woken up when someone is due
+        ch = self.clearing_house
+        ch.time = 0
+        opens = []
+        while population.next_wakeup(ch.time) is not None:
+            ch.time = population.next_wakeup(ch.time)
+            opens += [e.user_index for e in population.run(ch) if e._event_name == 'open_position']
+            ch.time += 1
+        self.assertEqual(sorted(opens), list(range(n)))
+
+class TestRNGStreams(unittest.TestCase):
+
+    def make_population(self, rngs, user_indexs):
+        return [
+            OpenClose.random_init(100, user_index, 0, short_bias=0.5, rng=rngs[user_index]).__dict__
+            for user_index in user_indexs
+        ]
+
+    def test_regenerate_subset(self):
+        population = self.make_population(spawn_rngs(42, 8), range(8))
+
+        # build a subset (in another order) from freshly spawned streams
+        subset = self.make_population(spawn_rngs(42, 8), [5, 2])
+        self.assertEqual(subset, [population[5], population[2]])
+
+        # streams dont touch the global state
+        np.random.seed(0)
+        expected = np.random.randint(0, 100)
+        np.random.seed(0)
+        self.make_population(spawn_rngs(42, 8), range(8))
+        self.assertEqual(np.random.randint(0, 100), expected)
+
+    def test_oracle_streams(self):
+        prices, timestamps = rand_heterosk_oracle(90, n_steps=50, rng=spawn_rngs(1, 2)[1])
+        prices2, timestamps2 = rand_heterosk_oracle(90, n_steps=50, rng=spawn_rngs(1, 2)[1])
+        np.testing.assert_array_equal(prices, prices2)
+        np.testing.assert_array_equal(timestamps, timestamps2)
+
+    def test_build(self):
+        import simple
+
+        # same scenario whatever the global state is + the global state is left alone
+        np.random.seed(0)
+        ch, agents = simple.build(3)
+        expected = np.random.randint(0, 100)
+        np.random.seed(1)
+        ch2, agents2 = simple.build(3)
+        np.random.seed(0)
+        simple.build(4)
+        self.assertEqual(np.random.randint(0, 100), expected)
+
+        np.testing.assert_array_equal(ch.markets[0].amm.oracle.prices, ch2.markets[0].amm.oracle.prices)
+        flatten = lambda agents: [
+            sub.__dict__ for agent in agents for sub in getattr(agent, 'subagents', [agent])
+        ]
+        self.assertEqual(flatten(agents), flatten(agents2))
+
+class TestSweep(unittest.TestCase):
+    grid = dict(n_steps=[10], n_lps=[1], n_traders=[1], strategies=['', 'PrePeg'])
+
+    def test_expand_grid(self):
+        import sweep
+
+        configs = sweep.expand_grid(self.grid, [0, 1])
+        self.assertEqual(
+            [(c['strategies'], c['seed']) for c in configs],
+            [('', 0), ('', 1), ('PrePeg', 0), ('PrePeg', 1)]
+        )
+        for config in configs:
+            # the rest is the default config
+            self.assertEqual(config, sweep.DEFAULT_CONFIG | dict(n_steps=10, n_lps=1, n_traders=1, strategies=config['strategies'], seed=config['seed']))
+        self.assertEqual(len({sweep.config_hash(c) for c in configs}), len(configs))
+
+        with self.assertRaises(AssertionError):
+            sweep.expand_grid(dict(not_a_parameter=[1]), [0])
+
+    def test_resume(self):
+        import sweep
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp)/'results.csv'
+            df = sweep.run_sweep(self.grid, [0], path, workers=1)
+            self.assertEqual(len(df), 2)
+
+            # the configs read back from the csv hash to their config_hash
+            for row in df.to_dict('records'):
+                config = {k: row[k] for k in list(sweep.DEFAULT_CONFIG) + ['seed']}
+                self.assertEqual(sweep.config_hash(config), row['config_hash'])
+
+            # only the new seed runs
+            df = sweep.run_sweep(self.grid, [0, 1], path, workers=1)
+            self.assertEqual(len(df), 4)
+            self.assertEqual(df['config_hash'].nunique(), 4)
+
+            # a failing config gets an error row (the others are kept) and is retried on resume
+            bad = dict(n_lps=[0], n_traders=[-2])
+            bad_hash = sweep.config_hash(sweep.expand_grid(bad, [0])[0])
+            df = sweep.run_sweep(bad, [0], path, workers=1)
+            self.assertEqual(len(df), 5)
+            self.assertTrue(df['error'].iloc[:4].isna().all())
+            self.assertEqual(df['config_hash'].iloc[-1], bad_hash)
+            self.assertIn('OverflowError', df['error'].iloc[-1])
+            self.assertNotIn(bad_hash, sweep.completed_hashes(path))
+            self.assertEqual(len(sweep.run_sweep(bad, [0], path, workers=1)), 6)
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def test_workers(self):
+        import simple
+        from helpers import run_agents
+        from monte_carlo import run_monte_carlo, summarize
+
+        one = run_monte_carlo('simple', [0, 1], workers=1)
+        two = run_monte_carlo('simple', [0, 1], workers=2)
+
+        # a seed gives the same run whatever process it lands in (only the timing differs)
+        self.assertEqual(list(two['seed']), [0, 1])
+        pd.testing.assert_frame_equal(one.drop(columns='elapsed'), two.drop(columns='elapsed'))
+
+        # the row of a seed summarizes the same run done in process
+        ch, agents = simple.build(0)
+        ch.headless = True
+        ch, closed_ch, events, _ = run_agents(agents, ch, snapshot=False, progress=False)
+        summary = summarize('simple', 0, ch, closed_ch, len(events), 0)
+        self.assertGreater(summary['n_events'], 0)
+        self.assertIn('m0_closed_fee_pool', summary)
+        for name, value in summary.items():
+            if name != 'elapsed':
+                self.assertEqual(two[name][0], value, name)
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=0)
+        self.timestamps = np.arange(30)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 30), timestamps=self.timestamps)
+
+    def make_agents(self):
+        return [
+            OpenClose(start_time=t, duration=d, user_index=i, quote_amount=100 * QUOTE_PRECISION, direction=direction)
+            for i, (t, d, direction) in enumerate([(2, 5, 'long'), (4, 10, 'short'), (9, 3, 'long'), (15, -1, 'short')])
+        ]
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            full = SimpleDriftSim(str(tmp/'full'), copy.deepcopy(self.clearing_house), self.make_agents()).run()
+
+            checkpointer = Checkpointer(tmp/'checkpoint.pkl', every_events=3)
+            SimpleDriftSim(str(tmp/'a'), copy.deepcopy(self.clearing_house), self.make_agents()).run(checkpointer=checkpointer)
+
+            resumed_sim = SimpleDriftSim(str(tmp/'b'), copy.deepcopy(self.clearing_house), None)
+            resumed = resumed_sim.resume(tmp/'checkpoint.pkl')
+
+        self.assertEqual(
+            [e.serialize_to_row() for e in full['events']],
+            [e.serialize_to_row() for e in resumed['events']],
+        )
+        self.assertEqual(
+            full['clearing_houses'][-1].users[0].collateral,
+            resumed['clearing_houses'][-1].users[0].collateral,
+        )
+
+    def test_incremental_history(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                checkpointer = Checkpointer('checkpoint.pkl', every_events=3)
+            finally:
+                os.chdir(cwd)
+            full = SimpleDriftSim(str(tmp/'a'), copy.deepcopy(self.clearing_house), self.make_agents()).run(checkpointer=checkpointer)
+
+            # the checkpoint only pickles the live state -- every event is spooled once
+            with open(tmp/'checkpoint.pkl', 'rb') as f:
+                history = pickle.load(f)['history']
+            self.assertTrue(os.path.isabs(history['path']))
+            spooled = []
+            with open(history['path'], 'rb') as f:
+                while f.tell() < history['offset']:
+                    name, items = pickle.load(f)
+                    spooled += [name] * len(items)
+            self.assertGreater(checkpointer.last_events, 3)
+            self.assertEqual(spooled.count('events'), history['lengths']['events'])
+            self.assertEqual(spooled.count('clearing_houses'), history['lengths']['clearing_houses'])
+
+            resume = load_checkpoint(tmp/'checkpoint.pkl')
+            self.assertNotIn('events', resume['simulation_results'])
+            n_events = history['lengths']['events']
+            self.assertEqual(
+                [e.serialize_to_row() for e in resume['history']['events']],
+                [e.serialize_to_row() for e in full['events'][:n_events]],
+            )
+
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=1)
+
+    def test_policies(self):
+        ch = self.clearing_house
+        event = NullEvent(timestamp=0)
+        every_3 = EveryNEvents(3)
+        self.assertEqual([every_3.sample(event, ch) for _ in range(7)], [True, False, False, True, False, False, True])
+
+        every_2s = EveryTSeconds(2)
+        samples = []
+        for _ in range(5):
+            samples.append(every_2s.sample(event, ch))
+            ch = ch.change_time(1)
+        self.assertEqual(samples, [True, False, True, False, True])
+
+        on_peg = OnChange(['markets.0.amm.peg_multiplier'])
+        self.assertTrue(on_peg.sample(event, ch))
+        self.assertFalse(on_peg.sample(event, ch))
+        ch.markets[0].amm.peg_multiplier += 1
+        self.assertTrue(on_peg.sample(event, ch))
+
+    def test_margin_revert(self):
+        ch = self.clearing_house
+        around = AroundEvents(after=1)
+        event = OpenPositionEvent(timestamp=0, user_index=0, direction='long', quote_amount=50 * self.default_collateral, market_index=0)
+        self.assertFalse(around.sample(event, ch))
+
+        ch = ch.open_position(PositionDirection.LONG, 0, 50 * self.default_collateral, 0) # 50x -- reverts
+        self.assertEqual(ch.n_margin_reverts, 1)
+        self.assertTrue(around.sample(event, ch))
+        self.assertTrue(around.sample(event, ch)) # the one after
+        self.assertFalse(around.sample(event, ch))
+
+        # any of the policies -- every policy still sees every event (they are stateful)
+        every_3 = EveryNEvents(3)
+        any_of = AnyOf(every_3, AroundEvents(['remove_liquidity'], margin_reverts=False))
+        remove = removeLiquidityEvent(timestamp=0)
+        self.assertEqual([any_of.sample(e, ch) for e in [event, event, remove, event, event]], [True, False, True, True, False])
+        self.assertEqual(every_3.count, 5)
+
+    def test_drift_sim_sampling(self):
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 20), timestamps=np.arange(20))
+        make_agents = lambda: [OpenClose(start_time=2, duration=5, user_index=1, quote_amount=100 * QUOTE_PRECISION, direction='long')]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            sim = SimpleDriftSim(str(tmp/'sampled'), copy.deepcopy(self.clearing_house), make_agents())
+            results = sim.run(sampling=EveryNEvents(4))
+            sim.to_df()
+            in_memory = pd.read_csv(tmp/'sampled'/'simulation_state.csv')
+
+            SimpleDriftSim(str(tmp/'streamed'), copy.deepcopy(self.clearing_house), make_agents()).run(stream=True, sampling=EveryNEvents(4))
+            streamed = pd.read_csv(tmp/'streamed'/'simulation_state.csv')
+            SimpleDriftSim(str(tmp/'columnar'), copy.deepcopy(self.clearing_house), make_agents()).run(stream='columnar', sampling=EveryNEvents(4))
+            columnar = load_columns(tmp/'columnar'/'simulation_state')
+
+            # no policy = the baseline columns
+            SimpleDriftSim(str(tmp/'all'), copy.deepcopy(self.clearing_house), make_agents()).run(stream=True)
+            unsampled = pd.read_csv(tmp/'all'/'simulation_state.csv')
+            self.assertNotIn('event_index', unsampled.columns)
+
+        n_events = len(results['events'])
+        self.assertEqual(len(results['clearing_houses']), (n_events + 3) // 4)
+
+        # each snapshot knows which event its from
+        event_indexs = list(range(0, n_events, 4))
+        self.assertEqual([ch.event_index for ch in results['clearing_houses']], event_indexs)
+        self.assertEqual(list(in_memory['event_index']), event_indexs)
+        self.assertEqual(list(streamed['event_index']), event_indexs)
+        self.assertEqual(list(columnar['event_index']), event_indexs)
+        self.assertEqual(list(in_memory['timestamp']), [results['events'][i].timestamp for i in event_indexs])
+
+class TestObservers(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=0)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .7, 30), timestamps=np.arange(30))
+
+    def test_matches_history(self):
+        agents = [
+            OpenClose(start_time=t, duration=d, user_index=i, quote_amount=100 * QUOTE_PRECISION, direction=direction)
+            for i, (t, d, direction) in enumerate([(2, 5, 'long'), (4, 10, 'short'), (9, 3, 'long')])
+        ]
+        n_events = Reducer('n_events', lambda n, ch: n + 1, init=0)
+        observers = default_observers(self.clearing_house) + [n_events]
+        with tempfile.TemporaryDirectory() as tmp:
+            sim = SimpleDriftSim(str(pathlib.Path(tmp)/'observed'), copy.deepcopy(self.clearing_house), agents)
+            history = sim.run(observers=observers)
+        reductions = results(observers)
+
+        # the same aggregates from the full history
+        fee_pool = np.array([ch.markets[0].amm.total_fee_minus_distributions / QUOTE_PRECISION for ch in history['clearing_houses']])
+        drawdown = np.max(np.maximum.accumulate(fee_pool) - fee_pool)
+        open_interest = [
+            (ch.markets[0].amm.base_asset_amount_long - ch.markets[0].amm.base_asset_amount_short) / AMM_RESERVE_PRECISION
+            for ch in history['clearing_houses']
+        ]
+        self.assertEqual(reductions['n_events'], len(history['events']))
+        self.assertAlmostEqual(reductions['m0_max_fee_pool_drawdown'], drawdown)
+        self.assertAlmostEqual(reductions['m0_peak_open_interest'], max(open_interest))
+        self.assertGreater(reductions['m0_peak_open_interest'], 0)
+        self.assertIn('m0_funding_paid', reductions)
+        self.assertTrue(np.isfinite(reductions['min_margin_ratio']))
+
+    def test_funding_paid(self):
+        # long enough to cross a few funding updates (every 60s)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .7, 200), timestamps=np.arange(200))
+        agents = [
+            OpenClose(start_time=t, duration=d, user_index=i, quote_amount=amount * QUOTE_PRECISION, direction=direction)
+            for i, (t, d, amount, direction) in enumerate([(2, 150, 100, 'long'), (30, 60, 50, 'short'), (70, -1, 80, 'long')])
+        ]
+        observers = [FundingPaid()]
+        with tempfile.TemporaryDirectory() as tmp:
+            sim = SimpleDriftSim(str(pathlib.Path(tmp)/'funding'), copy.deepcopy(self.clearing_house), agents)
+            history = sim.run(observers=observers)
+        reductions = results(observers)
+
+        # (not headless) every position tracks the funding it was paid -- everyone is closed out at the end
+        ch = history['clearing_houses'][-1]
+        self.assertGreater(ch.markets[0].amm.last_funding_rate_ts, 60)
+        paid = -sum([user.positions[0].market_funding_payments for user in ch.users.values()]) / QUOTE_PRECISION
+        self.assertNotEqual(paid, 0)
+        np.testing.assert_allclose(reductions['m0_funding_paid'], paid, rtol=1e-9)
+
+class TestMemoryProfiler(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=0)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .7, 30), timestamps=np.arange(30))
+
+    def test_run_info(self):
+        agents = [
+            OpenClose(start_time=t, duration=d, user_index=i, quote_amount=100 * QUOTE_PRECISION, direction=direction)
+            for i, (t, d, direction) in enumerate([(2, 5, 'long'), (4, 10, 'short'), (9, 3, 'long')])
+        ]
+        profiler = MemoryProfiler(every_events=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            sim = SimpleDriftSim(str(pathlib.Path(tmp)/'profiled'), copy.deepcopy(self.clearing_house), agents)
+            history = sim.run(memory_profiler=profiler)
+            sim.to_df()
+            with open(pathlib.Path(tmp)/'profiled'/'run_info.json') as f:
+                run_info = json.load(f)
+
+        self.assertFalse(profiler.running)
+        self.assertIn('git_commit', run_info) # the run metadata is kept
+        samples = run_info['memory']['samples']
+        self.assertEqual([s['label'] for s in samples[-2:]], ['run', 'serialization'])
+        self.assertGreater(len(samples), 2)
+
+        last = samples[-1]
+        self.assertEqual(last['n_events'], len(history['events']))
+        self.assertEqual(last['n_snapshots'], len(history['clearing_houses']))
+        self.assertGreater(last['snapshots'], 0)
+        self.assertGreater(last['events'], 0)
+        self.assertGreater(last['oracle_arrays'], 0)
+        summary = run_info['memory']['summary']
+        self.assertEqual(summary['n_samples'], len(samples))
+        self.assertGreaterEqual(summary['traced_peak'], last['traced'])
+
+class TestBatched(unittest.TestCase):
+
+    def make_market(self, prices):
+        amm = SimulationAMM(
+            oracle=Oracle(prices=prices, timestamps=np.arange(len(prices))),
+            base_asset_reserve=10_000 * AMM_RESERVE_PRECISION,
+            quote_asset_reserve=10_000 * AMM_RESERVE_PRECISION,
+            peg_multiplier=1 * PEG_PRECISION,
+            funding_period=60
+        )
+        return SimulationMarket(amm=amm, market_index=0)
+
+    def make_agents(self):
+        return [
+            Arb(intensity=.5, market_index=0, user_index=0, lookahead=5),
+            Noise(intensity=1, market_index=0, user_index=1, size=50),
+            # 50x leverage -> margin reverts
+            OpenClose(start_time=10, duration=200, quote_amount=500 * QUOTE_PRECISION, direction='short', user_index=2, deposit_amount=10 * QUOTE_PRECISION),
+            OpenClose(start_time=50, duration=150, quote_amount=2_000 * QUOTE_PRECISION, direction='long', user_index=3),
+        ]
+
+    def test_matches_clearing_house(self):
+        rng = np.random.default_rng(0)
+        prices = 1 + np.cumsum(rng.normal(0, .002, (4, 400)), axis=1)
+        fee_structure = FeeStructure(numerator=1, denominator=100)
+
+        bch = run_batched(self.make_agents(), self.make_market(prices[0]), fee_structure, prices)
+        df = bch.to_df()
+
+        for k in range(len(prices)):
+            # run_batched's loop on one ClearingHouse per path
+            ch = ClearingHouse([self.make_market(prices[k])], fee_structure, headless=True)
+            agents = self.make_agents()
+            for agent in agents:
+                for event in agent.setup(ch):
+                    ch = event.run(ch)
+                ch = ch.change_time(1)
+            while ch.time < bch.time:
+                for agent in agents:
+                    for event in agent.run(ch):
+                        ch = event.run(ch)
+                ch = ch.change_time(1)
+
+            amm = ch.markets[0].amm
+            for name in ['base_asset_reserve', 'quote_asset_reserve', 'total_fee_minus_distributions', 'cumulative_funding_rate_long', 'last_mark_price_twap', 'last_oracle_price_twap', 'base_asset_amount_with_amm']:
+                np.testing.assert_allclose(df[f'm0_{name}'][k], getattr(amm, name), rtol=1e-6, atol=1e-6, err_msg=name)
+            self.assertEqual(df['n_margin_reverts'][k], ch.n_margin_reverts)
+            for user_index, user in ch.users.items():
+                name = ch.usernames[user_index]
+                np.testing.assert_allclose(df[f'{name}_collateral'][k], user.collateral, rtol=1e-6, err_msg=name)
+                np.testing.assert_allclose(df[f'{name}_base_asset_amount'][k], user.positions[0].base_asset_amount, rtol=1e-6, atol=1e-6, err_msg=name)
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=0)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .7, 30), timestamps=np.arange(30))
+
+    def test_replay_matches_run(self):
+        agents = [
+            OpenClose(start_time=t, duration=d, user_index=i, quote_amount=100 * QUOTE_PRECISION, direction=direction)
+            for i, (t, d, direction) in enumerate([(2, 5, 'long'), (4, 10, 'short'), (9, 3, 'long')])
+        ]
+        ch = copy.deepcopy(self.clearing_house)
+        events = []
+        for agent in agents:
+            for event in agent.setup(ch):
+                ch = event.run(ch)
+                events.append(event)
+        while ch.time < 30:
+            for agent in agents:
+                for event in agent.run(ch):
+                    if event._event_name != 'null':
+                        ch = event.run(ch)
+                        events.append(event)
+            ch = ch.change_time(1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp)/'events.csv'
+            pd.DataFrame([e.serialize_to_row() for e in events]).to_csv(path, index=False)
+            replayed = load_events(path)
+
+        self.assertEqual(replayed, events)
+        result = replay(replayed, copy.deepcopy(self.clearing_house), snapshot=True)
+        self.assertEqual(result['n_events'], len(events))
+        self.assertEqual(len(result['clearing_houses']), len(events))
+        for user_index, user in ch.users.items():
+            self.assertEqual(result['ch'].users[user_index].collateral, user.collateral)
+        self.assertEqual(result['ch'].markets[0].amm.total_fee_minus_distributions, ch.markets[0].amm.total_fee_minus_distributions)
+
+class TestImports(unittest.TestCase):
+
+    def test_sim_core_without_sdk(self):
+        # the on-chain adapters (driftpy sdk / anchorpy) only load for backtests
+        import subprocess
+        code = (
+            "import sys; sys.path.insert(0, './driftpy/src/'); "
+            "import sim.events, sim.sim, sim.helpers, sim.replay; "
+            "print(sorted(m for m in ['anchorpy', 'solana.rpc', 'driftpy.clearing_house', 'driftpy.accounts', 'backtest.adapters'] if m in sys.modules))"
+        )
+        output = subprocess.check_output([sys.executable, '-c', code], text=True)
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+class TestSerializeEvents(unittest.TestCase):
+
+    def test_same_csv(self):
+        events = [
+            DepositCollateralEvent(timestamp=0, user_index=0, deposit_amount=100 * QUOTE_PRECISION, username='o"c'),
+            NullEvent(timestamp=1),
+            OpenPositionEvent(timestamp=2, user_index=0, direction='long', quote_amount=50.5 * QUOTE_PRECISION, market_index=0),
+            oraclePriceEvent(timestamp=2.5, market_index=0, price=float('nan')),
+            removeLiquidityEvent(timestamp=3, market_index=0, user_index=1),
+            ClosePositionEvent(timestamp=4, user_index=0, market_index=0),
+        ]
+        # extra attributes fall back to serialize_to_row
+        events[-1].extra = {'b': 1, 'a': (1, 2)}
+
+        for skip_null in [True, False]:
+            rows = [e.serialize_to_row() for e in events if not skip_null or e._event_name != 'null']
+            self.assertEqual(
+                pd.DataFrame(serialize_events(events, skip_null=skip_null)).to_csv(index=False),
+                pd.DataFrame(rows).to_csv(index=False),
+            )
+        self.assertEqual(pd.DataFrame(serialize_events([])).to_csv(index=False), pd.DataFrame([]).to_csv(index=False))
+
+class TestEventLog(unittest.TestCase):
+
+    def test_roundtrip(self):
+        events = [
+            DepositCollateralEvent(timestamp=0, user_index=0, deposit_amount=100 * QUOTE_PRECISION, username='openclose'),
+            DepositCollateralEvent(timestamp=1, user_index=1, deposit_amount=10_000_000 * QUOTE_PRECISION, username='LP'),
+            addLiquidityEvent(timestamp=2, market_index=0, user_index=1, token_amount=1e6 * QUOTE_PRECISION),
+            OpenPositionEvent(timestamp=3, user_index=0, direction='long', quote_amount=100 * QUOTE_PRECISION, market_index=0),
+            oraclePriceEvent(timestamp=3, market_index=1, price=1.5),
+            OpenPositionEvent(timestamp=5, user_index=0, direction='short', quote_amount=50.5 * QUOTE_PRECISION, market_index=1),
+            NullEvent(timestamp=6),
+            ClosePositionEvent(timestamp=7, user_index=0, market_index=0),
+        ]
+        non_null = [e for e in events if e._event_name != 'null']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp)
+            write_event_log(events, path/'event_log')
+            log = load_event_log(path/'event_log')
+
+            self.assertEqual(len(log), len(non_null))
+            self.assertEqual(list(log), non_null)
+            self.assertEqual(list(log.for_user(0)), [0, 3, 5, 6])
+            self.assertEqual(list(log.for_market(1)), [4, 5])
+            self.assertEqual(list(log.between(3, 6)), [3, 4, 5])
+            self.assertEqual(list(log.of_type('open_position')['direction']), ['long', 'short'])
+
+            # same csv as serialize_to_row
+            pd.DataFrame([e.serialize_to_row() for e in non_null]).to_csv(path/'events.csv', index=False)
+            event_log_to_csv(path/'event_log', path/'events2.csv')
+            self.assertEqual((path/'events.csv').read_text(), (path/'events2.csv').read_text())
+
+            csv_to_event_log(path/'events.csv', path/'event_log2')
+            self.assertEqual(list(load_event_log(path/'event_log2')), non_null)
+
+    def test_mixed_numbers(self):
+        # ints + floats in one field: big ints round trip exactly
+        events = [
+            OpenPositionEvent(timestamp=0, user_index=0, direction='long', quote_amount=2**62 + 1, market_index=0),
+            OpenPositionEvent(timestamp=1, user_index=0, direction='long', quote_amount=0.5, market_index=0),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            write_event_log(events, pathlib.Path(tmp)/'event_log')
+            log = load_event_log(pathlib.Path(tmp)/'event_log')
+            self.assertEqual([e.quote_amount for e in log], [2**62 + 1, 0.5])
+            self.assertIsInstance(log.event(0).quote_amount, int)
+            self.assertEqual(list(log.of_type('open_position')['quote_amount']), [float(2**62 + 1), 0.5])
+
+    def test_cached_event_log(self):
+        rows = lambda amounts: pd.DataFrame([
+            OpenPositionEvent(timestamp=t, user_index=0, direction='long', quote_amount=amount, market_index=0).serialize_to_row()
+            for t, amount in enumerate(amounts)
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp)
+            rows([1, 2]).to_csv(path/'events.csv', index=False)
+            self.assertEqual(len(cached_event_log(path/'events.csv', path/'event_log')), 2)
+            mtime = (path/'event_log'/'schema.json').stat().st_mtime_ns
+            self.assertEqual(len(cached_event_log(path/'events.csv', path/'event_log')), 2)
+            self.assertEqual((path/'event_log'/'schema.json').stat().st_mtime_ns, mtime)
+
+            # the csv changed -> rebuilt (and no temp dirs left behind)
+            rows([1, 2, 3]).to_csv(path/'events.csv', index=False)
+            log = cached_event_log(path/'events.csv', path/'event_log')
+            self.assertEqual([e.quote_amount for e in log], [1, 2, 3])
+            self.assertEqual(sorted(p.name for p in path.iterdir()), ['event_log', 'events.csv'])
+
+class TestStreamingWriter(unittest.TestCase):
+
+    def test_matches_dataframe(self):
+        # columns appearing late / missing / changing type across chunks
+        rows = [
+            dict(a=1, b=0.5), dict(a=2, c='x'), dict(a=3, b=None, d=True),
+            dict(a=4, c=5), dict(a=2**63, b=1), dict(d=False, e=np.nan),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            writer = StreamingCSVWriter(tmp/'streamed.csv', chunk_size=2)
+            for row in rows:
+                writer.append(row)
+            writer.close()
+            pd.DataFrame(rows).to_csv(tmp/'full.csv', index=False)
+
+            self.assertEqual((tmp/'streamed.csv').read_text(), (tmp/'full.csv').read_text())
+            self.assertFalse(os.path.exists(writer.spool_path))
+
+    def test_drift_sim_stream(self):
+        default_set_up(self, n_users=0)
+        self.market.amm.oracle = Oracle(prices=np.linspace(.5, .6, 20), timestamps=np.arange(20))
+        make_agents = lambda: [
+            OpenClose(start_time=2, duration=5, user_index=0, quote_amount=100 * QUOTE_PRECISION, direction='long'), 
+            OpenClose(start_time=4, duration=8, user_index=1, quote_amount=100 * QUOTE_PRECISION, direction='short'), 
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            full = SimpleDriftSim(str(tmp/'full'), copy.deepcopy(self.clearing_house), make_agents())
+            full.run()
+            full.to_df()
+
+            streamed = SimpleDriftSim(str(tmp/'streamed'), copy.deepcopy(self.clearing_house), make_agents())
+            results = streamed.run(stream=True)
+            streamed.to_df()
+
+            self.assertEqual(len(results['clearing_houses']), 0)
+            self.assertEqual(
+                (tmp/'full'/'simulation_state.csv').read_text(), 
+                (tmp/'streamed'/'simulation_state.csv').read_text(),
+            )
+
+class TestSnapshotLayout(unittest.TestCase):
+
+    def setUp(self):
+        default_set_up(self, n_users=2)
+
+    def test_matches_to_json(self):
+        ch = self.clearing_house
+        table = SnapshotTable()
+        rows = []
+
+        def snapshot():
+            table.append_ch(ch)
+            rows.append(ch.to_json())
+
+        snapshot()
+        ch = ch.open_position(PositionDirection.LONG, 0, 100 * QUOTE_PRECISION, 0).change_time(1)
+        snapshot()
+        ch = ch.open_position(PositionDirection.SHORT, 1, 50 * QUOTE_PRECISION, 0).change_time(1)
+        snapshot()
+        ch = ch.close_position(0, 0).change_time(1)
+        snapshot()
+
+        # same values as to_json, missing columns (closed positions) are NaN
+        layout = table.layout
+        for i, row in enumerate(rows):
+            values = table.values[i]
+            for column in layout.columns:
+                if column in row and not pd.isna(row[column]):
+                    self.assertEqual(values[layout.index[column]], row[column])
+                else:
+                    self.assertTrue(np.isnan(values[layout.index[column]]))
+
+        # stable schema: every row has every column
+        self.assertEqual(set(layout.to_json(ch).keys()), set(layout.columns))
+        self.assertIn('u0_m0_base_asset_amount', layout.columns)
+        self.assertNotIn('u0_m0_base_asset_amount', rows[-1])
+        self.assertEqual(list(table.to_df()['timestamp']), [0, 1, 2, 3])
+
+    def test_writers_consume_block(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            writers = dict(
+                csv=StreamingCSVWriter(tmp/'chs.csv', chunk_size=3),
+                fixed_csv=StreamingCSVWriter(tmp/'fixed.csv', chunk_size=3, layout=SnapshotLayout()),
+                columnar=ColumnarWriter(tmp/'chs', chunk_size=3),
+                fixed_columnar=ColumnarWriter(tmp/'fixed', chunk_size=3, layout=SnapshotLayout()),
+            )
+            ch = self.clearing_house
+            def snapshot(i):
+                for writer in writers.values():
+                    writer.append_ch(ch, i)
+
+            snapshot(0)
+            ch = ch.open_position(PositionDirection.LONG, 0, 100 * QUOTE_PRECISION, 0).change_time(1)
+            snapshot(1)
+            ch = ch.open_position(PositionDirection.SHORT, 1, 50 * QUOTE_PRECISION, 0).change_time(1)
+            snapshot(2)
+            ch = ch.close_position(0, 0).change_time(1)
+            snapshot(3)
+
+            # rows go into the preallocated block, not the dict buffer
+            self.assertEqual(len(writers['fixed_csv'].buffer), 0)
+            self.assertEqual(len(writers['fixed_csv'].table), 1)
+            for writer in writers.values():
+                writer.close()
+
+            # same values, the fixed schema only adds (NaN) columns
+            df, fixed = pd.read_csv(tmp/'chs.csv'), pd.read_csv(tmp/'fixed.csv')
+            self.assertEqual(fixed.columns[0], 'event_index')
+            pd.testing.assert_frame_equal(df, fixed[df.columns])
+            df, fixed = load_columns(tmp/'chs').to_df(), load_columns(tmp/'fixed').to_df()
+            pd.testing.assert_frame_equal(df, fixed[df.columns])
+
+class TestColumnar(unittest.TestCase):
+
+    def test_roundtrip(self):
+        # reserves are stringified by to_json, user columns come and go
+        rows = [
+            dict(m0_base_asset_reserve=f'{3.6e18:.0f}', m0_mark_price=1.5, timestamp=0), 
+            dict(m0_base_asset_reserve='12', m0_mark_price=1.25, u0_m0_upnl=-3.5, timestamp=1), 
+            dict(m0_base_asset_reserve='13', m0_mark_price=1.0, name='x', timestamp=2), 
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            write_columns(rows, tmp/'chs', chunk_size=2)
+            history = load_columns(tmp/'chs')
+
+            self.assertEqual(len(history), 3)
+            self.assertEqual(history.columns, ['m0_base_asset_reserve', 'm0_mark_price', 'timestamp', 'u0_m0_upnl', 'name'])
+            self.assertEqual(history['m0_base_asset_reserve'].dtype, np.int64)
+            self.assertEqual(int(history['m0_base_asset_reserve'][0]), int(f'{3.6e18:.0f}'))
+            self.assertEqual(list(history['timestamp']), [0, 1, 2])
+            self.assertTrue(np.isnan(history['u0_m0_upnl'][0]))
+            self.assertEqual(list(history['name']), ['', '', 'x'])
+
+            # same thing from the csv
+            pd.DataFrame(rows).to_csv(tmp/'chs.csv', index=False)
+            csv_to_columns(tmp/'chs.csv', tmp/'chs2')
+            df, df2 = history.to_df(), load_columns(tmp/'chs2').to_df()
+            pd.testing.assert_frame_equal(df, df2)
+
+class TestResultCache(unittest.TestCase):
+
+    def write_artifacts(self, path, size):
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ARTIFACTS:
+            (path/name).write_text('x' * size)
+
+    def test_store_restore_evict(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            cache = ResultCache(tmp/'cache', max_bytes=2 * 3 * 100)
+
+            for i in range(3):
+                self.write_artifacts(tmp/f'run{i}', 100)
+                cache.store(f'key{i}', tmp/f'run{i}')
+                os.utime(cache.entry(f'key{i}'), (1000 + i, 1000 + i))
+
+            # bounded: the least recently used entry is gone
+            self.assertFalse(cache.restore('key0', tmp/'out'))
+            self.assertTrue(cache.restore('key2', tmp/'out'))
+            self.assertEqual((tmp/'out'/'chs.csv').read_text(), 'x' * 100)
+            # evicted entries are moved aside and then deleted (nothing left over)
+            self.assertEqual([e.name for e in (tmp/'cache').iterdir() if e.name.startswith('.')], [])
+
+    def test_store_existing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            cache = ResultCache(tmp/'cache')
+            self.write_artifacts(tmp/'run', 100)
+            cache.store('key', tmp/'run')
+
+            # same key + artifacts: the existing entry is kept
+            (tmp/'run'/'chs.csv').write_text('y')
+            cache.store('key', tmp/'run')
+            self.assertEqual((cache.entry('key')/'chs.csv').read_text(), 'x' * 100)
+
+            # more artifacts: replaced
+            (tmp/'run'/'event_log').mkdir()
+            cache.store('key', tmp/'run', ARTIFACTS + ['event_log'])
+            self.assertTrue(cache.restore('key', tmp/'out', ARTIFACTS + ['event_log']))
+            self.assertEqual((tmp/'out'/'chs.csv').read_text(), 'y')
+            self.assertEqual([e.name for e in (tmp/'cache').iterdir()], ['key'])
+
+    def test_canonical(self):
+        agent = OpenClose(start_time=1, duration=2, user_index=0)
+        self.assertEqual(canonical(agent), canonical(copy.deepcopy(agent)))
+        agent.duration = 3
+        self.assertNotEqual(hash_json(canonical(agent)), hash_json(canonical(OpenClose(start_time=1, duration=2, user_index=0))))
+        self.assertEqual(canonical(np.arange(3)), canonical(np.arange(3)))
+
 if __name__ == '__main__':
     unittest.main()
 